@@ -1,29 +1,24 @@
 import os
+import sys
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
-import psycopg2
-from dotenv import load_dotenv
 
-# Load credentials from .env
-load_dotenv()
+# Make the shared 'twin_lab' package (in the repository root) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from twin_lab.config import config
+from twin_lab.db import get_pool
+
+# Load credentials from the .env next to this script
+config.load(__file__)
 
 # --- TERMINAL INSTRUCTION ---
 print("\n🚀 IoT Bridge is active. Listening for data...")
 print("👉 Press Ctrl+C in this terminal to stop the Bridge.\n")
 
-# Database Connection Logic
-def get_db_connection():
-    return psycopg2.connect(
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASS"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT")
-    )
-
 # MQTT Broker Settings
-MQTT_BROKER = "broker.hivemq.com"
-MQTT_TOPIC = "edu/iot/temp"
+MQTT_BROKER = config.mqtt_broker
+MQTT_PORT = config.mqtt_port
+MQTT_TOPIC = config.get("MQTT_TOPIC", "edu/iot/temp")
 
 def on_message(client, userdata, msg):
     try:
@@ -31,21 +26,19 @@ def on_message(client, userdata, msg):
         temp_value = float(msg.payload.decode())
         print(f"📥 Telemetry Received: {temp_value}°C")
         
-        # 2. Connect and Insert into the professional Schema
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
+        # 2. Borrow a pooled connection and Insert into the professional Schema
         # aud_insert_ts is handled automatically by the DB Default
         query = """
             INSERT INTO edu_iot_digital_twin_lab.sensor_data (temperature, unit) 
             VALUES (%s, 'C')
         """
         
-        cur.execute(query, (temp_value,))
-        conn.commit()
+        # Industry Standard: Reuse pooled connections instead of reconnecting for every message.
+        # The 'with' block commits on success and hands the connection back to the pool
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (temp_value,))
         
-        cur.close()
-        conn.close()
         print("✅ Record successfully committed to PostgreSQL.")
         
     except Exception as e:
@@ -55,7 +48,7 @@ def on_message(client, userdata, msg):
 client = mqtt.Client(CallbackAPIVersion.VERSION2)
 client.on_message = on_message
 
-client.connect(MQTT_BROKER, 1883, 60)
+client.connect(MQTT_BROKER, MQTT_PORT, 60)
 client.subscribe(MQTT_TOPIC)
 
 # Start the continuous listening loop
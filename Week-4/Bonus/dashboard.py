@@ -1,40 +1,40 @@
 import os
-import pandas as pd
+import sys
 import plotly.express as px
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
 
-# Load Environment Variables (Database Credentials)
-load_dotenv()
+# Make the shared 'twin_lab' package (in the repository root) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from twin_lab.config import config
+from twin_lab.db import get_engine
+from twin_lab.downsample import TIME_RANGES, fetch_series
+
+# Load Environment Variables (Database Credentials) from the .env next to this script
+config.load(__file__)
+
+# --- CHART SETTINGS ---
+# Pick the window on the command line (python dashboard.py week) or with DASHBOARD_RANGE in .env
+TIME_RANGE = sys.argv[1] if len(sys.argv) > 1 else config.get("DASHBOARD_RANGE", "day")
+MAX_POINTS = 1000  # However long the range, the chart never receives more points than this
 
 # --- TERMINAL INSTRUCTION ---
 print("\n📊 Launching Visual Intelligence Dashboard...")
 print("👉 Note: This will open a new tab in your default web browser.\n")
 
-def get_db_engine():
-    """Creates a SQLAlchemy engine for secure, modern database access."""
-    db_url = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-    return create_engine(db_url)
-
 def create_dashboard():
     """Queries the database and generates an interactive Plotly trend chart."""
     try:
         # 1. Establish Connection & Fetch Data
-        engine = get_db_engine()
+        # The shared, pooled SQLAlchemy engine for secure, modern database access
+        engine = get_engine()
         
         # We query the sensor_data table (Week 4 Standard Schema)
-        query = """
-            SELECT temperature, aud_insert_ts 
-            FROM edu_iot_digital_twin_lab.sensor_data 
-            ORDER BY aud_insert_ts DESC 
-            LIMIT 100;
-        """
-        
-        # Pandas uses the engine to "slurp" the data into a DataFrame
-        df = pd.read_sql_query(query, engine)
+        # PostgreSQL averages the range into time buckets and LTTB keeps the points that
+        # preserve peaks and dips, so a month of readings draws as fast as 100 rows did
+        df = fetch_series(TIME_RANGE, table="sensor_data", max_points=MAX_POINTS, engine=engine)
+        df = df.rename(columns={"temp": "temperature"})
 
         if df.empty:
-            print("📭 No records found. Move the Wokwi slider to generate data first!")
+            print(f"📭 No records found in the last {TIME_RANGE}. Move the Wokwi slider, or try a longer range (python dashboard.py month)!")
             return
 
         # 2. Construct the Plotly Line Chart
@@ -43,9 +43,9 @@ def create_dashboard():
             df, 
             x='aud_insert_ts', 
             y='temperature', 
-            title='🛰️ IoT Digital Twin: Real-Time Temperature Telemetry',
+            title=f'🛰️ IoT Digital Twin: Temperature Telemetry (last {TIME_RANGE})',
             labels={'aud_insert_ts': 'Timestamp', 'temperature': 'Temperature (°C)'},
-            markers=True,
+            markers=len(df) <= 200,  # Markers help on a short trace and clutter a long one
             template='plotly_dark' 
         )
 
@@ -68,11 +68,14 @@ def create_dashboard():
         )
 
         # 5. Execute Visualization
-        print("✅ Data retrieved successfully. Rendering chart...")
+        print(f"✅ {len(df)} points retrieved for the last {TIME_RANGE}. Rendering chart...")
         fig.show()
 
     except Exception as e:
         print(f"❌ Visualization Error: {e}")
 
 if __name__ == "__main__":
+    if TIME_RANGE not in TIME_RANGES:
+        print(f"❌ Unknown time range '{TIME_RANGE}'. Choose one of: {', '.join(TIME_RANGES)}")
+        sys.exit(1)
     create_dashboard()
\ No newline at end of file
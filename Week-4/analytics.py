@@ -1,101 +1,219 @@
 import os
-import smtplib
+import sys
+import threading
 import time
-from email.message import EmailMessage
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text # <--- Modernized connection engine
 
-# Load credentials from .env
-load_dotenv()
+# Make the shared 'twin_lab' package (in the repository root) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from twin_lab.archive import has_cold_data, window_stats as archive_window_stats
+from twin_lab.config import config
+from twin_lab.db import get_engine, get_pool
+from twin_lab.rollups import window_stats_sql
+from twin_lab.shadow import fetch_shadow
+from twin_lab.snapshots import fleet_state_at
+from twin_lab.watchman import Watchman
+
+# Load credentials from the .env next to this script
+config.load(__file__)
 
 # --- CONFIGURATION ---
 # Industry Standard: Set thresholds as constants for easy tuning
 THRESHOLD_TEMP = 30.0  # Alert threshold (matches our Week 6 Lab)
+REPORT_HOURS = 24      # Size of the "Strategic Report" window
+
+# "rollups" reads the per-minute summary tables kept by bridge_v3; "raw" rescans every JSONB row
+ANALYTICS_SOURCE = config.get("ANALYTICS_SOURCE", "rollups")
 
-def get_db_engine():
-    """Creates a SQLAlchemy engine for 2026-compliant database interaction."""
-    db_url = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-    return create_engine(db_url)
+# Watchman mode (python analytics.py --watch): seed once, then follow the MQTT stream
+MQTT_BROKER = config.mqtt_broker
+MQTT_PORT = config.mqtt_port
+WATCH_TOPIC = config.get("WATCH_TOPIC", "edu/iot/temp/#")  # '#' also matches the Week 5 topic itself
+WATCH_INTERVAL = config.get_float("WATCH_INTERVAL", 60)   # Seconds between automatic reports
 
 def send_email_alert(temp):
     """Dispatches a critical alert via Gmail SMTP."""
+    # Imported on the first alert: a healthy run (or a cron job) never pays for loading them
+    import smtplib
+    from email.message import EmailMessage
+
     msg = EmailMessage()
     msg.set_content(f"🚨 ALERT: Your IoT Digital Twin has detected a high temperature of {temp}°C!")
     msg['Subject'] = f"CRITICAL HEAT ALERT: {temp}°C"
-    msg['From'] = os.getenv("EMAIL_SENDER")
-    msg['To'] = os.getenv("EMAIL_RECEIVER")
+    msg['From'] = config.get("EMAIL_SENDER")
+    msg['To'] = config.get("EMAIL_RECEIVER")
 
     try:
         # Using SSL for secure transport on Port 465
         with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-            smtp.login(os.getenv("EMAIL_SENDER"), os.getenv("EMAIL_PASSWORD"))
+            smtp.login(config.get("EMAIL_SENDER"), config.get("EMAIL_PASSWORD"))
             smtp.send_message(msg)
         print("📧 Email alert sent successfully!")
     except Exception as e:
         print(f"❌ Failed to send email: {e}")
 
+def fetch_window_stats(conn):
+    """Returns (avg, max, min, count) for the report window, preferring the rollup tables."""
+    from sqlalchemy import text
+    from sqlalchemy.exc import ProgrammingError
+
+    if ANALYTICS_SOURCE == "rollups":
+        try:
+            row = conn.execute(window_stats_sql(REPORT_HOURS)).fetchone()
+            if row and row[3]:
+                return row[:4]
+            # Empty rollups: only bridge_v3 fills them, bridge.py / bridge_v2.py write raw rows only
+            print("ℹ️  No rollups for this window. Scanning raw readings instead.")
+        except ProgrammingError:
+            # Rollup tables not created yet (e.g. only bridge_v2 has run): fall back to the raw scan
+            conn.rollback()
+            print("ℹ️  Rollup tables not found. Scanning raw readings instead.")
+
+    # Cold Storage: once old days are archived to Parquet, the raw scan covers both tiers
+    if has_cold_data():
+        return archive_window_stats(REPORT_HOURS)
+
+    # We use SQLAlchemy text() for safe SQL execution
+    query_stats = text("""
+        SELECT 
+            ROUND(AVG((payload->>'temp')::numeric), 2) as avg_temp,
+            MAX((payload->>'temp')::numeric) as max_temp,
+            MIN((payload->>'temp')::numeric) as min_temp,
+            COUNT(*) as total_readings
+        FROM edu_iot_digital_twin_lab.smart_sensor_data
+        WHERE aud_insert_ts > NOW() - :hours * INTERVAL '1 hour';
+    """)
+    return conn.execute(query_stats, {"hours": REPORT_HOURS}).fetchone()
+
+def print_report(count, avg_t, max_t, min_t, percentiles=None):
+    """Prints the strategic report block (percentiles are only known in watchman mode)."""
+    print("\n" + "="*35)
+    print("📊 24-HOUR STRATEGIC REPORT")
+    print("="*35)
+    print(f"Total Readings: {count}")
+    print(f"Average Temp:   {avg_t}°C")
+    print(f"Maximum Temp:   {max_t}°C")
+    print(f"Minimum Temp:   {min_t}°C")
+    if percentiles:
+        print(f"p50/p95/p99:    {percentiles[0]} / {percentiles[1]} / {percentiles[2]}°C")
+    print("-" * 35)
+
+def check_latest(latest_temp):
+    """Compares the newest reading against the threshold and emails if it is too hot."""
+    if latest_temp > THRESHOLD_TEMP:
+        print(f"⚠️  CRITICAL: High temperature detected! ({latest_temp}°C)")
+        send_email_alert(latest_temp)
+    else:
+        print(f"✅ SYSTEM HEALTH: Normal ({latest_temp}°C)")
+
 def run_analytics():
     """Main intelligence loop: Queries DB, calculates stats, and triggers alerts."""
     print("\n🔍 Interrogating Digital Twin Records...")
     
+    # SQLAlchemy is loaded here, not at startup: Watchman mode never needs it
+    from sqlalchemy import text # <--- Modernized connection engine
+
     try:
-        engine = get_db_engine()
+        # The shared, pooled SQLAlchemy engine for 2026-compliant database interaction
+        engine = get_engine()
         
         # We use a context manager (with) to ensure the connection closes automatically
         with engine.connect() as conn:
             
             # 1. FETCH AGGREGATES (Calculating 'The Big Picture')
-            # We use SQLAlchemy text() for safe SQL execution
-            query_stats = text("""
-                SELECT 
-                    ROUND(AVG((payload->>'temp')::numeric), 2) as avg_temp,
-                    MAX((payload->>'temp')::numeric) as max_temp,
-                    MIN((payload->>'temp')::numeric) as min_temp,
-                    COUNT(*) as total_readings
-                FROM edu_iot_digital_twin_lab.smart_sensor_data
-                WHERE aud_insert_ts > NOW() - INTERVAL '24 hours';
-            """)
-            
-            result = conn.execute(query_stats)
-            row = result.fetchone()
+            # A 24h report reads ~1,440 small rollup rows per device instead of every reading
+            row = fetch_window_stats(conn)
             
             # Defensive Programming: Ensure we have data before calculating
-            if row and row.total_readings > 0: 
+            if row and row[3] > 0: 
                 avg_t, max_t, min_t, count = row
-                
-                print("\n" + "="*35)
-                print("📊 24-HOUR STRATEGIC REPORT")
-                print("="*35)
-                print(f"Total Readings: {count}")
-                print(f"Average Temp:   {avg_t}°C")
-                print(f"Maximum Temp:   {max_t}°C")
-                print(f"Minimum Temp:   {min_t}°C")
-                print("-" * 35)
+                print_report(count, avg_t, max_t, min_t)
 
                 # 2. LATEST READING CHECK (The 'Real-Time' Pulse)
-                query_latest = text("""
-                    SELECT (payload->>'temp')::numeric 
-                    FROM edu_iot_digital_twin_lab.smart_sensor_data 
-                    ORDER BY aud_insert_ts DESC 
-                    LIMIT 1;
-                """)
-                latest_temp = conn.execute(query_latest).scalar()
-
-                if latest_temp > THRESHOLD_TEMP:
-                    print(f"⚠️  CRITICAL: High temperature detected! ({latest_temp}°C)")
-                    send_email_alert(latest_temp)
+                # The Week 6 bridge keeps a shadow of every device in memory: ask it first
+                shadow = fetch_shadow()
+                if shadow is not None and shadow["temp"] is not None:
+                    check_latest(shadow["temp"])
                 else:
-                    print(f"✅ SYSTEM HEALTH: Normal ({latest_temp}°C)")
+                    query_latest = text("""
+                        SELECT (payload->>'temp')::numeric 
+                        FROM edu_iot_digital_twin_lab.smart_sensor_data 
+                        ORDER BY aud_insert_ts DESC 
+                        LIMIT 1;
+                    """)
+                    check_latest(conn.execute(query_latest).scalar())
+            else:
+                print("📭 No data found in the last 24 hours. Move the Wokwi slider!")
+
+    except Exception as e:
+        print(f"❌ Database/Analytics Error: {e}")
+
+def run_watchman():
+    """24/7 mode: one database read at startup, then every report comes straight from memory."""
+    watchman = Watchman(MQTT_BROKER, MQTT_PORT, WATCH_TOPIC, window_hours=REPORT_HOURS)
+    try:
+        watchman.seed(get_pool())
+    except Exception as e:
+        print(f"⚠️ Could not seed from the database ({e}). Starting with an empty window.")
+    watchman.start()
+
+    # Press Enter at any moment for an instant report; otherwise one arrives every WATCH_INTERVAL
+    requested = threading.Event()
+    def wait_for_enter():
+        for _ in sys.stdin:
+            requested.set()
+    threading.Thread(target=wait_for_enter, daemon=True).start()
+
+    try:
+        while True:
+            report = watchman.report()
+            if report["count"] > 0:
+                print_report(report["count"], report["avg"], report["max"], report["min"],
+                             (report["p50"], report["p95"], report["p99"]))
+                check_latest(report["latest"])
             else:
                 print("📭 No data found in the last 24 hours. Move the Wokwi slider!")
+            requested.wait(WATCH_INTERVAL)
+            requested.clear()
+    finally:
+        watchman.stop()
 
+def run_incident_review(at):
+    """Time travel: every device's state at `at`, rebuilt from the nearest fleet snapshot."""
+    print(f"\n⏪ Rebuilding the fleet as it was at {at}...")
+    try:
+        result = fleet_state_at(at)
     except Exception as e:
         print(f"❌ Database/Analytics Error: {e}")
+        return
+
+    devices = result["devices"]
+    if not devices:
+        print("📭 No device had reported yet at that time.")
+        return
+    # Industry Standard: Say where the answer came from (snapshot + replayed tail), so it can be trusted
+    if result["snapshot_at"] is not None:
+        base = time.strftime("the snapshot at %Y-%m-%d %H:%M UTC", time.gmtime(result["snapshot_at"]))
+    else:
+        base = "no snapshot (before the first one)"
+    print(f"🧩 Rebuilt from {base} + {result['replayed']} replayed readings")
+    hot = [d for d in devices if d["temp"] is not None and d["temp"] > THRESHOLD_TEMP]
+    print(f"Devices: {len(devices)} | Above {THRESHOLD_TEMP}°C: {len(hot)}")
+    for device in (hot or devices)[:20]:
+        seen = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(device["last_seen"]))
+        print(f"  {device['device']:<20} {device['temp']}°C  {device['hum']}%  last seen {seen} UTC")
 
 if __name__ == "__main__":
     # Instruction for the student
     print("\n🚀 Intelligence Engine is running.")
     print("👉 Press Ctrl+C to stop the monitor.")
-    
-    # Optional: Wrap in a loop if the student wants a 'Watchman'
-    run_analytics()
\ No newline at end of file
+    # Read-only: migrations and maintenance belong to the bridge (or `python -m twin_lab.schema`)
+
+    if "--at" in sys.argv[:-1]:
+        # Incident review: python analytics.py --at "2026-10-16 14:03" (UTC)
+        run_incident_review(sys.argv[sys.argv.index("--at") + 1])
+    elif "--watch" in sys.argv:
+        # The 'Watchman': stays running and keeps the report up to date in memory
+        print("👀 Watchman mode: press Enter for an instant report.")
+        run_watchman()
+    else:
+        run_analytics()
\ No newline at end of file
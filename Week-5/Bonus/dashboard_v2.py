@@ -1,18 +1,23 @@
 import streamlit as st
 import pandas as pd
-import psycopg2
-from sqlalchemy import create_engine  # <--- Added for 2026 Pandas Compliance
-import json
 import os
+import sys
 import time
-from dotenv import load_dotenv
+
+# Make the shared 'twin_lab' package (in the repository root) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from twin_lab.config import config
+from twin_lab.downsample import TIME_RANGES, get_series
+from twin_lab.live_cache import get_reading_cache  # <--- Shared cache, one query per interval per server process
 
 # --- TERMINAL INSTRUCTION ---
 print("\n🚀 Dashboard Server is running...")
 print("👉 Press Ctrl+C in this terminal to stop the Dashboard.\n")
 
 # --- 1. SETUP & PAGE CONFIG ---
-load_dotenv()
+config.load(__file__)
+# Which device to show (its sensor_id in the table). Leave empty to show every device.
+DASHBOARD_DEVICE = config.get("DASHBOARD_DEVICE") or None
 st.set_page_config(page_title="IoT Digital Twin v2", page_icon="🛰️", layout="wide")
 
 st.title("🛰️ Smart Sensor Dashboard (JSONB Edition)")
@@ -21,29 +26,18 @@ st.markdown("This dashboard pulls live **JSONB** payloads from PostgreSQL and fl
 # --- 2. DATABASE CONNECTION ---
 def get_data():
     try:
-        # Create a SQLAlchemy engine to satisfy modern Pandas requirements
-        db_url = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-        engine = create_engine(db_url)
-        
-        query = """
-            SELECT payload, aud_insert_ts 
-            FROM edu_iot_digital_twin_lab.smart_sensor_data 
-            ORDER BY aud_insert_ts DESC 
-            LIMIT 50
-        """
-        
-        # FIXED: Use the 'engine' instead of the raw 'conn'
-        df_raw = pd.read_sql_query(query, engine)
-
-        if df_raw.empty:
-            return pd.DataFrame()
+        # One shared, per-device rolling window for every open browser session:
+        # only rows newer than the last seen timestamp are fetched and flattened
+        return get_reading_cache().get(DASHBOARD_DEVICE)
+    except Exception as e:
+        st.error(f"Database Error: {e}")
+        return pd.DataFrame()
 
-        # MAGIC STEP: Flatten the JSON 'payload' column into individual columns
-        df_payload = pd.json_normalize(df_raw['payload'])
-        
-        # Combine the new columns with the timestamp
-        df_final = pd.concat([df_payload, df_raw['aud_insert_ts']], axis=1)
-        return df_final
+def get_trend(time_range):
+    """The temperature series for the chosen range: never more than ~1000 points, however long it is."""
+    try:
+        # SQL time buckets + LTTB downsampling, shared by every browser session
+        return get_series(time_range, DASHBOARD_DEVICE).set_index('aud_insert_ts')[['temp']]
     except Exception as e:
         st.error(f"Database Error: {e}")
         return pd.DataFrame()
@@ -54,6 +48,8 @@ def get_data():
 with st.sidebar:
     st.header("Dashboard Controls")
     refresh = st.button("🔄 Refresh Data")
+    # "live" is the newest readings; longer ranges are downsampled on the server
+    time_range = st.selectbox("📅 Time Range", ["live"] + list(TIME_RANGES))
     st.info("This dashboard reads directly from the 'smart_sensor_data' table.")
     st.markdown("---")
     st.write("🛑 **To stop the server:**")
@@ -77,7 +73,10 @@ if not df.empty:
 
     # B. Visualizing the Trend
     st.subheader("Temperature Trend")
-    chart_data = df.set_index('aud_insert_ts')[['temp']]
+    if time_range == "live":
+        chart_data = df.set_index('aud_insert_ts')[['temp']]
+    else:
+        chart_data = get_trend(time_range)
     st.line_chart(chart_data)
 
     # C. Raw Data Table
@@ -1,82 +1,107 @@
 import os
+import sys
 import json
-import smtplib
-from email.message import EmailMessage
+import time
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
-import psycopg2
-from dotenv import load_dotenv
 
-# Load our credentials
-load_dotenv()
+# Make the shared 'twin_lab' package (in the repository root) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from twin_lab.alerts import AlertDispatcher
+from twin_lab.anomaly import AnomalyEngine, AnomalyMonitor, load_rules
+from twin_lab.config import config
+from twin_lab.db import get_pool
+from twin_lab.logs import Sampler, get_logger
+from twin_lab.metrics import MESSAGES_FAILED, MESSAGES_RECEIVED, MESSAGES_STORED, REGISTRY, lap, start_metrics_server
+from twin_lab.topics import device_id
+
+# Load our credentials (the .env next to this script)
+config.load(__file__)
 
 # --- SETTINGS ---
-MQTT_BROKER = "broker.hivemq.com"
-MQTT_TOPIC = "edu/iot/temp" 
+MQTT_BROKER = config.mqtt_broker
+MQTT_PORT = config.mqtt_port
+MQTT_TOPIC = config.get("MQTT_TOPIC", "edu/iot/temp")
 ALARM_THRESHOLD = 30.0  # Matches our ESP32 LED setting
 
-def send_email_alert(temp):
-    """
-    Sends an emergency email when the threshold is breached.
-    """
-    msg = EmailMessage()
-    msg.set_content(f"🚨 ALERT: Your Digital Twin detected a temperature of {temp}°C, which exceeds your {ALARM_THRESHOLD}°C limit!")
-    msg['Subject'] = f"IOT CRITICAL ALERT: {temp}°C"
-    msg['From'] = os.getenv("EMAIL_SENDER")
-    msg['To'] = os.getenv("EMAIL_RECEIVER")
+# Alert Tuning: one email per device per cooldown, breaches within the window share a digest
+ALERT_COOLDOWN = config.get_float("ALERT_COOLDOWN", 300)
+ALERT_HYSTERESIS = config.get_float("ALERT_HYSTERESIS", 1.0)
+ALERT_DIGEST_WINDOW = config.get_float("ALERT_DIGEST_WINDOW", 30)
 
-    try:
-        # Connect to Gmail's secure server
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-            smtp.login(os.getenv("EMAIL_SENDER"), os.getenv("EMAIL_PASSWORD"))
-            smtp.send_message(msg)
-        print("📧 Email alert sent successfully!")
-    except Exception as e:
-        print(f"❌ Email failed to send: {e}")
+# Anomaly Rules: optional JSON file with per-device-group rules (see twin_lab/README.md)
+ANOMALY_RULES = config.get("ANOMALY_RULES")
 
-def get_db_connection():
-    return psycopg2.connect(
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASS"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT")
-    )
+# Observability: Prometheus metrics on http://127.0.0.1:METRICS_PORT/metrics (0 = off)
+METRICS_PORT = config.get_int("METRICS_PORT", 9108)
+log = get_logger("bridge_v2")
+received_log, error_log = Sampler(), Sampler()
 
 def on_message(client, userdata, msg):
+    # Label by device ('student01'), not the full topic, so metrics match bridge_v3 and anomaly rules
+    device = device_id(msg.topic)
+    MESSAGES_RECEIVED.inc(device=device)
+    started = time.perf_counter()
     try:
         # 1. Decode and Parse
         payload_str = msg.payload.decode()
         data = json.loads(payload_str)
-        print(f"📥 Received: {data}")
+        t = lap("parse", started)
+        # Levelled Logging: set LOG_LEVEL=DEBUG to see every message again
+        log.debug("📥 Received: %s", data)
+        if received_log.hit():
+            log.info("📥 %d messages received (latest: %s)", received_log.count, data)
 
         # 2. Store in the SMART table
-        conn = get_db_connection()
-        cur = conn.cursor()
-        query = "INSERT INTO edu_iot_digital_twin_lab.smart_sensor_data (payload) VALUES (%s)"
-        cur.execute(query, (json.dumps(data),))
-        conn.commit()
-        cur.close()
-        conn.close()
-        print("✅ Stored in Database.")
+        # sensor_id is the device from the topic, like bridge_v3 writes it, so every tool sees one identity
+        query = "INSERT INTO edu_iot_digital_twin_lab.smart_sensor_data (sensor_id, payload) VALUES (%s, %s)"
+        # Industry Standard: Reuse pooled connections instead of reconnecting for every message
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (device, json.dumps(data)))
+                t = lap("insert", t)
+        t = lap("commit", t)
+        MESSAGES_STORED.inc(device=device)
+        log.debug("✅ Stored in Database.")
 
         # 3. Intelligence: Check if we need to send an email
         # We use .get() to safely check the 'temp' key in the JSON
-        current_temp = data.get("temp", 0)
-        
-        if current_temp > ALARM_THRESHOLD:
-            print(f"⚠️ THRESHOLD BREACHED: {current_temp}°C. Sending email...")
-            send_email_alert(current_temp)
+        current_temp = data.get("temp")
+
+        # The monitor scores readings in micro-batches; the dispatcher handles cooldowns and emails
+        if isinstance(current_temp, (int, float)) and not isinstance(current_temp, bool):
+            anomalies.submit(device, current_temp)
+        lap("anomaly_submit", t)
 
     except Exception as e:
-        print(f"❌ Error processing message: {e}")
+        MESSAGES_FAILED.inc(device=device, reason="error")
+        if error_log.hit():
+            log.error("❌ Error processing message: %s (%d so far)", e, error_log.count)
 
 # --- START THE BRIDGE ---
+alerts = AlertDispatcher(ALARM_THRESHOLD, cooldown=ALERT_COOLDOWN, hysteresis=ALERT_HYSTERESIS,
+                         digest_window=ALERT_DIGEST_WINDOW).start()
+rules = load_rules(ANOMALY_RULES, threshold=ALARM_THRESHOLD, hysteresis=ALERT_HYSTERESIS)
+anomalies = AnomalyMonitor(AnomalyEngine(rules), alerts).start()
+
 client = mqtt.Client(CallbackAPIVersion.VERSION2)
 client.on_message = on_message
-client.connect(MQTT_BROKER, 1883, 60)
+client.connect(MQTT_BROKER, MQTT_PORT, 60)
 client.subscribe(MQTT_TOPIC)
 
+REGISTRY.add_stats("alerts", alerts.stats)
+REGISTRY.add_stats("anomaly", anomalies.stats)
+REGISTRY.add_stats("db_pool", lambda: get_pool().stats)
+start_metrics_server(METRICS_PORT)
+
 print(f"🚀 Week 5 Bridge & Alerter is LIVE on {MQTT_TOPIC}")
 print("Press Ctrl+C to stop the bridge.")
-client.loop_forever()
\ No newline at end of file
+try:
+    client.loop_forever()
+except KeyboardInterrupt:
+    print("\n🛑 Stopping the bridge...")
+finally:
+    client.disconnect()
+    # Score what is still queued, then send any digest still waiting in the alert window
+    anomalies.stop()
+    alerts.stop()
@@ -1,82 +1,353 @@
 import os
-import json
-import smtplib
-from email.message import EmailMessage
+import sys
+import threading
+import time
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
-import psycopg2
-from dotenv import load_dotenv
 
-# Load our credentials
-load_dotenv()
+# Make the shared 'twin_lab' package (in the repository root) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from twin_lab.batch_writer import BatchWriter
+from twin_lab.alerts import AlertDispatcher
+from twin_lab.anomaly import AnomalyEngine, AnomalyMonitor, load_rules
+from twin_lab.config import config
+from twin_lab.db import LazyPool, get_pool
+from twin_lab.logs import Sampler, get_logger
+from twin_lab.metrics import MESSAGES_FAILED, MESSAGES_RECEIVED, MESSAGES_STORED, REGISTRY, lap, start_metrics_server
+from twin_lab.codec import PayloadError, decode_reading, dedup_key, jsonb_text
+from twin_lab.compression import compressor_from_env
+from twin_lab.rollups import apply_rollups
+from twin_lab.schema import MaintenanceThread, prepare_database
+from twin_lab.shadow import ShadowStore, start_shadow_server
+from twin_lab.spool import Spool, SpoolReplayer
+from twin_lab.supervisor import StatsReporter, Supervisor, worker_identity
+from twin_lab.topics import COMMAND_TOPIC_PREFIX, DATA_TOPIC_FILTER, device_id, partition_for, shared_topic
+
+# Load our credentials (the .env next to this script)
+config.load(__file__)
 
 # --- SETTINGS ---
-MQTT_BROKER = "broker.hivemq.com"
-MQTT_TOPIC = "edu/iot/temp/student01" 
+MQTT_BROKER = config.mqtt_broker
+MQTT_PORT = config.mqtt_port
+MQTT_TOPIC = config.get("MQTT_TOPIC", "edu/iot/temp/student01")
 ALARM_THRESHOLD = 30.0  # Matches our ESP32 LED setting
 
-def send_email_alert(temp):
-    """
-    Sends an emergency email when the threshold is breached.
-    """
-    msg = EmailMessage()
-    msg.set_content(f"🚨 ALERT: Your Digital Twin detected a temperature of {temp}°C, which exceeds your {ALARM_THRESHOLD}°C limit!")
-    msg['Subject'] = f"IOT CRITICAL ALERT: {temp}°C"
-    msg['From'] = os.getenv("EMAIL_SENDER")
-    msg['To'] = os.getenv("EMAIL_RECEIVER")
+# Alert Tuning: one email per device per cooldown, breaches within the window share a digest
+ALERT_COOLDOWN = config.get_float("ALERT_COOLDOWN", 300)
+ALERT_HYSTERESIS = config.get_float("ALERT_HYSTERESIS", 1.0)
+ALERT_DIGEST_WINDOW = config.get_float("ALERT_DIGEST_WINDOW", 30)
 
-    try:
-        # Connect to Gmail's secure server
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-            smtp.login(os.getenv("EMAIL_SENDER"), os.getenv("EMAIL_PASSWORD"))
-            smtp.send_message(msg)
-        print("📧 Email alert sent successfully!")
-    except Exception as e:
-        print(f"❌ Email failed to send: {e}")
+# Anomaly Rules: a JSON file of per-device-group rules (threshold, z-score, rate of change).
+# Without one, every device uses ALARM_THRESHOLD with ALERT_HYSTERESIS, exactly like before.
+ANOMALY_RULES = config.get("ANOMALY_RULES")
+
+# Ingest Mode: "batch" buffers readings and writes them in bulk, "direct" is one INSERT per message,
+# "spool" lands every reading on local disk first so nothing is lost while Postgres is down,
+# "reliable" is batch mode with QoS 1: the broker's copy is only released once the batch has committed
+INGEST_MODE = config.get("INGEST_MODE", "batch")
+BATCH_SIZE = config.get_int("BATCH_SIZE", 500)
+BATCH_MAX_AGE = config.get_float("BATCH_MAX_AGE", 1.0)
+SPOOL_DIR = config.get_path("SPOOL_DIR", "bridge_spool")
+SPOOL_MAX_MB = config.get_int("SPOOL_MAX_MB", 1024)
+
+# Reliable Mode: how many unacknowledged messages the broker may send us at once (MQTT 5 Receive Maximum).
+# Bigger windows keep batches full; the session survives a crash for SESSION_EXPIRY seconds.
+INFLIGHT_WINDOW = config.get_int("INFLIGHT_WINDOW", 1000)
+SESSION_EXPIRY = config.get_int("SESSION_EXPIRY", 3600)
+MQTT_CLIENT_ID = config.get("MQTT_CLIENT_ID", f"edu-iot-bridge-{device_id(MQTT_TOPIC)}")
+RELIABLE = INGEST_MODE == "reliable"
+
+# Compression (batch/reliable modes): COMPRESSION=deadband or swinging_door stores only the readings
+# needed to redraw each device's line within COMPRESSION_ERROR °C, and at least one every
+# COMPRESSION_HEARTBEAT seconds. The rollups still count every reading. Swinging door holds back each
+# device's newest reading; a quiet device's is stored after COMPRESSION_MAX_HOLD seconds, so in reliable
+# mode it never keeps its unacknowledged message in the broker's in-flight window.
 
-def get_db_connection():
-    return psycopg2.connect(
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASS"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT")
-    )
+# Fleet Mode: BRIDGE_WORKERS > 1 turns this script into a supervisor of N worker processes.
+# "hash" gives every device to exactly one worker (ordering preserved); "shared" lets the broker split the load.
+BRIDGE_WORKERS = config.get_int("BRIDGE_WORKERS", 1)
+PARTITION_STRATEGY = config.get("PARTITION_STRATEGY", "hash")
+FLEET_TOPIC_FILTER = config.get("FLEET_TOPIC_FILTER", DATA_TOPIC_FILTER)
+STATS_DIR = config.get_path("STATS_DIR", "bridge_stats")
+
+# Device Shadows: the latest state of every device, served as JSON on http://127.0.0.1:SHADOW_PORT (0 = off).
+# In fleet mode, worker i serves its own devices on SHADOW_PORT + 1 + i.
+SHADOW_PORT = config.get_int("SHADOW_PORT", 9110)
+SHADOW_MAX_DEVICES = config.get_int("SHADOW_MAX_DEVICES", 100000)
+
+counters = {"received": 0, "skipped": 0, "rejected": 0, "errors": 0, "mqtt_connects": 0, "commands": 0}
+
+# Observability: Prometheus metrics on http://127.0.0.1:METRICS_PORT/metrics (0 = off).
+# In fleet mode, worker i listens on METRICS_PORT + 1 + i.
+METRICS_PORT = config.get_int("METRICS_PORT", 9108)
+log = get_logger("bridge_v3")
+received_log, dropped_log, rejected_log, error_log = Sampler(), Sampler(), Sampler(), Sampler()
+
+def on_connect(client, userdata, flags, reason_code, properties):
+    # (Re)subscribe on every connect: after a broker restart the old subscription is gone
+    counters["mqtt_connects"] += 1
+    qos = 1 if RELIABLE else 0  # QoS 1: the broker keeps every reading until we acknowledge it
+    client.subscribe([(subscription, qos), (command_subscription, qos)])
+    if counters["mqtt_connects"] > 1:
+        log.warning("🔌 Reconnected to the broker (%d connects so far).", counters["mqtt_connects"])
 
 def on_message(client, userdata, msg):
+    # Reliable Mode: a reading taken by the writer is acknowledged after its COMMIT, everything else now
+    if not handle_message(msg) and RELIABLE:
+        client.ack(msg.mid, msg.qos)
+
+def handle_message(msg):
+    """Processes one message. Returns True if the batch writer now owns its acknowledgement."""
+    device = device_id(msg.topic)
+    # Hash Partitioning: every worker sees the wildcard, but only handles its own devices
+    if partition is not None and partition_for(device, partition[1]) != partition[0]:
+        counters["skipped"] += 1
+        return False
+    if msg.topic.startswith(COMMAND_TOPIC_PREFIX + "/"):
+        # A dashboard sent this device a command: remember it in the shadow
+        counters["commands"] += 1
+        shadows.record_command(device, msg.payload.decode(errors="replace"))
+        return False
+    taken = False
+    counters["received"] += 1
+    MESSAGES_RECEIVED.inc(device=device)
+    started = time.perf_counter()
     try:
-        # 1. Decode and Parse
-        payload_str = msg.payload.decode()
-        data = json.loads(payload_str)
-        print(f"📥 Received: {data}")
+        # 1. Validate and Parse: JSON or 14-byte binary, told apart by the first byte
+        reading = decode_reading(msg.payload)
+        t = lap("parse", started)
+        shadows.update(device, reading)  # The device's shadow is current before anything else happens
+        t = lap("shadow", t)
+        # Levelled Logging: every message at DEBUG, one summary line per LOG_SAMPLE_EVERY at INFO
+        log.debug("📥 Received from %s: %s", device, reading)
+        if received_log.hit():
+            log.info("📥 %d messages received (latest from %s: %s)", counters["received"], device, reading)
 
         # 2. Store in the SMART table
-        conn = get_db_connection()
-        cur = conn.cursor()
-        query = "INSERT INTO edu_iot_digital_twin_lab.smart_sensor_data (payload) VALUES (%s)"
-        cur.execute(query, (json.dumps(data),))
-        conn.commit()
-        cur.close()
-        conn.close()
-        print("✅ Stored in Database.")
-
-        # 3. Intelligence: Check if we need to send an email
-        # We use .get() to safely check the 'temp' key in the JSON
-        current_temp = data.get("temp", 0)
-        
-        if current_temp > ALARM_THRESHOLD:
-            print(f"⚠️ THRESHOLD BREACHED: {current_temp}°C. Sending email...")
-            send_email_alert(current_temp)
+        if spool is not None:
+            # Spool Mode: the raw bytes are on disk before we return; the replayer does the INSERT
+            if not spool.append(msg.payload, device):
+                MESSAGES_FAILED.inc(device=device, reason="spool_full")
+                if dropped_log.hit():
+                    log.warning("⚠️ Spool is full. Reading dropped (%d so far).", dropped_log.count)
+            t = lap("spool_append", t)
+        elif writer is not None:
+            # Batch Mode: hand the reading to the background flusher and return immediately
+            # The validated bytes go to the writer as they are: JSON is never re-encoded,
+            # binary readings are converted in bulk when the batch is flushed
+            # Reliable Mode also hands over the MQTT ack and a fingerprint that makes redeliveries harmless
+            delivery = (msg.mid, msg.qos) if RELIABLE else None
+            key = dedup_key(msg.payload, reading) if RELIABLE else None
+            if compressor is None:
+                taken = writer.submit(msg.payload, device, reading.temp, delivery, key)
+            else:
+                taken = compress((device, msg.payload, reading.temp, delivery, key, time.time()))
+            if not taken:
+                MESSAGES_FAILED.inc(device=device, reason="buffer_full")
+                if dropped_log.hit():
+                    log.warning("⚠️ Ingest buffer full. Reading dropped (%d so far).", dropped_log.count)
+            t = lap("enqueue", t)
+        else:
+            query = "INSERT INTO edu_iot_digital_twin_lab.smart_sensor_data (sensor_id, payload) VALUES (%s, %s)"
+            # Industry Standard: Reuse pooled connections instead of reconnecting for every message
+            with get_pool().connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (device, jsonb_text(msg.payload)))
+                    t = lap("insert", t)
+                    # Keep the minute/hour rollups in step, inside the same transaction
+                    apply_rollups(cur, [(device, reading.temp)])
+                    t = lap("rollup", t)
+            t = lap("commit", t)
+            MESSAGES_STORED.inc(device=device)
+            log.debug("✅ Stored in Database.")
+
+        # 3. Intelligence: Score the reading for anomalies
+        # The monitor scores whole micro-batches in NumPy; the dispatcher handles cooldowns and emails
+        # ('temp' is null when the DHT22 read fails: nothing to score)
+        if reading.temp is not None:
+            anomalies.submit(device, reading.temp)
+        lap("anomaly_submit", t)
 
+    except PayloadError as e:
+        # Defensive Programming: malformed readings never reach the database
+        counters["rejected"] += 1
+        MESSAGES_FAILED.inc(device=device, reason="invalid_payload")
+        if rejected_log.hit():
+            log.warning("⚠️ Rejected payload on %s: %s (%d so far)", msg.topic, e, counters["rejected"])
     except Exception as e:
-        print(f"❌ Error processing message: {e}")
+        counters["errors"] += 1
+        MESSAGES_FAILED.inc(device=device, reason="error")
+        if error_log.hit():
+            log.error("❌ Error processing message: %s (%d so far)", e, counters["errors"])
+    return taken
+
+def compress(item):
+    """
+    Runs a reading (a writer row: device, payload, temp, delivery, key, received_at) through compression.
+
+    Kept readings go to the writer as rows, redundant ones as rollups only. The
+    current reading may be held back until the device's next one. Returns False
+    only if the writer had no room for it.
+    """
+    with compress_lock:
+        kept, dropped = compressor.offer(item[0], item[5], item[2], item)
+    taken = True  # Held back: it reaches the writer with a later reading, the release timer or at shutdown
+    for entry, payload in [(k, k[1]) for k in kept] + [(d, None) for d in dropped]:
+        ok = writer.submit(payload, entry[0], *entry[2:])
+        if entry is item:
+            taken = ok
+        elif not ok and entry[3] is not None:
+            client.ack(*entry[3])  # Lost anyway: don't let it occupy the in-flight window
+    return taken
+
+def release_held():
+    """Timer thread: stores the points that quiet devices have held back for longer than max_hold."""
+    while not release_stop.wait(1.0):
+        with compress_lock:
+            held = compressor.release(time.time() - compressor.max_hold)
+        for entry in held:
+            if not writer.submit(entry[1], entry[0], *entry[2:]) and entry[3] is not None:
+                client.ack(*entry[3])
+
+def collect_stats():
+    stats = {"bridge": dict(counters), "alerts": dict(alerts.stats), "anomaly": dict(anomalies.stats),
+             "shadow": dict(shadows.stats)}
+    if writer is not None:
+        stats["writer"] = writer.stats()
+    if compressor is not None:
+        stats["compression"] = dict(compressor.stats)
+    if replayer is not None:
+        stats["spool"] = dict(spool.stats, pending_bytes=spool.pending_bytes())
+        stats["replay"] = dict(replayer.stats)
+    return stats
 
 # --- START THE BRIDGE ---
-client = mqtt.Client(CallbackAPIVersion.VERSION2)
+identity = worker_identity()
+if BRIDGE_WORKERS > 1 and identity is None:
+    # Supervisor Mode: launch and babysit the workers instead of bridging ourselves
+    Supervisor(__file__, BRIDGE_WORKERS, STATS_DIR).run()
+    sys.exit(0)
+
+# Decide what to subscribe to: one device (classic lab) or the whole fleet (worker)
+partition = None
+subscription = MQTT_TOPIC
+command_subscription = f"{COMMAND_TOPIC_PREFIX}/{device_id(MQTT_TOPIC)}"
+if identity is not None:
+    SPOOL_DIR = os.path.join(SPOOL_DIR, f"worker-{identity[0]}")  # Every worker owns its own log
+    command_subscription = COMMAND_TOPIC_PREFIX + "/+"
+    if PARTITION_STRATEGY == "shared":
+        subscription = shared_topic(FLEET_TOPIC_FILTER)
+        command_subscription = shared_topic(command_subscription)
+    else:
+        subscription = FLEET_TOPIC_FILTER
+        partition = identity
+
+# Schema: apply migrations (rollups, partitions, indexes) and create the upcoming daily partitions
+maintenance = None
+if prepare_database(LazyPool()):
+    maintenance = MaintenanceThread(LazyPool()).start()
+
+writer = None
+spool = replayer = None
+if INGEST_MODE == "batch":
+    writer = BatchWriter(get_pool(), batch_size=BATCH_SIZE, max_age=BATCH_MAX_AGE).start()
+elif RELIABLE:
+    # A batch can't be bigger than the window, or it would wait for messages the broker is holding back.
+    # The buffer never overflows: the broker stops at INFLIGHT_WINDOW unacknowledged messages.
+    writer = BatchWriter(get_pool(), batch_size=min(BATCH_SIZE, INFLIGHT_WINDOW), max_age=BATCH_MAX_AGE,
+                         queue_size=max(INFLIGHT_WINDOW, 10000),
+                         ack=lambda mid, qos: client.ack(mid, qos)).start()
+elif INGEST_MODE == "spool":
+    spool = Spool(SPOOL_DIR, max_bytes=SPOOL_MAX_MB * 1024 * 1024)
+    # The pool is created lazily on the replayer thread, so the bridge starts even if Postgres is down
+    replayer = SpoolReplayer(spool, LazyPool(), batch_size=BATCH_SIZE).start()
+
+compressor = compressor_from_env()
+if compressor is not None and writer is None:
+    print(f"⚠️ COMPRESSION needs INGEST_MODE=batch or reliable; storing every reading ({INGEST_MODE} mode).")
+    compressor = None
+compress_lock = threading.Lock()  # on_message (network thread) and the release timer share the compressor
+release_stop = threading.Event()
+if compressor is not None and compressor.mode == "swinging_door":
+    threading.Thread(target=release_held, name="compression-release", daemon=True).start()
+
+shadows = ShadowStore(max_devices=SHADOW_MAX_DEVICES)
+alerts = AlertDispatcher(ALARM_THRESHOLD, cooldown=ALERT_COOLDOWN, hysteresis=ALERT_HYSTERESIS,
+                         digest_window=ALERT_DIGEST_WINDOW).start()
+rules = load_rules(ANOMALY_RULES, threshold=ALARM_THRESHOLD, hysteresis=ALERT_HYSTERESIS)
+anomalies = AnomalyMonitor(AnomalyEngine(rules), alerts, shadows=shadows).start()
+
+if RELIABLE:
+    from paho.mqtt.packettypes import PacketTypes
+    from paho.mqtt.properties import Properties
+
+    # Persistent Session: a fixed client id and clean_start=False, so messages we never acknowledged
+    # (a crash mid-batch) are delivered again when the bridge comes back
+    client_id = MQTT_CLIENT_ID if identity is None else f"{MQTT_CLIENT_ID}-w{identity[0]}"
+    client = mqtt.Client(CallbackAPIVersion.VERSION2, client_id=client_id, protocol=mqtt.MQTTv5, manual_ack=True)
+    connect_properties = Properties(PacketTypes.CONNECT)
+    connect_properties.ReceiveMaximum = INFLIGHT_WINDOW
+    connect_properties.SessionExpiryInterval = SESSION_EXPIRY
+else:
+    client = mqtt.Client(CallbackAPIVersion.VERSION2)
+client.on_connect = on_connect
 client.on_message = on_message
-client.connect(MQTT_BROKER, 1883, 60)
-client.subscribe(MQTT_TOPIC)
+if RELIABLE:
+    client.connect(MQTT_BROKER, MQTT_PORT, 60, clean_start=False, properties=connect_properties)
+else:
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+
+# Metrics: our own counters plus the stats every component already keeps
+REGISTRY.add_stats("bridge", counters)
+REGISTRY.add_stats("alerts", alerts.stats)
+REGISTRY.add_stats("anomaly", anomalies.stats)
+REGISTRY.add_stats("shadow", shadows.stats)
+REGISTRY.add_stats("db_pool", lambda: get_pool().stats)
+if writer is not None:
+    REGISTRY.add_stats("writer", writer.stats)  # includes queue_depth
+if compressor is not None:
+    REGISTRY.add_stats("compression", compressor.stats)  # includes ratio (readings per stored row)
+if replayer is not None:
+    REGISTRY.add_stats("spool", lambda: dict(spool.stats, pending_bytes=spool.pending_bytes()))
+    REGISTRY.add_stats("replay", replayer.stats)
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT + (1 + identity[0] if identity is not None else 0))
+if SHADOW_PORT:
+    start_shadow_server(shadows, SHADOW_PORT + (1 + identity[0] if identity is not None else 0))
+
+reporter = StatsReporter(collect_stats).start() if identity is not None else None
 
-print(f"🚀 Week 5 Bridge & Alerter is LIVE on {MQTT_TOPIC}")
+print(f"🚀 Week 5 Bridge & Alerter is LIVE on {subscription} (ingest mode: {INGEST_MODE})")
 print("Press Ctrl+C to stop the bridge.")
-client.loop_forever()
\ No newline at end of file
+try:
+    client.loop_forever()
+except KeyboardInterrupt:
+    print("\n🛑 Stopping the bridge...")
+finally:
+    if compressor is not None:
+        # The last point of every device's line is still held back: hand it to the writer
+        release_stop.set()
+        with compress_lock:
+            held = compressor.flush()
+        for item in held:
+            writer.submit(item[1], item[0], *item[2:])
+        print(f"🗜️ Compression stats: {compressor.stats}")
+    if writer is not None:
+        # Clean Drain: flush everything still buffered (held points included) before exiting
+        writer.stop()
+        print(f"📦 Batch writer stats: {writer.stats()}")
+    if RELIABLE:
+        # Send the acknowledgements of the last commits before leaving the session
+        client.loop(timeout=1.0)
+    client.disconnect()
+    # Score what is still queued, then send any digest still waiting in the alert window
+    anomalies.stop()
+    alerts.stop()
+    if replayer is not None:
+        replayer.stop()
+        spool.close()
+        print(f"💾 Spool stats: {spool.stats} | replay: {replayer.stats} | pending bytes: {spool.pending_bytes()}")
+    if reporter is not None:
+        reporter.stop()  # Final numbers for the supervisor
+    if maintenance is not None:
+        maintenance.stop()
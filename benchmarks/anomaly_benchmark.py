@@ -0,0 +1,100 @@
+"""
+Anomaly Benchmark: per-message Python checks vs. the vectorized NumPy engine.
+
+Simulates a fleet publishing readings and scores them two ways on one core:
+a scalar loop with the same per-device EWMA/z-score/rate state kept in dicts
+(what on_message would do), and AnomalyEngine.evaluate() on micro-batches.
+
+Example:
+    python benchmarks/anomaly_benchmark.py --devices 20000 --readings 400000 --output benchmarks/results/anomaly.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from twin_lab.anomaly import AnomalyEngine, load_rules
+
+RULE = load_rules(z_limit=4.0, rate_limit=2.0)["*"]
+
+
+def make_readings(devices, count):
+    names = [f"bench-{i:06d}" for i in range(devices)]
+    return [(names[i % devices], round(24 + random.gauss(0, 1.5), 2), i * 0.001) for i in range(count)]
+
+
+def scalar_check(readings):
+    """The per-message baseline: one dict lookup and a handful of float ops per reading."""
+    state = {}
+    flagged = 0
+    alpha, z_limit, warmup, rate_limit = RULE["alpha"], RULE["z_limit"], RULE["warmup"], RULE["rate_limit"]
+    for device, temp, ts in readings:
+        s = state.get(device)
+        if s is None:
+            state[device] = [1, temp, 0.0, temp, ts]
+            flagged += temp > RULE["threshold"]
+            continue
+        n, mean, var, last, last_ts = s
+        std = math.sqrt(var)
+        z = (temp - mean) / std if n >= warmup and std > 0 else 0.0
+        rate = (temp - last) / (ts - last_ts) if ts > last_ts else 0.0
+        flagged += temp > RULE["threshold"] or abs(z) > z_limit or abs(rate) > rate_limit
+        diff = temp - mean
+        step = alpha * diff
+        s[:] = [n + 1, mean + step, (1 - alpha) * (var + diff * step), temp, ts]
+    return flagged
+
+
+def vectorized_check(readings, batch_size):
+    engine = AnomalyEngine(load_rules(z_limit=4.0, rate_limit=2.0))
+    flagged = 0
+    for start in range(0, len(readings), batch_size):
+        devices, temps, timestamps = zip(*readings[start:start + batch_size])
+        flagged += int((engine.evaluate(devices, temps, timestamps).flags > 0).sum())
+    return flagged
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    flagged = fn(*args)
+    return time.perf_counter() - started, flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare scalar and vectorized anomaly scoring.")
+    parser.add_argument("--devices", type=int, default=20000)
+    parser.add_argument("--readings", type=int, default=400000)
+    parser.add_argument("--batch-sizes", default="500,5000,20000", help="Comma-separated micro-batch sizes")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    print(f"⏱️  Scoring {args.readings} readings from {args.devices} devices...")
+    readings = make_readings(args.devices, args.readings)
+    elapsed, flagged = timed(scalar_check, readings)
+    results = [{"method": "scalar", "readings_per_s": round(len(readings) / elapsed, 1), "flagged": flagged}]
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        elapsed, flagged = timed(vectorized_check, readings, batch_size)
+        results.append({"method": "vectorized", "batch_size": batch_size,
+                        "readings_per_s": round(len(readings) / elapsed, 1), "flagged": flagged})
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {"devices": args.devices, "readings": args.readings},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
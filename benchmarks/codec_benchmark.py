@@ -0,0 +1,83 @@
+"""
+Codec Benchmark: JSON vs. the 14-byte binary format, without a broker or database.
+
+Measures what the bridge pays per reading before it ever talks to PostgreSQL:
+bytes on the wire, validating one message in on_message (decode_reading) and
+turning a flushed batch into JSONB text (jsonb_texts).
+
+Example:
+    python benchmarks/codec_benchmark.py --messages 200000 --output benchmarks/results/codec.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from twin_lab.codec import decode_reading, encode_binary, jsonb_texts, msgspec
+
+BATCH_SIZE = 500  # Same as the bridge's default BATCH_SIZE
+
+
+def make_readings(count):
+    readings = []
+    for i in range(count):
+        temp = round(24 + 6 * math.sin(i / 60) + random.uniform(-0.3, 0.3), 2)
+        hum = round(45 + random.uniform(-5, 5), 1)
+        readings.append((temp, hum, i // 2))
+    return readings
+
+
+def timed(label, messages, fn):
+    """Runs fn once and returns {label}_msgs_per_s."""
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    return {f"{label}_msgs_per_s": round(messages / elapsed, 1) if elapsed else None}
+
+
+def run(count):
+    readings = make_readings(count)
+    payloads = {
+        "json": [json.dumps({"temp": t, "hum": h, "uptime": u}).encode() for t, h, u in readings],
+        "binary": [encode_binary(t, h, u) for t, h, u in readings],
+    }
+
+    results = []
+    for fmt, raw in payloads.items():
+        batches = [raw[i:i + BATCH_SIZE] for i in range(0, len(raw), BATCH_SIZE)]
+        result = {"format": fmt, "avg_bytes": round(sum(map(len, raw)) / len(raw), 1)}
+        result.update(timed("validate", len(raw), lambda: [decode_reading(p) for p in raw]))
+        result.update(timed("to_jsonb", len(raw), lambda: [jsonb_texts(b) for b in batches]))
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the JSON and binary payload codecs.")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    print(f"⏱️  Decoding {args.messages} readings per format...")
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "msgspec": msgspec is not None,
+        "params": {"messages": args.messages, "batch_size": BATCH_SIZE},
+        "results": run(args.messages),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compression Benchmark: how many rows deadband and swinging-door compression keep.
+
+Simulates devices reporting every 2 seconds (a slow daily swing, sensor noise,
+flat stretches and the odd step change), runs every reading through
+twin_lab.compression.Compressor, then redraws each device's signal from the
+kept points and measures the worst error against the original readings.
+
+Example:
+    python benchmarks/compression_benchmark.py --devices 50 --hours 24 --errors 0.05,0.1,0.25
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from twin_lab.compression import Compressor
+
+INTERVAL = 2.0  # Seconds between readings, like the ESP32 sketches
+
+
+def make_signal(hours, seed):
+    """One device's (timestamps, temps): daily swing + noise, a flat night and a few step changes."""
+    rng = random.Random(seed)
+    phase, noise = rng.uniform(0, 2 * math.pi), rng.uniform(0.01, 0.05)
+    steps = {rng.randrange(int(hours * 3600 / INTERVAL)): rng.uniform(-3, 3) for _ in range(3)}
+    offset, ts, temps = 0.0, [], []
+    for i in range(int(hours * 3600 / INTERVAL)):
+        t = i * INTERVAL
+        offset += steps.get(i, 0.0)
+        swing = 4 * math.sin(2 * math.pi * t / 86400 + phase)
+        flat = (t % 86400) > 64800  # The last 6 hours of each day hold still (a closed room)
+        temps.append(round(22 + offset + (4 * math.sin(phase) if flat else swing) + rng.gauss(0, noise), 2))
+        ts.append(t)
+    return ts, temps
+
+
+def run(mode, error, heartbeat, signals):
+    import numpy as np
+
+    compressor = Compressor(mode, error, heartbeat)
+    worst = 0.0
+    started = time.perf_counter()
+    for device, (ts, temps) in enumerate(signals):
+        kept = []
+        for t, temp in zip(ts, temps):
+            kept.extend(compressor.offer(device, t, temp, (t, temp))[0])
+        kept.extend(item for item in compressor.flush())
+        kept.sort()
+        kept_t, kept_v = np.array(kept).T
+        if mode == "deadband":  # Redrawn as steps: each reading takes the last stored value
+            redrawn = kept_v[np.searchsorted(kept_t, ts, side="right") - 1]
+        else:                   # Redrawn as straight lines between the stored points
+            redrawn = np.interp(ts, kept_t, kept_v)
+        worst = max(worst, float(np.abs(redrawn - np.array(temps)).max()))
+    elapsed = time.perf_counter() - started
+    return {"mode": mode, "error": error, "readings": compressor.stats["offered"], "rows": compressor.stats["kept"],
+            "ratio": compressor.stats["ratio"], "worst_error": round(worst, 4),
+            "readings_per_s": round(compressor.stats["offered"] / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure deadband and swinging-door compression.")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--errors", default="0.05,0.1,0.25", help="Comma-separated error bounds in °C")
+    parser.add_argument("--heartbeat", type=float, default=300.0)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    print(f"⏱️  Compressing {args.hours:g} h of 2-second readings from {args.devices} devices...")
+    signals = [make_signal(args.hours, seed) for seed in range(args.devices)]
+    results = [run(mode, float(error), args.heartbeat, signals)
+               for error in args.errors.split(",") for mode in ("deadband", "swinging_door")]
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {"devices": args.devices, "hours": args.hours, "heartbeat": args.heartbeat},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
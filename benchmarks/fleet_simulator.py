@@ -0,0 +1,134 @@
+"""
+Fleet Simulator: pretends to be thousands of ESP32 Digital Twins.
+
+Each virtual device publishes the Week 5/6 JSON payload (temp, hum, uptime), or
+the same reading in the 14-byte binary format, on its own namespace (edu/iot/temp/<device>) at a fixed total rate. The load is
+spread over several processes, each with one MQTT connection.
+
+Example (local broker, 2,000 devices, 1,000 msgs/s for 30 seconds):
+    python benchmarks/fleet_simulator.py --devices 2000 --rate 1000 --duration 30
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from twin_lab.codec import encode_binary
+
+# --- SETTINGS ---
+DEFAULT_BROKER = "localhost"
+DEFAULT_TOPIC_TEMPLATE = "edu/iot/temp/{device}"
+
+
+def device_names(count):
+    return [f"twin{i:05d}" for i in range(count)]
+
+
+def make_payload(fmt, device_index, started, run_id):
+    """Builds one reading. JSON payloads carry 'sent_at' so latency can be measured in SQL."""
+    now = time.time()
+    # A gentle, per-device sine wave with noise looks like a real DHT22 on a desk
+    temp = round(24 + 6 * math.sin(now / 60 + device_index) + random.uniform(-0.3, 0.3), 2)
+    if fmt == "plain":
+        return str(temp)  # Week 3 bridge.py expects a bare number
+    if fmt == "binary":
+        # 14 bytes on the wire; there is no room for 'sent_at', so latency is not measured
+        return encode_binary(temp, round(45 + random.uniform(-5, 5), 1), int(now - started))
+    return json.dumps({
+        "temp": temp,
+        "hum": round(45 + random.uniform(-5, 5), 1),
+        "uptime": int(now - started),
+        "sent_at": now,
+        "bench": run_id,
+    })
+
+
+def _publisher(broker, port, devices, rate, duration, fmt, topic_template, run_id, results):
+    """One simulator process: publishes for its share of devices at its share of the rate."""
+    client = mqtt.Client(CallbackAPIVersion.VERSION2)
+    client.max_queued_messages_set(0)  # Unlimited: we measure the bridge, not the simulator's buffer
+    client.connect(broker, port, 60)
+    client.loop_start()
+
+    started = time.time()
+    spacing = 1.0 / rate
+    clock_start = time.monotonic()
+    sent = 0
+    last_info = None
+    while True:
+        due = clock_start + sent * spacing
+        if due - clock_start >= duration:
+            break
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        index, device = devices[sent % len(devices)]
+        topic = topic_template.format(device=device)
+        last_info = client.publish(topic, make_payload(fmt, index, started, run_id))
+        sent += 1
+
+    if last_info is not None:
+        last_info.wait_for_publish(timeout=30)
+    elapsed = time.monotonic() - clock_start
+    client.loop_stop()
+    client.disconnect()
+    results.put({"sent": sent, "elapsed": elapsed})
+
+
+def simulate(devices=1000, rate=500.0, duration=30.0, broker=DEFAULT_BROKER, port=1883,
+             fmt="json", topic_template=DEFAULT_TOPIC_TEMPLATE, processes=None, run_id=""):
+    """Runs the fleet and returns {'sent', 'elapsed', 'publish_rate'}."""
+    names = list(enumerate(device_names(devices)))
+    # Rule of thumb: one publisher process per ~5,000 msgs/s keeps the simulator off the critical path
+    processes = processes or max(1, min(multiprocessing.cpu_count(), math.ceil(rate / 5000)))
+    processes = min(processes, devices)
+
+    results = multiprocessing.Queue()
+    workers = []
+    for p in range(processes):
+        share = names[p::processes]
+        worker = multiprocessing.Process(
+            target=_publisher,
+            args=(broker, port, share, rate / processes, duration, fmt, topic_template, run_id, results),
+        )
+        worker.start()
+        workers.append(worker)
+
+    reports = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    sent = sum(r["sent"] for r in reports)
+    elapsed = max(r["elapsed"] for r in reports)
+    return {"sent": sent, "elapsed": round(elapsed, 3), "publish_rate": round(sent / elapsed, 1) if elapsed else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of ESP32 Digital Twins over MQTT.")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=500.0, help="Total messages per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to publish")
+    parser.add_argument("--broker", default=DEFAULT_BROKER)
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--format", dest="fmt", choices=["json", "binary", "plain"], default="json")
+    parser.add_argument("--topic-template", default=DEFAULT_TOPIC_TEMPLATE)
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args()
+
+    print(f"🛰️ Simulating {args.devices} twins at {args.rate} msgs/s for {args.duration}s on {args.broker}...")
+    result = simulate(args.devices, args.rate, args.duration, args.broker, args.port, args.fmt,
+                      args.topic_template, args.processes)
+    print(f"✅ Published {result['sent']} messages ({result['publish_rate']} msgs/s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+End-to-End Ingest Benchmark: simulator -> local broker -> bridge -> local Postgres.
+
+For each bridge target it starts the bridge, drives it with the fleet simulator,
+waits for the database to catch up and reports JSON with sustained msgs/s,
+p50/p99 publish-to-commit latency, DB rows/s, CPU seconds and peak RSS.
+
+Prerequisites: a local broker (e.g. `mosquitto -p 1883`), the lab database with
+the Week 3 and Week 5 tables, and a .env file with the DB_* credentials.
+
+Examples:
+    python benchmarks/ingest_benchmark.py --targets bridge_v2 bridge_v3_batch --rate 2000 --output results/today.json
+    python benchmarks/ingest_benchmark.py --compare results/before.json results/after.json
+"""
+import argparse
+import json
+import os
+import platform
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fleet_simulator import simulate
+from twin_lab.config import config
+from twin_lab.db import get_pool
+
+try:
+    import psutil  # Optional: CPU and memory numbers are skipped without it
+except ImportError:
+    psutil = None
+
+# --- BENCHMARK TARGETS ---
+# format: what the bridge expects on the wire; topic: where the simulator publishes
+TARGETS = {
+    "bridge": {"script": "Week-3/bridge.py", "format": "plain", "topic": "edu/iot/temp", "table": "sensor_data"},
+    "bridge_v2": {"script": "Week-5/bridge_v2.py", "format": "json", "topic": "edu/iot/temp"},
+    "bridge_v3": {"script": "Week-6/bridge_v3.py", "format": "json", "topic": "edu/iot/temp/student01",
+                  "env": {"INGEST_MODE": "direct"}},
+    "bridge_v3_batch": {"script": "Week-6/bridge_v3.py", "format": "json", "topic": "edu/iot/temp/student01",
+                        "env": {"INGEST_MODE": "batch"}},
+    "bridge_v3_spool": {"script": "Week-6/bridge_v3.py", "format": "json", "topic": "edu/iot/temp/student01",
+                        "env": {"INGEST_MODE": "spool", "SPOOL_DIR": "bench_spool"}},
+    "bridge_v3_binary": {"script": "Week-6/bridge_v3.py", "format": "binary", "topic": "edu/iot/temp/benchbin",
+                         "env": {"INGEST_MODE": "batch"}},
+    "bridge_v3_fleet": {"script": "Week-6/bridge_v3.py", "format": "json", "topic": "edu/iot/temp/{device}",
+                        "env": {"INGEST_MODE": "batch", "BRIDGE_WORKERS": "4", "STATS_DIR": "bench_stats"}},
+}
+
+SCHEMA = "edu_iot_digital_twin_lab"
+WARMUP_SECONDS = 3.0   # Time for the bridge to connect and subscribe
+DRAIN_TIMEOUT = 60.0   # Max seconds to wait for the database to catch up after publishing
+SAMPLE_INTERVAL = 0.5  # CPU/RSS sampling period
+
+
+# --- 1. DATABASE PROBES ---
+def query_one(sql, params=()):
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchone()
+
+
+def count_rows(target, run_id, since):
+    if target.get("table") == "sensor_data":
+        # Plain numbers carry no run tag, so count by insert time instead
+        return query_one(f"SELECT COUNT(*) FROM {SCHEMA}.sensor_data WHERE aud_insert_ts >= %s", (since,))[0]
+    if target["format"] == "binary":
+        # Binary readings carry no run tag either: count the benchmark device's rows since the start
+        return query_one(f"SELECT COUNT(*) FROM {SCHEMA}.smart_sensor_data WHERE sensor_id = %s AND aud_insert_ts >= %s",
+                         (_device(target), since))[0]
+    return query_one(f"SELECT COUNT(*) FROM {SCHEMA}.smart_sensor_data WHERE payload->>'bench' = %s", (run_id,))[0]
+
+
+def commit_stats(target, run_id):
+    """Latency (publish -> row timestamp) percentiles and the first/last commit times."""
+    if target.get("table") == "sensor_data" or target["format"] == "binary":
+        return {}
+    row = query_one(f"""
+        SELECT
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY lat),
+            percentile_cont(0.99) WITHIN GROUP (ORDER BY lat),
+            MIN(committed), MAX(committed)
+        FROM (
+            SELECT EXTRACT(EPOCH FROM aud_insert_ts) - (payload->>'sent_at')::float AS lat,
+                   EXTRACT(EPOCH FROM aud_insert_ts) AS committed
+            FROM {SCHEMA}.smart_sensor_data
+            WHERE payload->>'bench' = %s
+        ) t
+    """, (run_id,))
+    if row[0] is None:
+        return {}
+    return {"p50_latency_ms": round(row[0] * 1000, 2), "p99_latency_ms": round(row[1] * 1000, 2),
+            "commit_window_s": round(row[3] - row[2], 3)}
+
+
+def cleanup(target, run_id, since):
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            if target.get("table") == "sensor_data":
+                cur.execute(f"DELETE FROM {SCHEMA}.sensor_data WHERE aud_insert_ts >= %s", (since,))
+            elif target["format"] == "binary":
+                cur.execute(f"DELETE FROM {SCHEMA}.smart_sensor_data WHERE sensor_id = %s AND aud_insert_ts >= %s",
+                            (_device(target), since))
+            else:
+                cur.execute(f"DELETE FROM {SCHEMA}.smart_sensor_data WHERE payload->>'bench' = %s", (run_id,))
+
+
+def _device(target):
+    return target["topic"].rsplit("/", 1)[-1]
+
+
+# --- 2. RESOURCE SAMPLING ---
+class ResourceSampler:
+    """Samples CPU time and RSS of the bridge process and all of its children."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak_rss = 0
+        self.cpu_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if psutil is not None:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if psutil is None:
+            return {"cpu_seconds": None, "peak_rss_mb": None}
+        return {"cpu_seconds": round(self.cpu_seconds, 2), "peak_rss_mb": round(self.peak_rss / 1e6, 1)}
+
+    def _run(self):
+        cpu_by_pid = {}
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            try:
+                parent = psutil.Process(self.pid)
+                procs = [parent] + parent.children(recursive=True)
+            except psutil.Error:
+                return
+            rss = 0
+            for proc in procs:
+                try:
+                    times = proc.cpu_times()
+                    cpu_by_pid[proc.pid] = times.user + times.system
+                    rss += proc.memory_info().rss
+                except psutil.Error:
+                    continue
+            self.cpu_seconds = sum(cpu_by_pid.values())
+            self.peak_rss = max(self.peak_rss, rss)
+
+
+# --- 3. ONE BENCHMARK RUN ---
+def run_target(name, args):
+    target = TARGETS[name]
+    run_id = f"{name}-{uuid.uuid4().hex[:8]}"
+    since = query_one("SELECT NOW()")[0]
+
+    env = dict(os.environ, MQTT_BROKER=args.broker, MQTT_PORT=str(args.port), **target.get("env", {}))
+    if "{device}" not in target["topic"]:
+        env["MQTT_TOPIC"] = target["topic"]
+    bridge = subprocess.Popen([sys.executable, os.path.join(ROOT, target["script"])], env=env,
+                              stdout=subprocess.DEVNULL if not args.verbose else None)
+    sampler = ResourceSampler(bridge.pid).start()
+    time.sleep(WARMUP_SECONDS)
+
+    print(f"⏱️  {name}: {args.devices} twins at {args.rate} msgs/s for {args.duration}s...")
+    published = simulate(args.devices, args.rate, args.duration, args.broker, args.port,
+                         target["format"], target["topic"], run_id=run_id)
+
+    # Drain: wait until every message is stored or the row count stops moving
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    stored, last_change, previous = 0, time.monotonic(), -1
+    while time.monotonic() < deadline:
+        stored = count_rows(target, run_id, since)
+        if stored >= published["sent"]:
+            break
+        if stored != previous:
+            previous, last_change = stored, time.monotonic()
+        elif time.monotonic() - last_change > 5:
+            break
+        time.sleep(0.5)
+
+    resources = sampler.stop()
+    bridge.send_signal(signal.SIGINT if os.name == "posix" else signal.SIGTERM)
+    try:
+        bridge.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        bridge.kill()
+
+    latency = commit_stats(target, run_id)
+    window = latency.get("commit_window_s") or published["elapsed"]
+    result = {
+        "target": name,
+        "sent": published["sent"],
+        "stored": stored,
+        "loss_pct": round(100 * (1 - stored / published["sent"]), 3) if published["sent"] else 0.0,
+        "publish_rate": published["publish_rate"],
+        "sustained_msgs_per_s": round(stored / published["elapsed"], 1) if published["elapsed"] else 0.0,
+        "db_rows_per_s": round(stored / window, 1) if window else 0.0,
+        **{k: v for k, v in latency.items() if k != "commit_window_s"},
+        **resources,
+    }
+    if resources.get("cpu_seconds") and stored:
+        result["cpu_ms_per_msg"] = round(1000 * resources["cpu_seconds"] / stored, 4)
+
+    if not args.keep_rows:
+        cleanup(target, run_id, since)
+    return result
+
+
+# --- 4. COMPARING RUNS ---
+def compare(before_path, after_path):
+    """Prints the change of every metric between two result files."""
+    with open(before_path) as f:
+        before = {r["target"]: r for r in json.load(f)["results"]}
+    with open(after_path) as f:
+        after = {r["target"]: r for r in json.load(f)["results"]}
+
+    for name in sorted(set(before) & set(after)):
+        print(f"\n📊 {name}")
+        for key, new in after[name].items():
+            old = before[name].get(key)
+            if isinstance(new, (int, float)) and isinstance(old, (int, float)) and old:
+                print(f"  {key:<22} {old:>12} -> {new:>12}  ({100 * (new - old) / old:+.1f}%)")
+
+
+def main():
+    config.load()
+    parser = argparse.ArgumentParser(description="Benchmark the IoT bridges end to end.")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=["bridge_v2", "bridge_v3_batch"])
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=500.0, help="Total messages per second")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--keep-rows", action="store_true", help="Leave benchmark rows in the database")
+    parser.add_argument("--verbose", action="store_true", help="Show the bridge's own output")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "params": {"devices": args.devices, "rate": args.rate, "duration": args.duration},
+        "results": [run_target(name, args) for name in args.targets],
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Startup Benchmark: how long each entry point spends importing before it does any work.
+
+For every script it collects the module-level imports (the ones that run on
+startup; imports inside functions are lazy and not counted), runs them in a
+fresh interpreter with `python -X importtime`, and reports the median import
+time plus the heaviest packages. Nothing is connected to and no script is started.
+
+Examples:
+    python benchmarks/startup_benchmark.py --output benchmarks/results/startup.json
+    python benchmarks/startup_benchmark.py --baseline benchmarks/results/startup.json   # exit 1 on a regression
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# --- ENTRY POINTS ---
+TARGETS = {
+    "bridge": "Week-3/bridge.py",
+    "bridge_v2": "Week-5/bridge_v2.py",
+    "bridge_v3": "Week-6/bridge_v3.py",
+    "analytics": "Week-4/analytics.py",
+    "dashboard": "Week-4/Bonus/dashboard.py",
+    "dashboard_v2": "Week-5/Bonus/dashboard_v2.py",
+    "dashboard_v3": "Week-6/dashboard_v3.py",
+    "schema": "twin_lab/schema.py",
+    "archive": "twin_lab/archive.py",
+    "backfill": "twin_lab/backfill.py",
+}
+DEFAULT_TOLERANCE = 0.25  # A target regresses when it is 25% slower than the baseline...
+NOISE_FLOOR_MS = 5.0      # ...and at least this many milliseconds slower
+
+
+def startup_imports(path):
+    """The import statements a script runs at startup (module level, including inside top-level try/if)."""
+    with open(os.path.join(ROOT, path)) as f:
+        tree = ast.parse(f.read())
+    found, pending = [], list(tree.body)
+    while pending:
+        node = pending.pop(0)
+        if isinstance(node, ast.ImportFrom) and node.module == "__future__":
+            continue
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            found.append(ast.unparse(node))
+        elif isinstance(node, ast.Try):
+            pending[:0] = node.body
+        elif isinstance(node, ast.If) and "__main__" not in ast.unparse(node.test):
+            pending[:0] = node.body + node.orelse
+    return found
+
+
+def _importtime(code):
+    """Runs `code` in a fresh interpreter. Returns (seconds spent in it, {top-level module: cumulative µs})."""
+    probe = f"import sys, time; sys.path.insert(0, {ROOT!r}); _t = time.perf_counter()\n{code}\n" \
+            "print(time.perf_counter() - _t)"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], capture_output=True, text=True,
+                            cwd=ROOT)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "):  # Top level only: nested imports are inside their parent's time
+            modules[name.strip()] = int(cumulative)
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+
+def measure(path, repeat):
+    code = "\n".join(startup_imports(path))
+    _, interpreter = _importtime("pass")  # site, encodings, ...: paid by every script alike
+    runs = [_importtime(code) for _ in range(repeat)]
+    seconds = statistics.median(s for s, _ in runs)
+    modules = {name: us for name, us in runs[-1][1].items() if name not in interpreter}
+    heaviest = sorted(modules.items(), key=lambda item: -item[1])[:5]
+    return {"import_ms": round(1000 * seconds, 1), "heaviest": [[name, round(us / 1000, 1)] for name, us in heaviest]}
+
+
+def compare(baseline, results, tolerance):
+    """Prints before/after per target. Returns the names that regressed."""
+    regressed = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name, {}).get("import_ms")
+        after = result.get("import_ms")
+        if before is None or after is None:
+            continue
+        slower = after - before > max(tolerance * before, NOISE_FLOOR_MS)
+        print(f"  {'❌' if slower else '✅'} {name:<14} {before:>8.1f} ms -> {after:>8.1f} ms")
+        if slower:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import (cold start) time of every entry point.")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=list(TARGETS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--baseline", help="Compare with an earlier report and exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    print(f"⏱️  Measuring startup imports ({args.repeat} runs each)...")
+    results = {}
+    for name in args.targets:
+        try:
+            results[name] = measure(TARGETS[name], args.repeat)
+            heaviest = ", ".join(f"{module} {ms} ms" for module, ms in results[name]["heaviest"][:3])
+            print(f"  {name:<14} {results[name]['import_ms']:>8.1f} ms   ({heaviest})")
+        except RuntimeError as e:
+            results[name] = {"error": str(e)}  # e.g. streamlit not installed in this environment
+            print(f"  {name:<14} skipped: {e}")
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressed = compare(json.load(f), results, args.tolerance)
+        if regressed:
+            print(f"❌ Startup regressed: {', '.join(regressed)}")
+            sys.exit(1)
+        print("✅ No startup regressions.")
+
+
+if __name__ == "__main__":
+    main()
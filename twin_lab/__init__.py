@@ -0,0 +1,6 @@
+"""
+twin_lab: shared building blocks for the IoT Digital Twin Lab scripts.
+
+The weekly labs (bridge, analytics, dashboards) import these modules so the
+"production" features live in one place instead of being copy-pasted.
+"""
@@ -0,0 +1,185 @@
+import queue
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+from twin_lab.config import config
+# --- SETTINGS ---
+# Industry Standard: Never let a slow mail server block the data pipeline
+DEFAULT_COOLDOWN = 300.0     # Seconds before the same device may alert again
+DEFAULT_HYSTERESIS = 1.0     # Degrees the temp must fall below the threshold to re-arm
+DEFAULT_DIGEST_WINDOW = 30.0 # Breaches arriving within this window share one email
+
+_STOP = object()
+
+
+class AlertDispatcher:
+    """
+    Sends threshold alerts from a background thread over one long-lived SMTP session.
+
+    on_message() calls observe() for every reading (or the anomaly engine calls
+    raise_alarm()/clear() for the readings it flagged). That call only updates a
+    small per-device state machine and, on a fresh breach, queues an event:
+
+    * Hysteresis: after alerting, a device re-arms only once its temperature
+      drops below (threshold - hysteresis), so readings hovering around the
+      limit do not flap.
+    * Cooldown: a re-armed device still waits `cooldown` seconds between alerts.
+    * Digest: every breach queued within `digest_window` is merged into one email.
+
+    SMTP settings come from the .env file. To test locally, run a debug server
+    (`python -m aiosmtpd -n -l localhost:1025`) and set SMTP_HOST=localhost,
+    SMTP_PORT=1025, SMTP_SSL=0.
+    """
+
+    def __init__(self, threshold, cooldown=DEFAULT_COOLDOWN, hysteresis=DEFAULT_HYSTERESIS,
+                 digest_window=DEFAULT_DIGEST_WINDOW, smtp_host=None, smtp_port=None, use_ssl=None,
+                 sender=None, password=None, receiver=None):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.hysteresis = hysteresis
+        self.digest_window = digest_window
+
+        self.smtp_host = smtp_host or config.get("SMTP_HOST", "smtp.gmail.com")
+        self.smtp_port = smtp_port or config.get_int("SMTP_PORT", 465)
+        self.use_ssl = use_ssl if use_ssl is not None else config.get("SMTP_SSL", "1") != "0"
+        self.sender = sender or config.get("EMAIL_SENDER")
+        self.password = password if password is not None else config.get("EMAIL_PASSWORD")
+        self.receiver = receiver or config.get("EMAIL_RECEIVER")
+
+        self._devices = {}  # device -> {"armed": bool, "last_alert": monotonic seconds}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._smtp = None
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self.stats = {"breaches": 0, "suppressed": 0, "emails_sent": 0, "email_failures": 0, "reconnects": 0}
+
+    # --- 1. PUBLIC API ---
+    def start(self):
+        self._thread.start()
+        return self
+
+    def observe(self, device, temp):
+        """Feeds one reading to the fixed-threshold check. Returns True if it raised a new alert."""
+        if temp <= self.threshold - self.hysteresis:
+            self.clear(device)
+            return False
+        if temp <= self.threshold:
+            return False
+        return self.raise_alarm(device, temp)
+
+    def raise_alarm(self, device, temp, reason="threshold"):
+        """Reports a breach detected elsewhere (e.g. the anomaly engine). Returns True if it raised a new alert."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._devices.setdefault(device, {"armed": True, "last_alert": None})
+            if not state["armed"]:
+                return False
+
+            self.stats["breaches"] += 1
+            if state["last_alert"] is not None and now - state["last_alert"] < self.cooldown:
+                self.stats["suppressed"] += 1
+                return False
+
+            state["armed"] = False
+            state["last_alert"] = now
+
+        self._queue.put((device, temp, time.strftime("%Y-%m-%d %H:%M:%S"), reason))
+        return True
+
+    def clear(self, device):
+        """The device is back to normal: re-arm it."""
+        with self._lock:
+            state = self._devices.get(device)
+            if state is not None:
+                state["armed"] = True
+
+    def stop(self, timeout=10.0):
+        """Sends any pending digest, then closes the SMTP session."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    # --- 2. THE DISPATCHER THREAD ---
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            events = [first]
+
+            # Coalescing: keep collecting until the digest window closes
+            deadline = time.monotonic() + self.digest_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stopping = True
+                    break
+                events.append(event)
+
+            self._send(self._build_digest(events))
+        self._disconnect()
+
+    def _build_digest(self, events):
+        msg = EmailMessage()
+        hottest = max(temp for _, temp, _, _ in events)
+        if len(events) == 1:
+            device, temp, _, _ = events[0]
+            msg['Subject'] = f"IOT CRITICAL ALERT: {temp}°C on {device}"
+        else:
+            msg['Subject'] = f"IOT CRITICAL ALERT: {len(events)} breaches (max {hottest}°C)"
+
+        lines = [f"🚨 ALERT: Your Digital Twin fleet needs attention (limit {self.threshold}°C).", ""]
+        for device, temp, seen_at, reason in events:
+            lines.append(f"  {seen_at}  {device}: {temp}°C ({reason})")
+        msg.set_content("\n".join(lines))
+        msg['From'] = self.sender
+        msg['To'] = self.receiver
+        return msg
+
+    # --- 3. THE PERSISTENT SMTP SESSION ---
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = smtp_class(self.smtp_host, self.smtp_port, timeout=30)
+        if self.password:
+            smtp.login(self.sender, self.password)
+        self._smtp = smtp
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _send(self, msg):
+        # Try the open session first; if the server dropped us, reconnect once and retry
+        for attempt in range(2):
+            try:
+                if self._smtp is None:
+                    self._connect()
+                    if attempt:
+                        self.stats["reconnects"] += 1
+                self._smtp.send_message(msg)
+                self.stats["emails_sent"] += 1
+                print(f"📧 Email alert sent: {msg['Subject']}")
+                return True
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPSenderRefused, OSError) as e:
+                self._disconnect()
+                error = e
+            except Exception as e:
+                self._disconnect()
+                error = e
+                break
+        self.stats["email_failures"] += 1
+        print(f"❌ Email failed to send: {error}")
+        return False
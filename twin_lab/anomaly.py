@@ -0,0 +1,294 @@
+import fnmatch
+import json
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from twin_lab.config import config
+from twin_lab.logs import get_logger
+from twin_lab.metrics import lap
+
+# --- SETTINGS ---
+# Industry Standard: Score readings in bulk. One NumPy operation over a whole micro-batch
+# replaces thousands of per-message `if temp > limit` checks, and every device keeps its own context.
+FLAG_THRESHOLD = 1   # Above the group's fixed limit
+FLAG_ZSCORE = 2      # Far from the device's own recent normal (EWMA mean/std)
+FLAG_RATE = 4        # Changing faster than physically plausible (°C per second)
+REASONS = ((FLAG_THRESHOLD, "threshold"), (FLAG_ZSCORE, "z-score"), (FLAG_RATE, "rate of change"))
+
+# A rule per device group. z_limit / rate_limit of 0 switch those checks off.
+DEFAULT_RULE = {
+    "threshold": 30.0,   # °C, same as ALARM_THRESHOLD
+    "hysteresis": 1.0,   # °C below the threshold before the alarm ends
+    "alpha": 0.05,       # EWMA weight of the newest reading (~ the last 20 readings)
+    "z_limit": 0.0,      # |z| above this is an anomaly
+    "warmup": 30,        # Readings before a device's z-score is trusted
+    "rate_limit": 0.0,   # |°C per second| above this is an anomaly
+}
+DEFAULT_CAPACITY = 1024       # Devices before the state arrays grow (they double as needed)
+DEFAULT_BATCH_SIZE = 5000     # Score as soon as this many readings are waiting...
+DEFAULT_MAX_AGE = 0.2         # ...or when the oldest waiting reading is this many seconds old
+DEFAULT_QUEUE_SIZE = 100000
+
+Verdicts = namedtuple("Verdicts", "flags zscores rates cleared")
+
+_STATE = (("group", "int32"), ("count", "int64"), ("mean", "float64"), ("var", "float64"),
+          ("last", "float64"), ("last_ts", "float64"), ("hot", "bool"), ("alarm", "bool"))
+_STOP = object()
+
+
+def load_rules(path=None, **defaults):
+    """
+    Reads {device pattern: rule} from a JSON file (path or ANOMALY_RULES).
+
+    Patterns use shell wildcards ("greenhouse-*") and the first match wins.
+    Fields a rule leaves out come from DEFAULT_RULE (updated with `defaults`),
+    and a catch-all "*" group is added at the end if the file has none.
+    """
+    base = dict(DEFAULT_RULE, **defaults)
+    path = path or config.get("ANOMALY_RULES")
+    rules = {}
+    if path:
+        with open(path) as f:
+            for pattern, rule in json.load(f).items():
+                unknown = set(rule) - set(DEFAULT_RULE)
+                if unknown:
+                    raise ValueError(f"Unknown anomaly rule field(s) for {pattern!r}: {sorted(unknown)}")
+                rules[pattern] = dict(base, **rule)
+    rules.setdefault("*", base)
+    return rules
+
+
+def describe(flags):
+    """Turns a flag bitmask into text, e.g. 'threshold + rate of change'."""
+    return " + ".join(reason for flag, reason in REASONS if flags & flag)
+
+
+class AnomalyEngine:
+    """
+    Per-device anomaly state in NumPy arrays, indexed by a row number per device.
+
+    evaluate() scores a whole micro-batch at once: fixed threshold (with
+    hysteresis), z-score against an exponentially weighted mean/variance, and
+    rate of change since the device's previous reading. Each device's rule
+    comes from its group, so the rule parameters are arrays too.
+    """
+
+    def __init__(self, rules=None, capacity=DEFAULT_CAPACITY):
+        import numpy as np
+
+        self.rules = rules or load_rules()
+        self.patterns = list(self.rules)
+        self._params = {field: np.array([float(self.rules[p][field]) for p in self.patterns])
+                        for field in DEFAULT_RULE}
+        self._index = {}     # device -> row
+        self.devices = []    # row -> device
+        self._state = {name: np.zeros(capacity, dtype) for name, dtype in _STATE}
+
+    def group_of(self, device):
+        """The pattern whose rule applies to `device`."""
+        return self.patterns[self._state["group"][self._row(device)]]
+
+    def _row(self, device):
+        row = self._index.get(device)
+        if row is None:
+            row = len(self.devices)
+            if row == len(self._state["group"]):
+                self._grow()
+            self._state["group"][row] = next(
+                (i for i, pattern in enumerate(self.patterns) if fnmatch.fnmatchcase(device, pattern)),
+                len(self.patterns) - 1)
+            self._index[device] = row
+            self.devices.append(device)
+        return row
+
+    def _grow(self):
+        import numpy as np
+
+        for name, array in self._state.items():
+            self._state[name] = np.concatenate([array, np.zeros_like(array)])
+
+    def evaluate(self, devices, temps, timestamps=None):
+        """
+        Scores a micro-batch. Returns Verdicts of arrays aligned with the input:
+        flags (bitmask), zscores, rates (°C/s) and cleared (this reading ended the device's alarm).
+
+        A device may appear several times in one batch: its readings are applied
+        in order, one "layer" per occurrence, so the EWMA sees them in sequence.
+        """
+        import numpy as np
+
+        count = len(devices)
+        lookup = self._index.get
+        rows = np.array([lookup(device, -1) for device in devices], dtype=np.int64)
+        for i in np.flatnonzero(rows < 0):  # First sighting of a device: give it a row
+            rows[i] = self._row(devices[i])
+        x = np.asarray(temps, dtype=np.float64)
+        ts = np.full(count, time.time()) if timestamps is None else np.asarray(timestamps, dtype=np.float64)
+        verdicts = Verdicts(np.zeros(count, np.uint8), np.zeros(count), np.zeros(count), np.zeros(count, bool))
+
+        valid = np.flatnonzero(np.isfinite(x))  # Failed sensor reads (None/NaN) are not scored
+        if not len(valid):
+            return verdicts
+
+        # Occurrence number of each reading within its device (0 for the first, 1 for the second...)
+        by_device = valid[np.argsort(rows[valid], kind="stable")]
+        sorted_rows = rows[by_device]
+        starts = np.r_[True, sorted_rows[1:] != sorted_rows[:-1]]
+        positions = np.arange(len(by_device))
+        occurrence = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+
+        layer_order = np.argsort(occurrence, kind="stable")
+        bounds = np.searchsorted(occurrence[layer_order], np.arange(occurrence.max() + 2))
+        for layer in range(len(bounds) - 1):
+            picked = by_device[layer_order[bounds[layer]:bounds[layer + 1]]]
+            self._step(picked, rows[picked], x[picked], ts[picked], verdicts)
+        return verdicts
+
+    def _step(self, picked, rows, x, ts, verdicts):
+        """Scores and absorbs one reading per device (rows are unique here)."""
+        import numpy as np
+
+        state = self._state
+        group = state["group"][rows]
+        threshold, hysteresis, alpha, z_limit, warmup, rate_limit = (
+            self._params[field][group] for field in DEFAULT_RULE)
+        n, mean, var = state["count"][rows], state["mean"][rows], state["var"][rows]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            std = np.sqrt(var)
+            z = np.where((n >= warmup) & (std > 0), (x - mean) / std, 0.0)
+            dt = ts - state["last_ts"][rows]
+            rate = np.where((n > 0) & (dt > 0), (x - state["last"][rows]) / dt, 0.0)
+
+        over = x > threshold
+        flags = (over * FLAG_THRESHOLD
+                 | ((z_limit > 0) & (np.abs(z) > z_limit)) * FLAG_ZSCORE
+                 | ((rate_limit > 0) & (np.abs(rate) > rate_limit)) * FLAG_RATE).astype(np.uint8)
+
+        # Hysteresis: a threshold alarm only ends once the reading drops `hysteresis` below the limit
+        hot = over | (state["hot"][rows] & (x > threshold - hysteresis))
+        alarm = hot | ((flags & (FLAG_ZSCORE | FLAG_RATE)) > 0)
+
+        verdicts.flags[picked] = flags
+        verdicts.zscores[picked] = z
+        verdicts.rates[picked] = rate
+        verdicts.cleared[picked] = state["alarm"][rows] & ~alarm
+
+        # Exponentially weighted mean and variance (the first reading just seeds the mean)
+        first = n == 0
+        diff = x - mean
+        step = alpha * diff
+        state["mean"][rows] = np.where(first, x, mean + step)
+        state["var"][rows] = np.where(first, 0.0, (1 - alpha) * (var + diff * step))
+        state["count"][rows] = n + 1
+        state["last"][rows] = x
+        state["last_ts"][rows] = ts
+        state["hot"][rows] = hot
+        state["alarm"][rows] = alarm
+
+
+class AnomalyMonitor:
+    """
+    Feeds the engine from on_message without slowing it down.
+
+    submit() is a quick queue put. A background thread scores readings in
+    micro-batches and hands only the flagged ones to the AlertDispatcher, which
+    still applies the per-device cooldown and digest emails. With a ShadowStore,
+    each device's shadow also follows its alarm state.
+    """
+
+    def __init__(self, engine, alerts, batch_size=DEFAULT_BATCH_SIZE, max_age=DEFAULT_MAX_AGE,
+                 queue_size=DEFAULT_QUEUE_SIZE, shadows=None):
+        self.engine = engine
+        self.alerts = alerts
+        self.shadows = shadows
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.log = get_logger("anomaly")
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="anomaly-monitor", daemon=True)
+        self.stats = {"submitted": 0, "dropped": 0, "scored": 0, "flagged": 0, "alerts": 0, "batches": 0,
+                      "max_batch": 0}
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, device, temp):
+        """Queues one reading for scoring. Returns False if the queue was full."""
+        try:
+            self._queue.put_nowait((device, temp, time.time()))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["submitted"] += 1
+        return True
+
+    def stop(self, timeout=10.0):
+        """Scores whatever is still queued, then stops the thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = [] if item is _STOP else [item]
+            stopping = item is _STOP
+            deadline = time.monotonic() + self.max_age
+            while not stopping and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+            while stopping:  # Drain: nothing queued before stop() is left unscored
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+            if batch:
+                try:
+                    self._score(batch)
+                except Exception as e:
+                    self.log.error("❌ Anomaly scoring failed for %d readings: %s", len(batch), e)
+
+    def _score(self, batch):
+        import numpy as np
+
+        started = time.perf_counter()
+        devices, temps, timestamps = zip(*batch)
+        verdicts = self.engine.evaluate(devices, temps, timestamps)
+        t = lap("anomaly_score", started)
+
+        # Only the rare interesting readings go back to Python, in their original order
+        for i in np.flatnonzero(verdicts.flags | verdicts.cleared):
+            if verdicts.cleared[i]:
+                self.alerts.clear(devices[i])
+                if self.shadows is not None:
+                    self.shadows.clear_alarm(devices[i])
+                continue
+            reason = describe(verdicts.flags[i])
+            if self.shadows is not None:
+                self.shadows.set_alarm(devices[i], reason)
+            if self.alerts.raise_alarm(devices[i], temps[i], reason):
+                self.stats["alerts"] += 1
+                self.log.warning("⚠️ ANOMALY on %s: %s°C (%s). Alert queued for the next digest.",
+                                 devices[i], temps[i], reason)
+        lap("alert", t)
+
+        self.stats["batches"] += 1
+        self.stats["scored"] += len(batch)
+        self.stats["flagged"] += int(np.count_nonzero(verdicts.flags))
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
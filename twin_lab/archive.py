@@ -0,0 +1,271 @@
+import os
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from operator import itemgetter
+from urllib.parse import quote
+
+from twin_lab.config import config
+from twin_lab.schema import SCHEMA, TABLE, daily_partitions
+
+# --- SETTINGS ---
+# Industry Standard: Hot/cold tiering. Recent readings stay in PostgreSQL where they are
+# queried all day; old days move to compressed, columnar Parquet files that cost almost nothing to keep.
+DEFAULT_ARCHIVE_DIR = "cold_storage"
+DEFAULT_ARCHIVE_AFTER_DAYS = 0   # Days kept in PostgreSQL before archiving (0 = archiving off)
+FETCH_ROWS = 50000               # Rows per round trip while exporting a partition
+COMPRESSION = "zstd"
+COLUMNS = ("id", "device_id", "aud_insert_ts", "temp", "hum", "uptime", "payload")
+
+
+def archive_dir():
+    return config.get_path("ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR)
+
+
+def has_cold_data(directory=None):
+    """True once at least one day has been archived (so queries need to look at Parquet too)."""
+    return os.path.isdir(directory or archive_dir())
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("aud_insert_ts", pa.timestamp("us", tz="UTC")),
+        ("temp", pa.float64()),
+        ("hum", pa.float64()),
+        ("uptime", pa.int64()),
+        ("payload", pa.string()),  # The original JSON, so nothing is lost in the cold tier
+    ])
+
+
+def _partition_schema():
+    import pyarrow as pa
+
+    # Hive-style folders (date=2026-10-17/device=student01) become filterable columns
+    return pa.schema([("date", pa.string()), ("device", pa.string())])
+
+
+# --- 1. THE ARCHIVER ---
+def archive_partitions(cur, after_days=None, directory=None):
+    """
+    Moves every daily partition older than `after_days` (ARCHIVE_AFTER_DAYS) into Parquet.
+
+    Runs inside the caller's transaction: files are written first, then the
+    partition is dropped, so a crash in between only means the day is exported
+    again (to the same file names) next time.
+    """
+    if after_days is None:
+        after_days = config.get_int("ARCHIVE_AFTER_DAYS", DEFAULT_ARCHIVE_AFTER_DAYS)
+    if not after_days:
+        return []
+    cutoff = datetime.now(timezone.utc).date() - timedelta(days=after_days)
+    archived = []
+    for name, day in daily_partitions(cur):
+        if day < cutoff:
+            archive_partition(cur, name, day, directory or archive_dir())
+            archived.append(name)
+    return archived
+
+
+def archive_partition(cur, name, day, directory):
+    """Exports one daily partition to date=<day>/device=<id>/ Parquet files, then drops it. Returns the row count."""
+    import pyarrow as pa
+
+    # Writers are blocked (readers are not) so no reading arrives between the export and the DROP
+    cur.execute(f"LOCK TABLE {SCHEMA}.{name} IN EXCLUSIVE MODE")
+    day_dir = os.path.join(directory, f"date={day:%Y-%m-%d}")
+    schema = _arrow_schema()
+    rows_written = 0
+    writer = None
+    with cur.connection.cursor(name=f"archive_{name}") as source:  # Server-side cursor: memory stays flat
+        source.itersize = FETCH_ROWS
+        source.execute(f"""
+            SELECT COALESCE(device_id, 'unknown'), id, aud_insert_ts, temp, hum, uptime, payload::text
+            FROM {SCHEMA}.{name}
+            ORDER BY 1, aud_insert_ts
+        """)
+        while True:
+            chunk = source.fetchmany(FETCH_ROWS)
+            if not chunk:
+                break
+            for device, rows in groupby(chunk, key=itemgetter(0)):
+                if writer is None or writer.device != device:
+                    if writer is not None:
+                        writer.close()
+                    writer = _DeviceFile(day_dir, device, name, schema)
+                columns = list(zip(*rows))[1:]
+                writer.write(pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(columns, schema)],
+                                                  schema=schema))
+                rows_written += len(columns[0])
+    if writer is not None:
+        writer.close()
+
+    cur.execute(f"DROP TABLE {SCHEMA}.{name}")
+    print(f"🧊 Archived {name}: {rows_written} readings -> {day_dir}")
+    return rows_written
+
+
+class _DeviceFile:
+    """One Parquet file per device and day, written under a hidden name and renamed when complete."""
+
+    def __init__(self, day_dir, device, partition, schema):
+        import pyarrow.parquet as pq
+
+        self.device = device
+        folder = os.path.join(day_dir, f"device={quote(device, safe='')}")
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, f"part-{partition}.parquet")
+        self.tmp_path = os.path.join(folder, f".part-{partition}.parquet.tmp")  # Dot files are ignored by readers
+        self._writer = pq.ParquetWriter(self.tmp_path, schema, compression=COMPRESSION)
+
+    def write(self, table):
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+        with open(self.tmp_path, "rb+") as f:
+            os.fsync(f.fileno())  # On disk for real before PostgreSQL forgets the rows
+        os.replace(self.tmp_path, self.path)
+
+
+# --- 2. THE HOT/COLD QUERY LAYER ---
+def read_cold(start, end, device=None, columns=("aud_insert_ts", "temp"), directory=None):
+    """
+    Archived readings with start <= aud_insert_ts < end as a pyarrow Table (None if nothing is archived).
+
+    Partition pruning: only date=/device= folders inside the range are opened.
+    Column projection: only the requested columns are read from each file.
+    """
+    directory = directory or archive_dir()
+    if not has_cold_data(directory):
+        return None
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitions = _partition_schema()
+    dataset = ds.dataset(directory, format="parquet", partitioning=ds.partitioning(partitions, flavor="hive"),
+                         schema=pa.unify_schemas([_arrow_schema(), partitions]))
+    condition = ((ds.field("date") >= f"{start:%Y-%m-%d}") & (ds.field("date") <= f"{end:%Y-%m-%d}")
+                 & (ds.field("aud_insert_ts") >= start) & (ds.field("aud_insert_ts") < end))
+    if device is not None:
+        condition &= ds.field("device") == device
+    return dataset.to_table(columns=[c if c != "device_id" else "device" for c in columns], filter=condition)
+
+
+def read_range(start, end, device=None, columns=("aud_insert_ts", "temp"), engine=None):
+    """
+    One DataFrame for a time range, whether the rows are still in PostgreSQL or already in Parquet.
+
+    Rows come back oldest first. Readings present in both tiers (a crash between
+    export and DROP) are returned once.
+    """
+    import pandas as pd
+    from sqlalchemy import text
+    from twin_lab.db import get_engine
+
+    unknown = set(columns) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown column(s): {sorted(unknown)}")
+    wanted = list(dict.fromkeys(["id", *columns]))  # id is needed to drop duplicates
+
+    select = ", ".join("payload::text AS payload" if c == "payload" else c for c in wanted)
+    device_filter = "AND device_id = :device" if device is not None else ""
+    hot = pd.read_sql_query(text(f"""
+        SELECT {select} FROM {SCHEMA}.{TABLE}
+        WHERE aud_insert_ts >= :start AND aud_insert_ts < :end {device_filter}
+    """), engine or get_engine(), params={"start": start, "end": end, "device": device})
+
+    cold = read_cold(start, end, device, wanted)
+    frames = [hot]
+    if cold is not None and cold.num_rows:
+        frames.insert(0, cold.rename_columns(wanted).to_pandas())
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else hot
+    df = df.drop_duplicates("id").sort_values("aud_insert_ts", kind="stable").reset_index(drop=True)
+    return df[list(columns)]
+
+
+def cold_series(start, end, width, device=None):
+    """Average temperature per `width`-second bucket from the archive (same buckets as the SQL charts)."""
+    import pandas as pd
+
+    table = read_cold(start, end, device, ("aud_insert_ts", "temp"))
+    if table is None or not table.num_rows:
+        return pd.DataFrame(columns=["aud_insert_ts", "temp"])
+    df = table.to_pandas().dropna(subset=["temp"])
+    seconds = (df["aud_insert_ts"] - pd.Timestamp(0, tz="UTC")) / pd.Timedelta(seconds=1)
+    df["aud_insert_ts"] = pd.to_datetime((seconds // width) * width, unit="s", utc=True)
+    return df.groupby("aud_insert_ts", as_index=False)["temp"].mean()
+
+
+def window_stats(hours, device=None, engine=None):
+    """
+    (avg, max, min, count) of temp over the last `hours`, across PostgreSQL and the archive.
+
+    Like read_range(), a reading in both tiers counts once: an archived day whose
+    partition still exists (a crash between export and DROP) is read from PostgreSQL only.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from sqlalchemy import text
+    from twin_lab.db import get_engine
+
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(hours=hours)
+    device_filter = "AND device_id = :device" if device is not None else ""
+    with (engine or get_engine()).connect() as conn:
+        count, total, low, high = conn.execute(text(f"""
+            SELECT COUNT(temp), COALESCE(SUM(temp), 0), MIN(temp), MAX(temp)
+            FROM {SCHEMA}.{TABLE}
+            WHERE aud_insert_ts >= :start AND aud_insert_ts < :end {device_filter}
+        """), {"start": start, "end": end, "device": device}).fetchone()
+        with conn.connection.cursor() as cur:
+            hot_days = [f"{day:%Y-%m-%d}" for _, day in daily_partitions(cur)]
+
+    cold = read_cold(start, end, device, ("temp", "date"))
+    if cold is not None and hot_days:
+        cold = cold.filter(pc.invert(pc.is_in(cold.column("date"), value_set=pa.array(hot_days))))
+    if cold is not None and cold.num_rows:
+        temps = cold.column("temp")
+        cold_count = pc.count(temps).as_py()
+        if cold_count:
+            extremes = pc.min_max(temps).as_py()
+            count += cold_count
+            total += pc.sum(temps).as_py()
+            low = extremes["min"] if low is None else min(low, extremes["min"])
+            high = extremes["max"] if high is None else max(high, extremes["max"])
+    avg = round(total / count, 2) if count else None
+    return avg, high, low, count
+
+
+def main():
+    """Cron / manual use: python -m twin_lab.archive [run [days] | status]"""
+    import sys
+
+    from twin_lab.db import get_pool
+    from twin_lab.schema import LOCK_ID
+
+    config.load()
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "run":
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_ID,))
+                archived = archive_partitions(cur, after_days=days)
+        print(f"✅ Archived: {archived or 'nothing (set ARCHIVE_AFTER_DAYS or pass a number of days)'}")
+    elif command == "status":
+        directory = archive_dir()
+        if not has_cold_data(directory):
+            print(f"📭 Nothing archived yet in {directory}/")
+        for day in sorted(os.listdir(directory)) if has_cold_data(directory) else []:
+            day_path = os.path.join(directory, day)
+            files = [os.path.join(root, f) for root, _, names in os.walk(day_path) for f in names if not f.startswith(".")]
+            size_mb = sum(os.path.getsize(f) for f in files) / 1e6
+            print(f"  {day}  {len(files)} files  {size_mb:.1f} MB")
+    else:
+        print("Usage: python -m twin_lab.archive [run [days] | status]")
+
+
+if __name__ == "__main__":
+    main()
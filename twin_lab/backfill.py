@@ -0,0 +1,494 @@
+import base64
+import csv
+import hashlib
+import heapq
+import io
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import date, datetime, timezone
+from operator import attrgetter
+
+from twin_lab.codec import KNOWN_FIELDS, PayloadError, Reading, check_range, decode_reading, jsonb_text, reject_nul
+from twin_lab.config import config
+from twin_lab.schema import CHECKPOINT_TABLE, LOCK_ID, SCHEMA, TABLE, create_daily_partition
+from twin_lab.topics import DATA_TOPIC_FILTER, DATA_TOPIC_PREFIX, device_id
+
+# --- SETTINGS ---
+# Industry Standard: Bulk loads use COPY, not INSERT. One COPY streams a whole chunk of rows
+# to PostgreSQL in a single command: no per-row statements, no per-row round trips.
+DEFAULT_CHUNK_MB = 16          # Files are cut into newline-aligned chunks of about this size
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_REPLAY_BROKER = "localhost"  # Replays are for your own broker, never a public one
+PROGRESS_INTERVAL = 5.0        # Seconds between progress lines
+TIME_FIELDS = ("ts", "timestamp", "time", "aud_insert_ts", "received_at")
+DEVICE_FIELDS = ("device_id", "device", "sensor_id")
+KEPT_AS_TEXT = TIME_FIELDS + DEVICE_FIELDS + ("topic", "payload", "payload_b64")
+
+COPY_SQL = f"COPY {SCHEMA}.{TABLE} (sensor_id, payload, aud_insert_ts) FROM STDIN"
+# The checkpoint row is written in the same transaction as the chunk's rows: both commit or neither does
+CLAIM_SQL = (f"INSERT INTO {SCHEMA}.{CHECKPOINT_TABLE} (file_key, chunk_start, chunk_end, rows_loaded) "
+             "VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING RETURNING chunk_start")
+
+Record = namedtuple("Record", ("ts", "device", "payload", "temp"))
+_ready_days = set()  # Days this worker process already made partitions for
+
+
+# --- 1. READING EXPORTS ---
+def parse_time(value):
+    """Unix seconds (or milliseconds) or an ISO 8601 string -> Unix seconds. Times without a zone are UTC."""
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            stamp = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+            if stamp.tzinfo is None:
+                stamp = stamp.replace(tzinfo=timezone.utc)
+            return stamp.timestamp()
+    value = float(value)
+    return value / 1000 if value > 1e11 else value  # 13-digit stamps are milliseconds
+
+
+def _pop_first(fields, names):
+    for name in names:
+        if fields.get(name) not in (None, ""):
+            return fields.pop(name)
+    return None
+
+
+def _number(text):
+    if text.lstrip("-").isdigit():
+        return int(text)
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def _flat_reading(fields):
+    """decode_reading() for a row we turn into JSON ourselves: the same rules, without parsing it back."""
+    if "temp" not in fields:
+        raise PayloadError("missing required field 'temp'")
+    values = [fields.get(field) for field in KNOWN_FIELDS]
+    for field, value in zip(KNOWN_FIELDS, values):
+        if value is not None and isinstance(value, (bool, str)):
+            raise PayloadError(f"'{field}' must be a number")
+    return check_range(Reading(*values))
+
+
+def to_record(fields, default_device=None):
+    """
+    One exported reading -> Record(ts, device, payload bytes, temp).
+
+    Accepts flat rows ({"ts", "device_id", "temp", "hum", ...}: every other field
+    becomes the payload), rows with a "payload" (object or JSON text) and
+    captured MQTT messages ({"ts", "topic", "payload"} or "payload_b64" for binary).
+    Raises PayloadError for anything the bridge would not have stored either.
+    """
+    fields = dict(fields)
+    ts = _pop_first(fields, TIME_FIELDS)
+    if ts is None:
+        raise PayloadError(f"missing timestamp (one of {', '.join(TIME_FIELDS)})")
+    topic = fields.pop("topic", None)
+    device = _pop_first(fields, DEVICE_FIELDS) or (device_id(topic) if topic else default_device)
+    if not device:
+        raise PayloadError("missing device id (add a device_id column or pass --device)")
+
+    if "payload_b64" in fields:
+        payload = base64.b64decode(fields["payload_b64"])
+    elif "payload" in fields:
+        payload = fields["payload"]
+        payload = (payload if isinstance(payload, str) else json.dumps(payload, separators=(",", ":"))).encode()
+    else:
+        reading = _flat_reading(fields)
+        # allow_nan=False: JSONB has no NaN, so such a row is rejected here instead of failing its whole chunk
+        payload = json.dumps(fields, separators=(",", ":"), allow_nan=False).encode()
+        reject_nul(payload)  # A text field holding NUL would fail its chunk the same way
+        return Record(parse_time(ts), str(device)[:50], payload, reading.temp)
+    reading = decode_reading(payload)  # Same validation as on_message
+    return Record(parse_time(ts), str(device)[:50], payload, reading.temp)
+
+
+def detect_format(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def csv_header(path):
+    with open(path, encoding="utf-8-sig") as f:
+        return next(csv.reader([f.readline()]), [])
+
+
+def plan_chunks(path, chunk_bytes):
+    """Newline-aligned (start, end) byte ranges that together cover the whole file."""
+    size = os.path.getsize(path)
+    chunks, start = [], 0
+    with open(path, "rb") as f:
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()  # Finish the line the cut landed in
+            chunks.append((start, f.tell()))
+            start = f.tell()
+    return chunks
+
+
+def read_chunk(path, start, end, fmt, header=None, default_device=None):
+    """Parses one byte range of an export. Returns (records, rejected count, first error)."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        lines = f.read(end - start).decode("utf-8-sig" if start == 0 else "utf-8", errors="replace").splitlines()
+    if fmt == "csv":
+        rows = csv.DictReader(lines[1:] if start == 0 else lines, fieldnames=header)
+    else:
+        rows = (line for line in lines if line.strip())
+    records, rejected, error = [], 0, None
+    for row in rows:
+        try:
+            if fmt == "csv":
+                fields = {k: v if k in KEPT_AS_TEXT else _number(v) for k, v in row.items() if k and v not in (None, "")}
+            else:
+                fields = json.loads(row)
+                if not isinstance(fields, dict):
+                    raise PayloadError("each line must be a JSON object")
+            records.append(to_record(fields, default_device))
+        except (ValueError, TypeError) as e:  # PayloadError, bad JSON, bad timestamps
+            rejected += 1
+            error = error or str(e)
+    return records, rejected, error
+
+
+def iter_records(path, fmt=None, default_device=None, chunk_mb=DEFAULT_CHUNK_MB, counts=None):
+    """Streams a whole export chunk by chunk (rejected lines are counted in counts['rejected'])."""
+    fmt = fmt or detect_format(path)
+    header = csv_header(path) if fmt == "csv" else None
+    for start, end in plan_chunks(path, chunk_mb * 1024 * 1024):
+        records, rejected, _ = read_chunk(path, start, end, fmt, header, default_device)
+        if counts is not None:
+            counts["rejected"] = counts.get("rejected", 0) + rejected
+        yield from records
+
+
+def file_key(path):
+    """Identifies an export by name, size and content, so a renamed path or edited file is never mistaken for it."""
+    digest = hashlib.blake2b(digest_size=8)
+    with open(path, "rb") as f:
+        digest.update(f.read(1024 * 1024))
+    return f"{os.path.basename(path)[:80]}:{os.path.getsize(path)}:{digest.hexdigest()}"
+
+
+# --- 2. BULK LOADING WITH COPY ---
+def _copy_text(value):
+    # COPY's text format: backslash, tab and newlines must be escaped
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_buffer(records):
+    """The records as one COPY text stream (sensor_id, payload, aud_insert_ts)."""
+    return io.StringIO("".join(
+        f"{_copy_text(r.device)}\t{_copy_text(jsonb_text(r.payload))}\t"
+        f"{datetime.fromtimestamp(r.ts, timezone.utc).isoformat()}\n"
+        for r in records))
+
+
+def _archived_days():
+    from twin_lab.archive import archive_dir, has_cold_data
+
+    directory = archive_dir()
+    if not has_cold_data(directory):
+        return set()
+    return {date.fromisoformat(name[len("date="):]) for name in os.listdir(directory) if name.startswith("date=")}
+
+
+def _ensure_partitions(pool, days):
+    missing = days - _ready_days
+    if not missing:
+        return
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_ID,))  # Never race the bridge's maintenance
+            for day in sorted(missing):
+                create_daily_partition(cur, day)
+    _ready_days.update(missing)
+
+
+def load_chunk(task):
+    """
+    Worker process: parses one chunk and COPYs it into smart_sensor_data, exactly once.
+
+    Returns the chunk's stats. A failed chunk is reported, not raised, so the
+    other chunks keep loading; running the same command again retries it.
+    """
+    from twin_lab.db import get_pool
+    from twin_lab.rollups import apply_rollups_at
+    from twin_lab.snapshots import invalidate_snapshots
+
+    path, fmt, header, start, end, key, default_device, rollups, partitions = task
+    started = time.perf_counter()
+    records, rejected, error = read_chunk(path, start, end, fmt, header, default_device)
+    stats = {"path": path, "start": start, "bytes": end - start, "rows": 0, "rejected": rejected, "archived": 0,
+             "skipped": False, "failed": False, "error": error, "first": None, "last": None}
+    try:
+        day_of = [datetime.fromtimestamp(r.ts, timezone.utc).date() for r in records]
+        days = set(day_of)
+        # An archived day's Parquet files would be overwritten when its new partition is archived again
+        archived = days & _archived_days()
+        if archived:
+            kept = [r for r, day in zip(records, day_of) if day not in archived]
+            stats["archived"] = len(records) - len(kept)
+            records, days = kept, days - archived
+
+        pool = get_pool()
+        if partitions:
+            _ensure_partitions(pool, days)
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(CLAIM_SQL, (key, start, end, len(records)))
+                if cur.fetchone() is None:
+                    stats["skipped"] = True  # Another run loaded this chunk in the meantime
+                    return stats
+                cur.copy_expert(COPY_SQL, copy_buffer(records))
+                if rollups:
+                    apply_rollups_at(cur, [(r.device, r.ts, r.temp) for r in records])
+                if records:
+                    # Fleet snapshots taken after these readings no longer match the log; maintenance rebuilds them
+                    invalidate_snapshots(cur, min(r.ts for r in records))
+    except Exception as e:
+        stats.update(failed=True, error=str(e))
+        return stats
+    stats["rows"] = len(records)
+    if records:
+        stats["first"], stats["last"] = min(r.ts for r in records), max(r.ts for r in records)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def loaded_chunks(pool, key):
+    """{chunk_start: chunk_end} of every chunk of this file that is already committed."""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT chunk_start, chunk_end FROM {SCHEMA}.{CHECKPOINT_TABLE} WHERE file_key = %s", (key,))
+            return dict(cur.fetchall())
+
+
+def backfill(paths, workers=DEFAULT_WORKERS, chunk_mb=DEFAULT_CHUNK_MB, fmt=None, default_device=None,
+             rollups=True):
+    """
+    Loads CSV/JSONL exports into smart_sensor_data with `workers` processes in parallel.
+
+    Every chunk commits together with its checkpoint row, so an interrupted
+    backfill is resumed by running the same command again: finished chunks are
+    skipped and no row is loaded twice. Returns the totals.
+    """
+    import multiprocessing
+
+    from twin_lab.db import get_pool
+    from twin_lab.schema import prepare_database
+
+    pool = get_pool()
+    partitions = prepare_database(pool)  # Migrations (checkpoint table) and today's partitions
+    tasks = []
+    for path in paths:
+        file_fmt = fmt or detect_format(path)
+        header = csv_header(path) if file_fmt == "csv" else None
+        key = file_key(path)
+        chunks = plan_chunks(path, chunk_mb * 1024 * 1024)
+        done = loaded_chunks(pool, key)
+        if not set(done) <= {start for start, _ in chunks}:
+            raise ValueError(f"{path} was partly loaded with a different chunk size; resume it with the same --chunk-mb")
+        pending = [(start, end) for start, end in chunks if start not in done]
+        print(f"📂 {path}: {len(chunks)} chunks, {len(chunks) - len(pending)} already loaded")
+        tasks += [(path, file_fmt, header, start, end, key, default_device, rollups, partitions)
+                  for start, end in pending]
+
+    totals = {"chunks": len(tasks), "rows": 0, "rejected": 0, "archived": 0, "failed": 0, "bytes": 0,
+              "first": None, "last": None}
+    started = last_report = time.monotonic()
+    # spawn, not fork: each worker opens its own database connections instead of sharing the parent's sockets
+    with multiprocessing.get_context("spawn").Pool(min(workers, len(tasks)) or 1) as processes:
+        for done, stats in enumerate(processes.imap_unordered(load_chunk, tasks), 1):
+            for field in ("rows", "rejected", "archived", "bytes"):
+                totals[field] += stats[field]
+            if stats["failed"]:
+                totals["failed"] += 1
+                print(f"❌ {stats['path']} @ byte {stats['start']}: {stats['error']}")
+            if stats["first"] is not None:
+                totals["first"] = min(totals["first"] or stats["first"], stats["first"])
+                totals["last"] = max(totals["last"] or stats["last"], stats["last"])
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL or done == len(tasks):
+                last_report = time.monotonic()
+                elapsed = last_report - started
+                print(f"   {done}/{len(tasks)} chunks | {totals['rows']:,} rows | "
+                      f"{totals['rows'] / elapsed:,.0f} rows/s | {totals['bytes'] / elapsed / 1e6:.1f} MB/s")
+    totals["seconds"] = round(time.monotonic() - started, 2)
+    _warn_about(totals)
+    return totals
+
+
+def _warn_about(totals):
+    from twin_lab.schema import DEFAULT_RETENTION_DAYS
+
+    if totals["rejected"]:
+        print(f"⚠️ {totals['rejected']:,} lines were not valid readings and were skipped.")
+    if totals["archived"]:
+        print(f"⚠️ {totals['archived']:,} readings fall on days already archived to Parquet and were skipped.")
+    if totals["failed"]:
+        print(f"⚠️ {totals['failed']} chunks failed: run the same command again to retry them.")
+    retention = config.get_int("RETENTION_DAYS", DEFAULT_RETENTION_DAYS)
+    if retention and totals["first"] is not None and time.time() - totals["first"] > retention * 86400:
+        print(f"⚠️ Some readings are older than RETENTION_DAYS={retention}: the next maintenance run drops them.")
+
+
+# --- 3. REPLAY THROUGH THE BROKER ---
+def replay(paths, speed=1.0, broker=DEFAULT_REPLAY_BROKER, port=1883, qos=0,
+           topic_template=DATA_TOPIC_PREFIX + "/{device}", fmt=None, default_device=None, max_gap=None):
+    """
+    Publishes exported or captured readings in timestamp order at `speed` × real time.
+
+    The bridge receives them like live traffic (0 = as fast as possible). Each
+    file must be in time order; several files are merged. `max_gap` caps long
+    silences (seconds of data time), so an offline night doesn't stall the replay.
+    """
+    import paho.mqtt.client as mqtt
+    from paho.mqtt.enums import CallbackAPIVersion
+
+    client = mqtt.Client(CallbackAPIVersion.VERSION2)
+    client.max_queued_messages_set(0)  # Unlimited: the schedule, not paho's buffer, sets the pace
+    client.max_inflight_messages_set(1000)
+    client.connect(broker, port, 60)
+    client.loop_start()
+
+    counts = {"rejected": 0}
+    stream = heapq.merge(*(iter_records(p, fmt, default_device, counts=counts) for p in paths), key=attrgetter("ts"))
+    sent, data_elapsed, previous, info = 0, 0.0, None, None
+    started = last_report = time.monotonic()
+    try:
+        for record in stream:
+            if previous is not None:
+                gap = max(record.ts - previous, 0.0)
+                data_elapsed += min(gap, max_gap) if max_gap is not None else gap
+            previous = record.ts
+            if speed:
+                delay = started + data_elapsed / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            info = client.publish(topic_template.format(device=record.device), record.payload, qos=qos)
+            sent += 1
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                behind = last_report - started - (data_elapsed / speed if speed else 0.0)
+                print(f"   {sent:,} sent | {sent / (last_report - started):,.0f} msgs/s | "
+                      f"at {datetime.fromtimestamp(record.ts, timezone.utc):%Y-%m-%d %H:%M:%S} UTC"
+                      + (f" | {behind:.1f}s behind schedule" if speed and behind > 1 else ""))
+    except KeyboardInterrupt:
+        print("\n🛑 Replay interrupted.")
+    finally:
+        if info is not None:
+            info.wait_for_publish(timeout=30)
+        client.loop_stop()
+        client.disconnect()
+    elapsed = time.monotonic() - started
+    return {"sent": sent, "rejected": counts["rejected"], "seconds": round(elapsed, 2),
+            "publish_rate": round(sent / elapsed, 1) if elapsed else 0.0, "data_seconds": round(data_elapsed, 1)}
+
+
+def capture(path, topic=DATA_TOPIC_FILTER, broker=DEFAULT_REPLAY_BROKER, port=1883, duration=None):
+    """Records live MQTT traffic to a JSONL file that `load` and `replay` read back. Returns the message count."""
+    import paho.mqtt.client as mqtt
+    from paho.mqtt.enums import CallbackAPIVersion
+
+    out = open(path, "a", encoding="utf-8")
+    counts = {"captured": 0}
+
+    def on_message(client, userdata, msg):
+        line = {"ts": round(time.time(), 6), "topic": msg.topic}
+        try:
+            line["payload"] = msg.payload.decode()
+        except UnicodeDecodeError:
+            line["payload_b64"] = base64.b64encode(msg.payload).decode()  # Binary readings, byte for byte
+        out.write(json.dumps(line) + "\n")
+        counts["captured"] += 1
+
+    client = mqtt.Client(CallbackAPIVersion.VERSION2)
+    client.on_connect = lambda c, u, f, rc, p: c.subscribe(topic)
+    client.on_message = on_message
+    client.connect(broker, port, 60)
+    print(f"🎙️ Capturing {topic} from {broker} into {path} (Ctrl+C to stop)...")
+    client.loop_start()
+    stop_at = time.monotonic() + duration if duration else float("inf")
+    try:
+        while time.monotonic() < stop_at:
+            time.sleep(min(0.5, max(stop_at - time.monotonic(), 0)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        out.close()
+    return counts["captured"]
+
+
+def main():
+    """Command line: python -m twin_lab.backfill [load|replay|capture|status] ..."""
+    import argparse
+
+    config.load()
+    parser = argparse.ArgumentParser(prog="python -m twin_lab.backfill",
+                                     description="Bulk-load, replay and capture historical telemetry.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="COPY CSV/JSONL exports into smart_sensor_data (resumable)")
+    load.add_argument("files", nargs="+")
+    load.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    load.add_argument("--chunk-mb", type=int, default=DEFAULT_CHUNK_MB)
+    load.add_argument("--no-rollups", action="store_true", help="Skip updating the minute/hour rollups")
+
+    play = commands.add_parser("replay", help="Publish exports or captures to a broker at N× real time")
+    play.add_argument("files", nargs="+")
+    play.add_argument("--speed", type=float, default=1.0, help="Multiple of real time (0 = as fast as possible)")
+    play.add_argument("--max-gap", type=float, help="Longest pause kept from the data, in seconds")
+    play.add_argument("--broker", default=DEFAULT_REPLAY_BROKER)
+    play.add_argument("--port", type=int, default=1883)
+    play.add_argument("--qos", type=int, choices=[0, 1], default=0)
+    play.add_argument("--topic-template", default=DATA_TOPIC_PREFIX + "/{device}")
+
+    record = commands.add_parser("capture", help="Record live MQTT traffic to a JSONL file")
+    record.add_argument("file")
+    record.add_argument("--topic", default=DATA_TOPIC_FILTER)
+    record.add_argument("--duration", type=float, help="Seconds to record (default: until Ctrl+C)")
+    record.add_argument("--broker", default=DEFAULT_REPLAY_BROKER)
+    record.add_argument("--port", type=int, default=1883)
+
+    commands.add_parser("status", help="List loaded files and their checkpoints")
+    for sub in (load, play):
+        sub.add_argument("--format", dest="fmt", choices=["csv", "jsonl"], help="Default: from the file extension")
+        sub.add_argument("--device", help="Device id for files without a device column")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        totals = backfill(args.files, args.workers, args.chunk_mb, args.fmt, args.device, not args.no_rollups)
+        print(f"✅ Loaded {totals['rows']:,} readings in {totals['seconds']}s "
+              f"({totals['rows'] / max(totals['seconds'], 1e-9):,.0f} rows/s).")
+    elif args.command == "replay":
+        print(f"⏯️ Replaying {len(args.files)} file(s) to {args.broker}:{args.port} at "
+              f"{'full speed' if not args.speed else f'{args.speed:g}x'}...")
+        result = replay(args.files, args.speed, args.broker, args.port, args.qos, args.topic_template, args.fmt,
+                        args.device, args.max_gap)
+        print(f"✅ Published {result['sent']:,} readings ({result['publish_rate']:,} msgs/s, "
+              f"{result['data_seconds']:,}s of data time, {result['rejected']} lines skipped).")
+    elif args.command == "capture":
+        print(f"✅ Captured {capture(args.file, args.topic, args.broker, args.port, args.duration):,} messages.")
+    else:
+        from twin_lab.db import get_pool
+
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT file_key, COUNT(*), SUM(rows_loaded), MAX(loaded_at)
+                    FROM {SCHEMA}.{CHECKPOINT_TABLE} GROUP BY file_key ORDER BY MAX(loaded_at)
+                """)
+                for key, chunks, rows, loaded_at in cur.fetchall():
+                    print(f"  {loaded_at:%Y-%m-%d %H:%M}  {chunks:>5} chunks  {rows:>12,} rows  {key}")
+
+
+if __name__ == "__main__":
+    main()
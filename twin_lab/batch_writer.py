@@ -0,0 +1,255 @@
+import queue
+import threading
+import time
+
+from twin_lab.codec import jsonb_texts
+from twin_lab.dead_letter import isolate, move_aside
+from twin_lab.metrics import MESSAGES_FAILED, MESSAGES_STORED, count_by_device, lap
+from twin_lab.rollups import apply_rollups, apply_rollups_at, reading_temp
+from twin_lab.schema import DEDUP_TABLE, SCHEMA
+
+# --- SETTINGS ---
+# Industry Standard: Write many readings per round trip instead of one INSERT+COMMIT each
+INSERT_SQL = "INSERT INTO edu_iot_digital_twin_lab.smart_sensor_data (sensor_id, payload, aud_insert_ts) VALUES %s"
+INSERT_TEMPLATE = "(%s, %s, COALESCE(to_timestamp(%s), now()))"  # Receive time if known, else the usual default
+DEFAULT_BATCH_SIZE = 500     # Flush as soon as this many readings are waiting...
+DEFAULT_MAX_AGE = 1.0        # ...or when the oldest waiting reading is this many seconds old
+DEFAULT_QUEUE_SIZE = 10000   # Bounded buffer: protects the bridge's memory if Postgres stalls
+DEFAULT_PUT_TIMEOUT = 0.5    # How long on_message may wait for room before dropping a reading
+MAX_RETRY_BACKOFF = 30.0     # Reliable mode: longest pause between attempts at a failed batch
+
+# Idempotent ingest: remember each fingerprint once; only the rows that come back are new
+DEDUP_SQL = (f"INSERT INTO {SCHEMA}.{DEDUP_TABLE} (device_id, dedup_key) VALUES %s "
+             "ON CONFLICT DO NOTHING RETURNING device_id, dedup_key")
+
+_STOP = object()  # Sentinel that tells the flusher thread to drain and exit
+
+
+class BatchWriter:
+    """
+    Buffers payloads in memory and writes them to smart_sensor_data in bulk.
+
+    on_message() only calls submit(), which is a quick queue put. A background
+    "flusher" thread borrows a pooled connection and commits whole batches,
+    updating the per-device rollup tables in the same transaction.
+
+    A reading submitted without a payload only feeds the rollups: the
+    compression stage drops redundant rows, but the minute/hour statistics
+    still count every reading.
+
+    Reliable mode (ack=callable): every reading may carry an MQTT (mid, qos)
+    that is acknowledged only after its batch has committed, failed batches
+    are retried instead of dropped, and readings with a dedup key are written
+    at most once, however often the broker redelivers them.
+
+    A row PostgreSQL rejects (in any mode) is isolated and moved to the
+    dead-letter table; the rest of its batch is still written.
+    """
+
+    def __init__(self, pool, batch_size=DEFAULT_BATCH_SIZE, max_age=DEFAULT_MAX_AGE,
+                 queue_size=DEFAULT_QUEUE_SIZE, put_timeout=DEFAULT_PUT_TIMEOUT,
+                 insert_sql=INSERT_SQL, rollups=True, ack=None):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.put_timeout = put_timeout
+        self.insert_sql = insert_sql
+        self.rollups = rollups
+        self.ack = ack
+        self._stopping = False
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+        self._lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "dropped": 0,
+            "rows_written": 0,
+            "rows_failed": 0,
+            "duplicates": 0,
+            "dead_lettered": 0,
+            "rows_compressed": 0,
+            "acked": 0,
+            "retries": 0,
+            "batches": 0,
+            "max_batch": 0,
+            "flush_seconds_total": 0.0,
+            "flush_seconds_max": 0.0,
+        }
+
+    # --- 1. PUBLIC API ---
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, payload, device, temp=None, delivery=None, key=None, received_at=None):
+        """
+        Queues one payload (JSON text, or raw JSON/binary bytes). Returns False if the buffer was full.
+
+        payload None: rollups only, no row. delivery: the message's (mid, qos),
+        handed to `ack` once it is committed. key: its dedup key (codec.dedup_key),
+        or None to always insert it. received_at: Unix time for aud_insert_ts.
+        """
+        try:
+            self._queue.put((device, payload, temp, delivery, key, received_at), timeout=self.put_timeout)
+        except queue.Full:
+            self._bump("dropped")
+            return False
+        self._bump("submitted")
+        return True
+
+    def stop(self, timeout=30.0):
+        """Flushes everything still buffered, then stops the flusher thread."""
+        if not self._thread.is_alive():
+            return
+        self._stopping = True  # A failing final batch is left unacknowledged, not retried forever
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        """Returns a snapshot of the batch-size and flush-latency counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+        batches = snapshot["batches"]
+        snapshot["avg_batch"] = round(snapshot["rows_written"] / batches, 1) if batches else 0.0
+        snapshot["avg_flush_ms"] = round(1000 * snapshot["flush_seconds_total"] / batches, 2) if batches else 0.0
+        snapshot["queue_depth"] = self.queue_depth()
+        return snapshot
+
+    # --- 2. THE FLUSHER THREAD ---
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self):
+        """Waits for the first reading, then gathers more until size or age is hit."""
+        item = self._queue.get()
+        if item is _STOP:
+            return self._drain_remaining(), True
+
+        batch = [item]
+        deadline = time.monotonic() + self.max_age
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch + self._drain_remaining(), True
+            batch.append(item)
+        return batch, False
+
+    def _drain_remaining(self):
+        rows = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if item is not _STOP:
+                rows.append(item)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            if not self._write_with_retry(chunk):
+                self._bump("rows_failed", len(chunk))
+                count_by_device(MESSAGES_FAILED, chunk, reason="db_error")
+                continue
+            if self.ack is not None:
+                # At-least-once: the broker only forgets these messages now that they are committed
+                for row in chunk:
+                    if row[3] is not None:
+                        self.ack(*row[3])
+                self._bump("acked", sum(row[3] is not None for row in chunk))
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+            self._stats["flush_seconds_total"] += elapsed
+            self._stats["flush_seconds_max"] = max(self._stats["flush_seconds_max"], elapsed)
+
+    def _write_with_retry(self, rows):
+        """Writes a chunk; in reliable mode keeps retrying (with backoff) until it commits."""
+        backoff = 0.5
+        while True:
+            try:
+                # A rejected row is bisected out and dead-lettered: retrying it could never succeed.
+                # A retry after a later half failed is safe: its dedup keys skip what already committed.
+                isolate(self._write, rows, self._reject)
+                return True
+            except Exception as e:
+                print(f"❌ Batch insert failed ({len(rows)} rows): {e}")
+                if self.ack is None or self._stopping:
+                    return False
+            self._bump("retries")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_RETRY_BACKOFF)
+
+    def _write(self, rows):
+        from psycopg2.extras import execute_values
+
+        # One multi-row INSERT (plus rollup upserts) and one COMMIT for the whole chunk
+        # Binary readings are decoded here, in bulk, instead of one by one in on_message
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                fresh = self._claim(cur, rows)
+                stored = [row for row in fresh if row[1] is not None]
+                t = lap("dedup", started)
+                texts = jsonb_texts([row[1] for row in stored])
+                t = lap("encode", t)
+                if stored:
+                    execute_values(cur, self.insert_sql, [(row[0], text, row[5]) for row, text in zip(stored, texts)],
+                                   template=INSERT_TEMPLATE, page_size=len(stored))
+                t = lap("insert", t)
+                if self.rollups and fresh:
+                    # Every reading counts, stored or compressed away (those always carry their temp)
+                    text_of = dict(zip(map(id, stored), texts))
+                    temps = [row[2] if row[2] is not None else reading_temp(text_of[id(row)]) for row in fresh]
+                    # A reading with a receive time (e.g. held back by compression) goes to the minute of its row
+                    apply_rollups(cur, [(row[0], temp) for row, temp in zip(fresh, temps) if row[5] is None])
+                    apply_rollups_at(cur, [(row[0], row[5], temp) for row, temp in zip(fresh, temps)
+                                           if row[5] is not None])
+                    t = lap("rollup", t)
+        lap("commit", t)  # Leaving the with-block is the COMMIT
+        self._bump("rows_written", len(stored))
+        self._bump("rows_compressed", len(fresh) - len(stored))
+        self._bump("duplicates", len(rows) - len(fresh))
+        count_by_device(MESSAGES_STORED, stored)
+
+    def _reject(self, row, error):
+        move_aside(self.pool, row[0], row[1], row[5], error)
+        self._bump("dead_lettered")
+
+    def _claim(self, cur, rows):
+        """The rows not stored before: dedup keys are inserted first, and only new ones come back."""
+        keyed = {(row[0], row[4]) for row in rows if row[4] is not None}
+        if not keyed:
+            return rows
+        from psycopg2.extras import execute_values
+
+        new = set(map(tuple, execute_values(cur, DEDUP_SQL, list(keyed), page_size=len(keyed), fetch=True)))
+        fresh = []
+        for row in rows:
+            if row[4] is None:
+                fresh.append(row)
+            elif (row[0], row[4]) in new:
+                new.discard((row[0], row[4]))  # The same message twice in one batch is still one row
+                fresh.append(row)
+        return fresh
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
@@ -0,0 +1,81 @@
+"""
+One command for every lab entry point: `twin-lab <command> [args...]`.
+
+Installed by `pip install -e .` (see pyproject.toml), or run without installing
+as `python -m twin_lab.cli <command>`. Nothing heavy is imported here: each
+command loads only what its own script needs, so `twin-lab bridge` never pays
+for pandas or SQLAlchemy.
+"""
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# --- COMMANDS ---
+# The weekly scripts run exactly as `python <script>` would (same argv, same __main__)
+SCRIPTS = {
+    "bridge": "Week-3/bridge.py",
+    "bridge-v2": "Week-5/bridge_v2.py",
+    "bridge-v3": "Week-6/bridge_v3.py",
+    "analytics": "Week-4/analytics.py",
+    "dashboard": "Week-4/Bonus/dashboard.py",
+}
+# Streamlit apps are started through `streamlit run`, like in the Week 5/6 READMEs
+STREAMLIT_APPS = {
+    "dashboard-v2": "Week-5/Bonus/dashboard_v2.py",
+    "dashboard-v3": "Week-6/dashboard_v3.py",
+}
+# Maintenance tools that live in the package: each has a main()
+MODULES = {
+    "schema": "twin_lab.schema",
+    "rollups": "twin_lab.rollups",
+    "archive": "twin_lab.archive",
+    "backfill": "twin_lab.backfill",
+    "snapshots": "twin_lab.snapshots",
+}
+
+
+def run_script(path, args):
+    import runpy
+
+    sys.argv = [path] + list(args)
+    runpy.run_path(path, run_name="__main__")
+
+
+def run_streamlit(path, args):
+    import subprocess
+
+    return subprocess.call([sys.executable, "-m", "streamlit", "run", path] + list(args))
+
+
+def run_module(module, args):
+    import importlib
+
+    sys.argv = [module] + list(args)
+    return importlib.import_module(module).main()
+
+
+def usage():
+    names = ", ".join(list(SCRIPTS) + list(STREAMLIT_APPS) + list(MODULES))
+    return f"usage: twin-lab <command> [args...]\ncommands: {names}"
+
+
+def main(argv=None):
+    """Command line: twin-lab <command> [args...]"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+    command, args = argv[0], argv[1:]
+    if command in SCRIPTS:
+        return run_script(os.path.join(ROOT, SCRIPTS[command]), args)
+    if command in STREAMLIT_APPS:
+        return run_streamlit(os.path.join(ROOT, STREAMLIT_APPS[command]), args)
+    if command in MODULES:
+        return run_module(MODULES[command], args)
+    print(f"❌ Unknown command '{command}'.\n{usage()}")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
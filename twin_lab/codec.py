@@ -0,0 +1,282 @@
+import hashlib
+import json
+import math
+import re
+import struct
+from collections import namedtuple
+
+try:
+    import msgspec  # Optional: compiled JSON decoding + schema validation in one pass
+except ImportError:
+    msgspec = None
+
+# --- THE TWIN SCHEMA ---
+# Industry Standard: Validate at the edge of the system, then trust the data inside it.
+# Every ESP32 payload must be a JSON object with a numeric "temp" (null when the DHT22
+# read fails). "hum" and "uptime" are optional numbers; any extra keys (e.g. "status")
+# are allowed and kept, because the original bytes are what we store.
+KNOWN_FIELDS = ("temp", "hum", "uptime")
+Reading = namedtuple("Reading", KNOWN_FIELDS)
+
+
+class PayloadError(ValueError):
+    """Raised when a payload is not a valid Digital Twin reading."""
+
+
+# The typed columns cast temp/hum to DOUBLE PRECISION and uptime to BIGINT, so anything
+# outside those ranges (1e400 parses as inf) would fail the INSERT instead of the validation
+BIGINT_RANGE = (-2 ** 63, 2 ** 63)  # Lower bound included, upper bound excluded
+
+
+def _finite(value):
+    try:
+        return math.isfinite(value)
+    except OverflowError:  # An integer too large for a float
+        return False
+
+
+def check_range(reading):
+    """Raises PayloadError if a Reading's numbers do not fit the typed columns. Returns the reading."""
+    for field in ("temp", "hum"):
+        value = getattr(reading, field)
+        if value is not None and not _finite(value):
+            raise PayloadError(f"'{field}' must be a finite number")
+    if reading.uptime is not None and not (_finite(reading.uptime)
+                                           and BIGINT_RANGE[0] <= reading.uptime < BIGINT_RANGE[1]):
+        raise PayloadError("'uptime' is out of range")
+    return reading
+
+
+# --- THE BINARY WIRE FORMAT ---
+# 14 bytes instead of ~50 of JSON text. The first byte tells the formats apart:
+# JSON always starts with "{" (0x7B), binary readings with BINARY_MAGIC. So one topic
+# can carry both, and old JSON boards keep working next to new binary ones.
+#   magic (u8) | flags (u8) | temp (float32) | hum (float32) | uptime (uint32), little-endian like the ESP32
+BINARY_MAGIC = 0xB1
+BINARY_LAYOUT = struct.Struct("<BBffI")
+BINARY_DTYPE = [("magic", "u1"), ("flags", "u1"), ("temp", "<f4"), ("hum", "<f4"), ("uptime", "<u4")]
+FLAG_HAS_STATUS = 0x01    # The sketch reports a status...
+FLAG_SILENCED = 0x02      # ...and it is "SILENCED" (otherwise "ACTIVE")
+UPTIME_MISSING = 0xFFFFFFFF  # temp/hum use NaN for "missing"; uptime uses the largest value
+
+
+def is_binary(raw):
+    return len(raw) == BINARY_LAYOUT.size and raw[0] == BINARY_MAGIC
+
+
+def encode_binary(temp, hum=None, uptime=None, status=None):
+    """Packs one reading (what the ESP32 does with a packed C struct)."""
+    flags = 0
+    if status is not None:
+        flags |= FLAG_HAS_STATUS | (FLAG_SILENCED if status == "SILENCED" else 0)
+    return BINARY_LAYOUT.pack(BINARY_MAGIC, flags,
+                              math.nan if temp is None else temp,
+                              math.nan if hum is None else hum,
+                              UPTIME_MISSING if uptime is None else uptime)
+
+
+def _binary_values(flags, temp, hum, uptime):
+    # float32 -> 2 decimals, so 24.3 is stored as 24.3 and not 24.299999237060547
+    return (round(temp, 2) if math.isfinite(temp) else None,
+            round(hum, 2) if math.isfinite(hum) else None,
+            None if uptime == UPTIME_MISSING else uptime,
+            _status(flags))
+
+
+def _status(flags):
+    if not flags & FLAG_HAS_STATUS:
+        return None
+    return "SILENCED" if flags & FLAG_SILENCED else "ACTIVE"
+
+
+def _canonical_json(temp, hum, uptime, status):
+    """The JSONB text for a binary reading: same keys as the JSON sketches send."""
+    parts = [f'"temp":{"null" if temp is None else repr(temp)}']
+    if hum is not None:
+        parts.append(f'"hum":{hum!r}')
+    if uptime is not None:
+        parts.append(f'"uptime":{uptime}')
+    if status is not None:
+        parts.append(f'"status":"{status}"')
+    return "{" + ",".join(parts) + "}"
+
+
+# --- 1. DECODING ONE MESSAGE ---
+if msgspec is not None:
+    from typing import Optional
+
+    class _TwinPayload(msgspec.Struct):
+        temp: Optional[float]
+        hum: Optional[float] = None
+        uptime: Optional[float] = None
+
+    _decoder = msgspec.json.Decoder(_TwinPayload)
+    _loads = msgspec.json.decode
+    _DECODE_ERRORS = (ValueError, msgspec.MsgspecError)
+
+    def _decode_json_reading(raw):
+        try:
+            payload = _decoder.decode(raw)
+        except msgspec.MsgspecError as e:
+            raise PayloadError(str(e)) from None
+        return check_range(Reading(payload.temp, payload.hum, payload.uptime))
+else:
+    _loads = json.loads
+    _DECODE_ERRORS = (ValueError,)
+
+    def _reject_constant(name):
+        raise ValueError(f"{name} is not valid JSON")
+
+    def _decode_json_reading(raw):
+        try:
+            # PostgreSQL's JSONB rejects NaN/Infinity, so they must not pass validation either
+            data = json.loads(raw, parse_constant=_reject_constant)
+        except ValueError as e:
+            raise PayloadError(str(e)) from None
+        if not isinstance(data, dict):
+            raise PayloadError("payload must be a JSON object")
+        if "temp" not in data:
+            raise PayloadError("missing required field 'temp'")
+        values = []
+        for field in KNOWN_FIELDS:
+            value = data.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise PayloadError(f"'{field}' must be a number")
+            values.append(value)
+        return check_range(Reading(*values))
+
+
+# A JSON string may spell NUL as \u0000, but PostgreSQL's JSONB cannot store it and fails the whole INSERT.
+# An escaped backslash (\\u0000) is just text, hence the even run of backslashes in front.
+_NUL_ESCAPE = re.compile(rb"(?<!\\)(?:\\\\)*\\u0000")
+
+
+def reject_nul(raw):
+    """Raises PayloadError if JSON bytes contain a \\u0000 escape (valid JSON, but not valid JSONB)."""
+    if b"\\u0000" in raw and _NUL_ESCAPE.search(raw):
+        raise PayloadError("\\u0000 is not allowed: PostgreSQL cannot store it in JSONB")
+
+
+def decode_reading(raw):
+    """Validates a raw payload (JSON or binary bytes) and returns its Reading(temp, hum, uptime)."""
+    if is_binary(raw):
+        temp, hum, uptime, _ = _binary_values(*BINARY_LAYOUT.unpack(raw)[1:])
+        return Reading(temp, hum, uptime)
+    if raw[:1] == bytes([BINARY_MAGIC]):
+        raise PayloadError(f"binary reading must be {BINARY_LAYOUT.size} bytes, got {len(raw)}")
+    reject_nul(raw)
+    return _decode_json_reading(raw)
+
+
+def loads(raw):
+    """Parses a payload into a dict with the fastest decoder available (PayloadError if invalid)."""
+    if is_binary(raw):
+        temp, hum, uptime, status = _binary_values(*BINARY_LAYOUT.unpack(raw)[1:])
+        data = {"temp": temp, "hum": hum, "uptime": uptime, "status": status}
+        return {key: value for key, value in data.items() if value is not None or key == "temp"}
+    try:
+        return _loads(raw)
+    except _DECODE_ERRORS as e:
+        raise PayloadError(str(e)) from None
+
+
+def jsonb_text(raw):
+    """
+    The text we hand to the JSONB column: the original bytes, not a re-encoded copy.
+
+    Only call this after decode_reading() accepted the payload. Binary readings
+    become canonical JSON, so every row in smart_sensor_data looks the same.
+    """
+    if isinstance(raw, str):
+        return raw
+    if is_binary(raw):
+        return _canonical_json(*_binary_values(*BINARY_LAYOUT.unpack(raw)[1:]))
+    return bytes(raw).decode()
+
+
+def decode_binary_batch(payloads):
+    """Decodes many binary readings at once into a NumPy structured array (no Python loop)."""
+    import numpy as np
+
+    return np.frombuffer(b"".join(payloads), dtype=np.dtype(BINARY_DTYPE))
+
+
+def jsonb_texts(payloads):
+    """
+    jsonb_text() for a whole batch, in order.
+
+    JSON payloads pass through untouched; binary ones are decoded together with
+    one NumPy call and rendered as canonical JSON (same keys as the JSON sketch).
+    """
+    texts = [None] * len(payloads)
+    binary_at = []
+    for i, raw in enumerate(payloads):
+        if not isinstance(raw, str) and is_binary(raw):
+            binary_at.append(i)
+        else:
+            texts[i] = jsonb_text(raw)
+    if binary_at:
+        import numpy as np
+
+        batch = decode_binary_batch([payloads[i] for i in binary_at])
+        temps = np.round(batch["temp"].astype(np.float64), 2).tolist()
+        hums = np.round(batch["hum"].astype(np.float64), 2).tolist()
+        uptimes = batch["uptime"].tolist()
+        flags = batch["flags"].tolist()
+        for i, temp, hum, uptime, flag in zip(binary_at, temps, hums, uptimes, flags):
+            texts[i] = _canonical_json(temp if math.isfinite(temp) else None,
+                                       hum if math.isfinite(hum) else None,
+                                       None if uptime == UPTIME_MISSING else uptime,
+                                       _status(flag))
+    return texts
+
+
+def dedup_key(raw, reading):
+    """
+    A 63-bit fingerprint of the exact payload bytes, used to recognize a redelivered message.
+
+    Only readings that carry `uptime` get one: with a counter inside, identical
+    bytes from the same device mean the same reading. Without it, a device may
+    legitimately send the same values twice, so None (never deduplicated).
+    """
+    if reading.uptime is None:
+        return None
+    data = raw.encode() if isinstance(raw, str) else bytes(raw)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big") >> 1  # Fits a BIGINT
+
+
+# --- 2. DECODING MANY PAYLOADS AT ONCE ---
+def payload_frame(payloads):
+    """
+    Turns a list of payloads (dicts, str or bytes) into a DataFrame in one pass.
+
+    The known fields go straight into NumPy float columns (missing or null -> NaN);
+    other keys become plain columns in first-seen order. This replaces
+    pd.json_normalize, which inspects every value for nesting.
+    """
+    import numpy as np
+    import pandas as pd
+
+    records = [p if isinstance(p, dict) else loads(p) for p in payloads]
+    count = len(records)
+    columns = {}
+    for field in KNOWN_FIELDS:
+        if not any(field in r for r in records):
+            continue  # e.g. the Week 6 sketch sends no "uptime"
+        values = [r.get(field) for r in records]
+        try:
+            if field == "uptime" and all(isinstance(v, int) for v in values):
+                columns[field] = np.fromiter(values, dtype=np.int64, count=count)  # Keep "123s", not "123.0s"
+            else:
+                columns[field] = np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=count)
+        except (TypeError, ValueError):
+            columns[field] = values  # Legacy rows stored before validation: keep them as they are
+
+    extras = {}
+    for r in records:
+        for key in r:
+            if key not in columns and key not in extras:
+                extras[key] = None
+    for key in extras:
+        columns[key] = [r.get(key) for r in records]
+    return pd.DataFrame(columns)
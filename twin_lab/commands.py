@@ -0,0 +1,210 @@
+import fnmatch
+import threading
+import time
+
+from twin_lab.topics import ACK_TOPIC_FILTER, COMMAND_TOPIC_PREFIX, device_id
+
+# --- SETTINGS ---
+# Industry Standard: Keep one connection open and reuse it. A command publisher that
+# connects per click (or per Streamlit rerun) spends more time in TCP/MQTT handshakes than sending.
+COMMAND_QOS = 1              # The broker confirms every command (PUBACK) and re-sends it after a reconnect
+MAX_INFLIGHT = 1000          # Commands allowed on the wire before their PUBACK (paho's default is 20)
+ACK_TIMEOUT = 30.0           # Seconds before an unacknowledged command is reported as overdue
+FLEET_CACHE_SECONDS = 60.0   # How long the list of known devices is reused
+
+_channels = {}
+_singleton_lock = threading.Lock()
+
+
+def fleet_devices(engine=None, hours=24):
+    """Every device that reported in the last `hours` (read from the hourly rollups, or the raw table)."""
+    from sqlalchemy import text
+    from sqlalchemy.exc import ProgrammingError
+    from twin_lab.db import get_engine
+
+    queries = (
+        # ~24 small rows per device instead of every reading
+        """SELECT DISTINCT device_id FROM edu_iot_digital_twin_lab.smart_sensor_rollup_1h
+           WHERE bucket > NOW() - :hours * INTERVAL '1 hour'""",
+        """SELECT DISTINCT COALESCE(payload->>'device_id', sensor_id) FROM edu_iot_digital_twin_lab.smart_sensor_data
+           WHERE aud_insert_ts > NOW() - :hours * INTERVAL '1 hour'""",
+    )
+    with (engine or get_engine()).connect() as conn:
+        for query in queries:
+            try:
+                return sorted(d for (d,) in conn.execute(text(query), {"hours": hours}) if d)
+            except ProgrammingError:
+                conn.rollback()  # Rollup tables not created yet: ask the raw table instead
+    return []
+
+
+class CommandChannel:
+    """
+    One long-lived MQTT publisher for remote commands, with per-device delivery tracking.
+
+    send() fans a command out to any number of devices in one call: every
+    publish is queued at once and paho's network thread streams them out,
+    QoS 1, up to MAX_INFLIGHT unacknowledged at a time. Each device's latest
+    command moves from "in_flight" to "acked" when the broker's PUBACK
+    arrives, and to "confirmed" if the device echoes it on edu/iot/acks/<device>.
+    """
+
+    def __init__(self, broker, port, qos=COMMAND_QOS, max_inflight=MAX_INFLIGHT, ack_timeout=ACK_TIMEOUT):
+        self.broker = broker
+        self.port = port
+        self.qos = qos
+        self.max_inflight = max_inflight
+        self.ack_timeout = ack_timeout
+
+        self._lock = threading.Lock()
+        self._pending = {}       # mid -> (device, batch) waiting for the broker's PUBACK
+        self._early_acks = set() # PUBACKs that beat publish() back to us
+        self._batch = 0
+        self._devices = {}       # device -> latest command and its delivery state
+        self._fleet = (float("-inf"), [])
+        self.stats = {"sent": 0, "acked": 0, "confirmed": 0, "failed": 0, "batches": 0, "connected": False}
+        self._client = None
+
+    # --- 1. THE PUBLISHER ---
+    def start(self):
+        import paho.mqtt.client as mqtt
+        from paho.mqtt.enums import CallbackAPIVersion
+
+        self._client = mqtt.Client(CallbackAPIVersion.VERSION2)
+        self._client.max_inflight_messages_set(self.max_inflight)
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_publish = self._on_publish
+        self._client.on_message = self._on_device_ack
+        # connect_async + loop_start: clicks never wait for the broker, and reconnects are automatic
+        self._client.connect_async(self.broker, self.port, 60)
+        self._client.loop_start()
+        return self
+
+    def stop(self):
+        if self._client is not None:
+            self._client.loop_stop()
+            self._client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        client.subscribe(ACK_TOPIC_FILTER)  # Optional device-side confirmations
+        self.stats["connected"] = True
+        print(f"🕹️ Command channel connected to {self.broker}")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        # QoS 1 commands still in flight are re-sent by paho once the connection is back
+        self.stats["connected"] = False
+
+    def send(self, command, devices):
+        """
+        Publishes `command` to edu/iot/commands/<device> for every device, in one batch.
+
+        Returns the number of commands queued. Delivery is tracked per device
+        (see status()); this call never waits for the broker.
+        """
+        import paho.mqtt.client as mqtt
+
+        devices = list(dict.fromkeys(devices))  # Each device once, in the order given
+        sent_at = time.time()
+        with self._lock:
+            self._batch += 1
+            batch = self._batch
+            for device in devices:
+                self._devices[device] = {"device": device, "command": command, "state": "in_flight",
+                                         "batch": batch, "sent_at": sent_at, "acked_at": None}
+        queued = 0
+        for device in devices:
+            info = self._client.publish(f"{COMMAND_TOPIC_PREFIX}/{device}", command, qos=self.qos)
+            # NO_CONN: queued by paho and sent as soon as the connection is back
+            if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                self._mark(device, batch, "failed")
+                continue
+            queued += 1
+            with self._lock:
+                if info.mid in self._early_acks:
+                    self._early_acks.discard(info.mid)
+                    early = True
+                else:
+                    self._pending[info.mid] = (device, batch)
+                    early = False
+            if early:
+                self._mark(device, batch, "acked")
+        self.stats["sent"] += queued
+        self.stats["batches"] += 1
+        return queued
+
+    def send_to_group(self, command, pattern):
+        """Sends `command` to every known device matching a shell wildcard, e.g. 'greenhouse-*'."""
+        return self.send(command, fnmatch.filter(self.fleet(), pattern))
+
+    def send_to_fleet(self, command):
+        """Sends `command` to every device that reported recently."""
+        return self.send(command, self.fleet())
+
+    def fleet(self):
+        """Known devices, refreshed from PostgreSQL at most once per FLEET_CACHE_SECONDS."""
+        fetched_at, devices = self._fleet
+        if time.monotonic() - fetched_at >= FLEET_CACHE_SECONDS:
+            devices = fleet_devices()
+            self._fleet = (time.monotonic(), devices)
+        return devices
+
+    # --- 2. DELIVERY TRACKING ---
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        with self._lock:
+            pending = self._pending.pop(mid, None)
+            if pending is None:
+                self._early_acks.add(mid)  # send() has not recorded this mid yet
+                return
+        self._mark(*pending, "acked")
+
+    def _on_device_ack(self, client, userdata, msg):
+        device = device_id(msg.topic)
+        with self._lock:
+            entry = self._devices.get(device)
+            if (entry is None or entry["state"] == "confirmed"
+                    or entry["command"] != msg.payload.decode(errors="replace")):
+                return
+            entry["state"] = "confirmed"
+            entry["acked_at"] = entry["acked_at"] or time.time()
+        self.stats["confirmed"] += 1
+
+    def _mark(self, device, batch, state):
+        with self._lock:
+            entry = self._devices.get(device)
+            # A newer command to the same device replaces the older one's entry
+            if entry is None or entry["batch"] != batch or entry["state"] == "confirmed":
+                return
+            entry["state"] = state
+            if state == "acked":
+                entry["acked_at"] = time.time()
+        self.stats[state] += 1
+
+    def status(self, devices=None):
+        """The latest command per device (oldest first), with overdue in-flight commands flagged."""
+        now = time.time()
+        with self._lock:
+            entries = [dict(e) for d, e in self._devices.items() if devices is None or d in devices]
+        for entry in entries:
+            if entry["state"] == "in_flight" and now - entry["sent_at"] > self.ack_timeout:
+                entry["state"] = "overdue"
+        return sorted(entries, key=lambda e: e["sent_at"])
+
+    def summary(self):
+        """How many devices are in each delivery state, e.g. {'acked': 250, 'in_flight': 3}."""
+        counts = {}
+        for entry in self.status():
+            counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+        return counts
+
+
+def get_command_channel(broker, port):
+    """Returns the process-wide command channel for this broker, starting it on first use."""
+    key = (broker, port)
+    channel = _channels.get(key)
+    if channel is None:
+        with _singleton_lock:
+            channel = _channels.get(key)
+            if channel is None:
+                channel = _channels[key] = CommandChannel(broker, port).start()
+    return channel
@@ -0,0 +1,131 @@
+import math
+
+from twin_lab.config import config
+# --- SETTINGS ---
+# Industry Standard: Store changes, not samples. Process historians (OSIsoft PI, Wonderware)
+# keep only the points needed to redraw a signal within a stated error, plus a regular heartbeat.
+DEFAULT_MODE = "off"          # "off", "deadband" or "swinging_door"
+DEFAULT_ERROR = 0.1           # °C: the stored points redraw every reading within this error
+DEFAULT_HEARTBEAT = 300.0     # Seconds: a device is stored at least this often, even on a flat line
+DEFAULT_MAX_HOLD = 10.0       # Seconds a swinging-door point may wait for the device's next reading
+MODES = ("off", "deadband", "swinging_door")
+
+
+class _DeviceState:
+    __slots__ = ("anchor_t", "anchor_v", "held", "held_t", "held_v", "slope_max", "slope_min")
+
+    def __init__(self, t, v):
+        self.anchor_t, self.anchor_v = t, v
+        self.held = self.held_t = self.held_v = None
+        self.slope_max, self.slope_min = -math.inf, math.inf
+
+
+class Compressor:
+    """
+    Decides, per device, which readings must be stored.
+
+    offer() takes one reading and an opaque `item` (whatever the caller needs
+    to store it later) and returns (kept, dropped): the items to store now and
+    the items that are redundant. Readings without a finite value are always kept.
+
+    deadband: keep a reading when it differs from the last stored one by more
+    than `error`. Redrawn as steps, every reading is within `error`.
+
+    swinging_door: keep the points where a straight line from the last stored
+    point can no longer pass within `error` of every reading since. Redrawn by
+    linear interpolation, every reading is within `error`. The decision is about
+    the previous reading, so each device holds back one item until the next
+    reading, release() (a quiet device, after `max_hold` seconds) or flush().
+    """
+
+    def __init__(self, mode=DEFAULT_MODE, error=DEFAULT_ERROR, heartbeat=DEFAULT_HEARTBEAT,
+                 max_hold=DEFAULT_MAX_HOLD):
+        if mode not in MODES:
+            raise ValueError(f"Unknown compression mode {mode!r}: choose one of {MODES}")
+        self.mode = mode
+        self.error = error
+        self.heartbeat = heartbeat
+        self.max_hold = max_hold
+        self._devices = {}
+        self.stats = {"offered": 0, "kept": 0, "dropped": 0, "ratio": 1.0}
+
+    def offer(self, device, t, value, item):
+        self.stats["offered"] += 1
+        if value is None or not math.isfinite(value) or self.mode == "off":
+            return self._count([item], [])
+        state = self._devices.get(device)
+        if state is None:
+            self._devices[device] = _DeviceState(t, value)
+            return self._count([item], [])
+        if self.mode == "deadband":
+            return self._deadband(state, t, value, item)
+        return self._swinging_door(state, t, value, item)
+
+    def _deadband(self, state, t, value, item):
+        if abs(value - state.anchor_v) > self.error or t - state.anchor_t >= self.heartbeat:
+            state.anchor_t, state.anchor_v = t, value
+            return self._count([item], [])
+        return self._count([], [item])
+
+    def _swinging_door(self, state, t, value, item):
+        if t - state.anchor_t >= self.heartbeat:
+            # Heartbeat: close the segment at the held point and start a new one here
+            kept = [state.held, item] if state.held is not None else [item]
+            state.__init__(t, value)
+            return self._count(kept, [])
+
+        dt = max(t - state.anchor_t, 1e-9)
+        slope_max = max(state.slope_max, (value - self.error - state.anchor_v) / dt)
+        slope_min = min(state.slope_min, (value + self.error - state.anchor_v) / dt)
+        # The line from the anchor to this reading must pass through every door so far:
+        # then it redraws all the readings in between within `error`
+        if slope_max <= (value - state.anchor_v) / dt <= slope_min:
+            # The held point is redundant, this reading is the new candidate
+            dropped = [state.held] if state.held is not None else []
+            state.slope_max, state.slope_min = slope_max, slope_min
+            state.held, state.held_t, state.held_v = item, t, value
+            return self._count([], dropped)
+
+        # The doors crossed: the held point must be stored, and becomes the new anchor
+        kept = [state.held]
+        state.anchor_t, state.anchor_v = state.held_t, state.held_v
+        dt = max(t - state.anchor_t, 1e-9)
+        state.slope_max = (value - self.error - state.anchor_v) / dt
+        state.slope_min = (value + self.error - state.anchor_v) / dt
+        state.held, state.held_t, state.held_v = item, t, value
+        return self._count(kept, [])
+
+    def release(self, before):
+        """
+        The held-back items of readings taken before `before`: each is stored and starts a new segment.
+
+        Call it on a timer. A held item may carry an unacknowledged MQTT message
+        (reliable mode), and a quiet device would otherwise keep it in the
+        broker's in-flight window until it reports again.
+        """
+        kept = []
+        for state in self._devices.values():
+            if state.held is not None and state.held_t < before:
+                kept.append(state.held)
+                state.__init__(state.held_t, state.held_v)
+        return self._count(kept, [])[0]
+
+    def flush(self):
+        """Every held-back item (call on shutdown, so the last point of each line is stored)."""
+        return self.release(math.inf)
+
+    def _count(self, kept, dropped):
+        self.stats["kept"] += len(kept)
+        self.stats["dropped"] += len(dropped)
+        self.stats["ratio"] = round(self.stats["offered"] / self.stats["kept"], 2) if self.stats["kept"] else 1.0
+        return kept, dropped
+
+
+def compressor_from_env():
+    """A Compressor configured by COMPRESSION, COMPRESSION_ERROR, COMPRESSION_HEARTBEAT and COMPRESSION_MAX_HOLD (None when off)."""
+    mode = config.get("COMPRESSION", DEFAULT_MODE)
+    if mode == "off":
+        return None
+    return Compressor(mode, config.get_float("COMPRESSION_ERROR", DEFAULT_ERROR),
+                      config.get_float("COMPRESSION_HEARTBEAT", DEFAULT_HEARTBEAT),
+                      config.get_float("COMPRESSION_MAX_HOLD", DEFAULT_MAX_HOLD))
@@ -0,0 +1,94 @@
+import os
+import threading
+
+# --- SETTINGS ---
+# Industry Standard: Configuration lives in the environment (12-factor), and one object reads it.
+# Every script used to call load_dotenv() and parse its own os.getenv() strings; now they ask `config`.
+DEFAULT_MQTT_BROKER = "broker.hivemq.com"
+DEFAULT_MQTT_PORT = 1883
+ENV_FILE = ".env"
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # The repository root
+
+
+def find_env_file(start):
+    """The nearest .env in `start` or one of its parent folders (None if there is none)."""
+    folder = os.path.abspath(start)
+    while True:
+        candidate = os.path.join(folder, ENV_FILE)
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return None
+        folder = parent
+
+
+class Config:
+    """
+    The lab's settings: .env is loaded into the environment once, then every read goes to os.environ.
+
+    Scripts call config.load(__file__) so the .env next to them is found (like
+    load_dotenv() did); anything else loads on its first read, searching from the
+    working directory. Variables already set in the shell win over .env, and values
+    are read on every call, so fleet workers and tests can still change os.environ.
+    """
+
+    def __init__(self):
+        self.env_file = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self, near=None):
+        """Loads the .env nearest to `near` (a script path or folder), or to the working directory. Idempotent."""
+        if self._loaded:
+            return self
+        with self._lock:
+            if not self._loaded:
+                start = near if near is None or os.path.isdir(near) else os.path.dirname(os.path.abspath(near))
+                self.env_file = find_env_file(start) if start else None
+                self.env_file = self.env_file or find_env_file(os.getcwd())
+                if self.env_file is not None:
+                    from dotenv import load_dotenv  # Only paid for when there is a file to read
+
+                    load_dotenv(self.env_file)
+                self._loaded = True
+        return self
+
+    # --- 1. TYPED READS ---
+    def get(self, name, default=None):
+        self.load()
+        return os.environ.get(name, default)
+
+    def get_int(self, name, default=0):
+        value = self.get(name)
+        return int(value) if value not in (None, "") else default
+
+    def get_float(self, name, default=0.0):
+        value = self.get(name)
+        return float(value) if value not in (None, "") else default
+
+    def get_path(self, name, default):
+        """A folder setting. Relative paths start at the repository root, so every script finds the same folder."""
+        return os.path.join(ROOT, os.path.expanduser(self.get(name) or default))
+
+    # --- 2. SETTINGS SHARED BY SEVERAL SCRIPTS ---
+    @property
+    def mqtt_broker(self):
+        return self.get("MQTT_BROKER", DEFAULT_MQTT_BROKER)
+
+    @property
+    def mqtt_port(self):
+        return self.get_int("MQTT_PORT", DEFAULT_MQTT_PORT)
+
+    def db_params(self):
+        """The PostgreSQL credentials (DB_NAME, DB_USER, DB_PASS, DB_HOST, DB_PORT)."""
+        return dict(
+            dbname=self.get("DB_NAME"),
+            user=self.get("DB_USER"),
+            password=self.get("DB_PASS"),
+            host=self.get("DB_HOST"),
+            port=self.get("DB_PORT"),
+        )
+
+
+config = Config()
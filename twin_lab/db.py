@@ -0,0 +1,177 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+from twin_lab.config import config
+
+# --- SETTINGS ---
+# Industry Standard: Open connections once and reuse them. TCP + auth + TLS setup
+# usually costs far more than the INSERT we actually want to run.
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 10
+HEALTH_CHECK_AFTER = 30.0  # Seconds a connection may sit idle before we ping it on checkout
+
+_pool = None
+_engine = None
+_singleton_lock = threading.Lock()
+
+
+def db_params():
+    """Reads the database credentials from the environment (.env)."""
+    return config.db_params()
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of psycopg2 connections with health checks.
+
+    Callers borrow a connection with `with pool.connection() as conn:`. The block
+    commits on success and rolls back on error. Broken connections are thrown
+    away and silently replaced, so a Postgres restart does not crash the bridge.
+    """
+
+    def __init__(self, minconn=None, maxconn=None, health_check_after=HEALTH_CHECK_AFTER, **params):
+        # Read at construction time so values from .env (loaded by the script) are honored
+        minconn = minconn if minconn is not None else config.get_int("DB_POOL_MIN", POOL_MIN_CONN)
+        maxconn = maxconn if maxconn is not None else config.get_int("DB_POOL_MAX", POOL_MAX_CONN)
+        self.params = params or db_params()
+        # TCP keepalives let the OS notice dead peers on long-lived connections
+        self.params.setdefault("keepalives", 1)
+        self.params.setdefault("keepalives_idle", 30)
+        self.health_check_after = health_check_after
+
+        self._pool = pg_pool.ThreadedConnectionPool(0, maxconn, **self.params)
+        self._slots = threading.BoundedSemaphore(maxconn)  # Wait for a free connection instead of failing
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self.stats = {"checkouts": 0, "reconnects": 0, "discarded": 0}
+
+        # Warm up the minimum number of connections so the first message is fast
+        warm = [self._checkout() for _ in range(minconn)]
+        for conn in warm:
+            self._checkin(conn)
+
+    # --- 1. PUBLIC API ---
+    @contextmanager
+    def connection(self):
+        conn = self._checkout()
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            self._checkin(conn, broken=_is_connection_error(conn, e))
+            raise
+        self._checkin(conn)
+
+    def closeall(self):
+        self._pool.closeall()
+
+    # --- 2. CHECKOUT / CHECKIN ---
+    def _checkout(self):
+        self._slots.acquire()
+        try:
+            while True:
+                conn = self._pool.getconn()
+                if self._healthy(conn):
+                    with self._lock:
+                        self.stats["checkouts"] += 1
+                    return conn
+                # Transparent Reconnect: drop the dead connection and try a fresh one
+                self._discard(conn)
+                with self._lock:
+                    self.stats["reconnects"] += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, conn, broken=False):
+        try:
+            if not broken and not conn.closed and conn.status != psycopg2.extensions.STATUS_READY:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        with self._lock:
+            self.stats["discarded"] += 1
+        try:
+            self._pool.putconn(conn, close=True)
+        except Exception:
+            pass
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        idle_since = self._last_used.get(id(conn))
+        if idle_since is None or time.monotonic() - idle_since < self.health_check_after:
+            return True
+        # Health Check: a cheap round trip only for connections that sat idle
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+def _is_connection_error(conn, error):
+    return bool(conn.closed) or isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+
+def get_pool():
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _singleton_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+class LazyPool:
+    """
+    Stands in for get_pool() in background threads that start before Postgres is up.
+
+    The shared pool is looked up on every connection() call, so a failed first
+    connect is simply retried on the next one instead of crashing at startup.
+    """
+
+    def connection(self):
+        return get_pool().connection()
+
+
+def get_engine():
+    """Returns the process-wide SQLAlchemy engine (cached across Streamlit reruns)."""
+    global _engine
+    if _engine is None:
+        with _singleton_lock:
+            if _engine is None:
+                # Imported here so the bridges never pay for loading SQLAlchemy
+                from sqlalchemy import create_engine
+                from sqlalchemy.engine import URL
+
+                params = db_params()
+                url = URL.create(
+                    "postgresql",
+                    username=params["user"],
+                    password=params["password"],
+                    host=params["host"],
+                    port=int(params["port"]) if params["port"] else None,
+                    database=params["dbname"],
+                )
+                # pool_pre_ping replaces connections that died while idle
+                _engine = create_engine(url, pool_size=5, max_overflow=5, pool_pre_ping=True, pool_recycle=1800)
+    return _engine
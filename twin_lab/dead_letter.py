@@ -0,0 +1,62 @@
+import psycopg2
+
+from twin_lab.metrics import MESSAGES_FAILED
+from twin_lab.schema import DEAD_LETTER_TABLE, SCHEMA
+
+# --- SETTINGS ---
+# Industry Standard: Dead-Letter Queue. A row the database refuses will be refused on
+# every retry, so it is moved aside instead of blocking (or dropping) everything behind it.
+DEAD_LETTER_SQL = (f"INSERT INTO {SCHEMA}.{DEAD_LETTER_TABLE} (device_id, payload, error, received_at) "
+                   "VALUES (%s, %s, %s, to_timestamp(%s))")
+
+
+def is_row_error(error):
+    """True when PostgreSQL rejected the data itself (bad value, constraint), not the connection."""
+    return isinstance(error, (psycopg2.DataError, psycopg2.IntegrityError))
+
+
+def isolate(write, rows, reject):
+    """
+    Calls write(rows). If a row's data is rejected, splits the rows in halves until
+    the culprit is alone and hands it to reject(row, error); the rest still gets written.
+
+    Other errors (Postgres down) are raised as usual. The halves are written in
+    order, so whatever a raised error interrupts is always a suffix of `rows`.
+    """
+    try:
+        write(rows)
+        return
+    except Exception as e:
+        if not is_row_error(e):
+            raise
+        if len(rows) == 1:
+            reject(rows[0], e)
+            return
+    middle = len(rows) // 2
+    isolate(write, rows[:middle], reject)
+    isolate(write, rows[middle:], reject)
+
+
+def move_aside(pool, device, payload, received_at, error):
+    """
+    Stores one rejected reading in the dead-letter table. Returns False if even that failed.
+
+    Connection errors are raised, so the caller retries later; any other failure
+    (e.g. the table was never migrated) drops the reading with a loud message.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+    print(f"☠️ Dead-lettering a reading from {device}: {str(error).strip()}")
+    try:
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(DEAD_LETTER_SQL, (device, None if payload is None else bytes(payload), str(error).strip(),
+                                              received_at))
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
+    except Exception as e:
+        print(f"❌ Could not store it in {DEAD_LETTER_TABLE} either, dropping it: {e}")
+        MESSAGES_FAILED.inc(device=device, reason="rejected")
+        return False
+    MESSAGES_FAILED.inc(device=device, reason="dead_letter")
+    return True
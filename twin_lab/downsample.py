@@ -0,0 +1,162 @@
+import threading
+import time
+
+# --- SETTINGS ---
+# Industry Standard: Send the chart what the screen can show. A month of 2-second
+# readings is 1.3 million rows; a 1000-pixel-wide chart can't display more than ~1000 points.
+SCHEMA = "edu_iot_digital_twin_lab"
+TIME_RANGES = {"hour": 3600, "day": 86400, "week": 7 * 86400, "month": 30 * 86400}
+DEFAULT_MAX_POINTS = 1000
+OVERSAMPLE = 4            # SQL buckets per output point; LTTB picks the points that keep the shape
+ROLLUP_MIN_SECONDS = 2 * 86400  # From 2 days up, read the per-minute rollups instead of raw rows
+MIN_CACHE_SECONDS = 5.0
+MAX_CACHE_SECONDS = 60.0
+
+# How to read a temperature series out of each table
+SOURCES = {
+    "smart_sensor_data": {"value": "(payload->>'temp')::float8",
+                          "valid": "jsonb_typeof(payload->'temp') = 'number'", "device": "sensor_id"},
+    "sensor_data": {"value": "temperature", "valid": "temperature IS NOT NULL", "device": None},
+}
+
+_series_cache = {}
+_cache_lock = threading.Lock()
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: returns the indices of `threshold` points that best keep the line's shape.
+
+    The first and last points are always kept. Every bucket in between keeps
+    the point forming the largest triangle with the previously kept point and
+    the average of the next bucket, so peaks and dips survive the downsampling.
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    edges = np.append((np.arange(threshold - 1) * every).astype(np.int64) + 1, n)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2]
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(areas.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def bucket_seconds(seconds, max_points=DEFAULT_MAX_POINTS):
+    """Width of one SQL time bucket so a range returns at most max_points * OVERSAMPLE rows."""
+    return max(1.0, seconds / (max_points * OVERSAMPLE))
+
+
+def series_sql(seconds, table="smart_sensor_data", device=None, max_points=DEFAULT_MAX_POINTS, rollups=False):
+    """
+    SQL (SQLAlchemy text) for the average temperature per time bucket over the last `seconds`.
+
+    With rollups=True the per-minute rollup table is read instead of the raw
+    readings: a month is 43,200 small rows per device instead of 1.3 million.
+    """
+    from sqlalchemy import text
+
+    params = {"seconds": seconds, "width": bucket_seconds(seconds, max_points)}
+    if rollups:
+        device_filter = "AND device_id = :device" if device else ""
+        query = f"""
+            SELECT to_timestamp(floor(EXTRACT(EPOCH FROM bucket) / :width) * :width) AS aud_insert_ts,
+                   SUM(temp_sum) / SUM(temp_count) AS temp
+            FROM {SCHEMA}.smart_sensor_rollup_1m
+            WHERE bucket > NOW() - make_interval(secs => :seconds) {device_filter}
+            GROUP BY 1
+            ORDER BY 1
+        """
+    else:
+        source = SOURCES[table]
+        device_filter = f"AND {source['device']} = :device" if device and source["device"] else ""
+        query = f"""
+            SELECT to_timestamp(floor(EXTRACT(EPOCH FROM aud_insert_ts) / :width) * :width) AS aud_insert_ts,
+                   AVG({source['value']}) AS temp
+            FROM {SCHEMA}.{table}
+            WHERE aud_insert_ts > NOW() - make_interval(secs => :seconds)
+              AND {source['valid']} {device_filter}
+            GROUP BY 1
+            ORDER BY 1
+        """
+    if device_filter:
+        params["device"] = device
+    return text(query).bindparams(**params)
+
+
+def fetch_series(range_name, device=None, table="smart_sensor_data", max_points=DEFAULT_MAX_POINTS, engine=None):
+    """
+    Returns a DataFrame (aud_insert_ts, temp), oldest first, with at most `max_points` rows.
+
+    PostgreSQL averages the range into ~4x max_points time buckets, then LTTB
+    keeps the max_points that best preserve peaks and dips.
+    """
+    import pandas as pd
+    from sqlalchemy.exc import ProgrammingError
+    from twin_lab.db import get_engine
+
+    seconds = TIME_RANGES[range_name]
+    engine = engine or get_engine()
+    df = None
+    if table == "smart_sensor_data" and seconds >= ROLLUP_MIN_SECONDS:
+        try:
+            df = pd.read_sql_query(series_sql(seconds, table, device, max_points, rollups=True), engine)
+        except ProgrammingError:
+            df = None  # Rollup tables not created yet (only bridge_v3 keeps them): use the raw rows
+    if df is None or df.empty:
+        df = pd.read_sql_query(series_sql(seconds, table, device, max_points), engine)
+        if table == "smart_sensor_data":
+            df = _with_cold(df, seconds, device, max_points)
+    if len(df) > max_points:
+        x = df["aud_insert_ts"].astype("int64").to_numpy()
+        df = df.iloc[lttb(x, df["temp"].to_numpy(), max_points)].reset_index(drop=True)
+    return df
+
+
+def _with_cold(df, seconds, device, max_points):
+    """Adds the days already moved to Parquet (twin_lab.archive) in front of the PostgreSQL buckets."""
+    from datetime import datetime, timedelta, timezone
+
+    import pandas as pd
+    from twin_lab.archive import cold_series, has_cold_data
+
+    if not has_cold_data():
+        return df
+    end = datetime.now(timezone.utc)
+    cold = cold_series(end - timedelta(seconds=seconds), end, bucket_seconds(seconds, max_points), device)
+    if cold.empty:
+        return df
+    return pd.concat([cold, df], ignore_index=True).sort_values("aud_insert_ts", kind="stable").reset_index(drop=True)
+
+
+def get_series(range_name, device=None, table="smart_sensor_data", max_points=DEFAULT_MAX_POINTS):
+    """
+    fetch_series() shared by every dashboard session of this process.
+
+    A result is reused for about one bucket width (5-60 s), so a month chart
+    is queried at most once a minute no matter how many browsers show it.
+    """
+    key = (range_name, device, table, max_points)
+    ttl = min(max(bucket_seconds(TIME_RANGES[range_name], max_points), MIN_CACHE_SECONDS), MAX_CACHE_SECONDS)
+    with _cache_lock:
+        entry = _series_cache.get(key)
+        if entry is None:
+            entry = _series_cache[key] = {"lock": threading.Lock(), "fetched_at": float("-inf"), "frame": None}
+    if time.monotonic() - entry["fetched_at"] >= ttl:
+        with entry["lock"]:
+            if time.monotonic() - entry["fetched_at"] >= ttl:  # Another session may have just refreshed it
+                entry["frame"] = fetch_series(range_name, device, table, max_points)
+                entry["fetched_at"] = time.monotonic()
+    return entry["frame"]
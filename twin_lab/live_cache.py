@@ -0,0 +1,109 @@
+import threading
+import time
+
+from twin_lab.codec import payload_frame
+from twin_lab.db import get_engine
+
+# --- SETTINGS ---
+# Industry Standard: Read-through caching. Every browser session asks the cache;
+# only the cache talks to PostgreSQL, and only for rows it has not seen yet.
+SCHEMA = "edu_iot_digital_twin_lab"
+WINDOW_ROWS = 50         # Rolling window kept per device (what the dashboards display)
+REFRESH_INTERVAL = 5.0   # At most one database fetch per device every 5 seconds
+LOOKBACK_SECONDS = 5.0   # Re-read a few seconds back: slow transactions commit older timestamps late
+
+_cache = None
+_singleton_lock = threading.Lock()
+
+
+class ReadingCache:
+    """
+    A process-wide, per-device rolling window of the newest readings.
+
+    The first call for a device loads the last `window` rows. Later calls fetch
+    only rows newer than the last seen aud_insert_ts, and flatten just those
+    payloads. Sessions arriving while a fetch is running wait for it and reuse
+    its result instead of querying again.
+    """
+
+    def __init__(self, engine=None, window=WINDOW_ROWS, interval=REFRESH_INTERVAL, lookback=LOOKBACK_SECONDS):
+        self.engine = engine
+        self.window = window
+        self.interval = interval
+        self.lookback = lookback
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.stats = {"requests": 0, "fetches": 0, "rows_fetched": 0}
+
+    def get(self, device=None):
+        """Returns the newest readings (newest first) as a DataFrame. Treat it as read-only."""
+        entry = self._entry(device)
+        self.stats["requests"] += 1
+        if time.monotonic() - entry["fetched_at"] >= self.interval:
+            with entry["lock"]:
+                # Another session may have refreshed while we waited for the lock
+                if time.monotonic() - entry["fetched_at"] >= self.interval:
+                    self._refresh(device, entry)
+        return entry["frame"]
+
+    def _entry(self, device):
+        with self._lock:
+            entry = self._entries.get(device)
+            if entry is None:
+                import pandas as pd
+
+                entry = {"lock": threading.Lock(), "fetched_at": float("-inf"), "last_seen": None,
+                         "rows": None, "frame": pd.DataFrame()}
+                self._entries[device] = entry
+            return entry
+
+    def _refresh(self, device, entry):
+        # Imported here so importing twin_lab never pays for pandas/SQLAlchemy
+        import pandas as pd
+        from sqlalchemy import text
+
+        filters, params = [], {"window": self.window}
+        if device is not None:
+            filters.append("sensor_id = :device")
+            params["device"] = device
+        if entry["last_seen"] is not None:
+            # Delta Fetch: only what arrived since the last look
+            filters.append("aud_insert_ts >= :since")
+            params["since"] = entry["last_seen"] - pd.Timedelta(seconds=self.lookback)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        query = text(f"""
+            SELECT id, payload, aud_insert_ts
+            FROM {SCHEMA}.smart_sensor_data
+            {where}
+            ORDER BY aud_insert_ts DESC
+            LIMIT :window
+        """)
+        df_raw = pd.read_sql_query(query, self.engine or get_engine(), params=params)
+        self.stats["fetches"] += 1
+
+        rows = entry["rows"]
+        if rows is not None and not df_raw.empty:
+            df_raw = df_raw[~df_raw["id"].isin(rows["id"])]  # Drop the overlap we already hold
+        if not df_raw.empty:
+            self.stats["rows_fetched"] += len(df_raw)
+            # Flatten only the new payloads, never the whole window again
+            fresh = payload_frame(df_raw["payload"].tolist())
+            fresh["aud_insert_ts"] = df_raw["aud_insert_ts"].array
+            fresh["id"] = df_raw["id"].to_numpy()
+            rows = fresh if rows is None else pd.concat([fresh, rows], ignore_index=True)
+            rows = rows.sort_values("aud_insert_ts", ascending=False, kind="stable").head(self.window)
+            rows = rows.reset_index(drop=True)
+            entry["rows"] = rows
+            entry["last_seen"] = rows["aud_insert_ts"].max()
+            entry["frame"] = rows.drop(columns="id")
+        entry["fetched_at"] = time.monotonic()
+
+
+def get_reading_cache():
+    """Returns the process-wide reading cache (shared by every Streamlit session)."""
+    global _cache
+    if _cache is None:
+        with _singleton_lock:
+            if _cache is None:
+                _cache = ReadingCache()
+    return _cache
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from twin_lab.codec import loads, payload_frame
+from twin_lab.live_cache import get_reading_cache
+from twin_lab.topics import device_id
+
+# --- SETTINGS ---
+# Industry Standard: Push, don't poll. One MQTT subscriber per server process
+# receives every reading the moment it is published; browser sessions only
+# read from memory. PostgreSQL is only asked once, for the history before we started.
+RING_CAPACITY = 300      # Newest readings kept in memory per device (and for "all devices")
+BACKFILL_RETRY = 30.0    # Seconds before retrying a history load that failed
+
+_streams = {}
+_singleton_lock = threading.Lock()
+
+
+class LiveStream:
+    """
+    A background MQTT subscriber feeding per-device ring buffers of recent readings.
+
+    snapshot(device) returns the live readings (newest first), topped up with
+    history from PostgreSQL the first time a device is viewed. Frames are rebuilt
+    only when a new message has arrived, so many sessions polling every half
+    second cost almost nothing.
+    """
+
+    def __init__(self, broker, port, topic_filter, capacity=RING_CAPACITY, backfill=None):
+        self.broker = broker
+        self.port = port
+        self.topic_filter = topic_filter
+        self.capacity = capacity
+        self.backfill = backfill or (lambda device: get_reading_cache().get(device))
+
+        self._lock = threading.Lock()
+        self._buffers = {None: deque(maxlen=capacity)}  # None = every device
+        self._versions = {None: 0}
+        self._history = {}    # device -> DataFrame older than started_at
+        self._backfill_failed_at = {}
+        self._frames = {}     # device -> (version, DataFrame)
+        self.started_at = None
+        self.stats = {"received": 0, "malformed": 0, "connected": False}
+        self._client = None
+
+    # --- 1. THE SUBSCRIBER ---
+    def start(self):
+        import paho.mqtt.client as mqtt
+        from paho.mqtt.enums import CallbackAPIVersion
+
+        self.started_at = datetime.now(timezone.utc)
+        self._client = mqtt.Client(CallbackAPIVersion.VERSION2)
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_message = self._on_message
+        # connect_async + loop_start: never block a page render on the broker, reconnect automatically
+        self._client.connect_async(self.broker, self.port, 60)
+        self._client.loop_start()
+        return self
+
+    def stop(self):
+        if self._client is not None:
+            self._client.loop_stop()
+            self._client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        client.subscribe(self.topic_filter)  # Re-subscribe after every reconnect
+        self.stats["connected"] = True
+        print(f"📡 Live stream subscribed to {self.topic_filter}")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.stats["connected"] = False
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            reading = loads(msg.payload)
+        except ValueError:
+            self.stats["malformed"] += 1
+            return
+        if not isinstance(reading, dict):
+            self.stats["malformed"] += 1
+            return
+        reading["aud_insert_ts"] = datetime.now(timezone.utc)
+        device = device_id(msg.topic)
+        with self._lock:
+            buffer = self._buffers.get(device)
+            if buffer is None:
+                buffer = self._buffers[device] = deque(maxlen=self.capacity)
+                self._versions[device] = 0
+            buffer.appendleft(reading)
+            self._buffers[None].appendleft(reading)
+            self._versions[device] += 1
+            self._versions[None] += 1
+        self.stats["received"] += 1
+
+    # --- 2. READING FROM MEMORY ---
+    def snapshot(self, device=None):
+        """Returns the newest readings for `device` (None = all devices), newest first."""
+        import pandas as pd
+
+        history_changed = self._ensure_history(device)
+        with self._lock:
+            version = self._versions.get(device, 0)
+            cached = self._frames.get(device)
+            if cached is not None and cached[0] == version and not history_changed:
+                return cached[1]
+            live = list(self._buffers.get(device, ()))
+
+        frames = [payload_frame(live)] if live else []
+        history = self._history.get(device)
+        if history is not None and not history.empty:
+            frames.append(history)
+        if not frames:
+            return pd.DataFrame()
+        frame = pd.concat(frames, ignore_index=True).head(self.capacity) if len(frames) > 1 else frames[0]
+        with self._lock:
+            self._frames[device] = (version, frame)
+        return frame
+
+    def _ensure_history(self, device):
+        """Backfills readings stored before this subscriber started (once per device)."""
+        if device in self._history:
+            return False
+        failed_at = self._backfill_failed_at.get(device)
+        if failed_at is not None and time.monotonic() - failed_at < BACKFILL_RETRY:
+            return False
+        try:
+            history = self.backfill(device)
+        except Exception as e:
+            self._backfill_failed_at[device] = time.monotonic()
+            print(f"⚠️ Live stream: history for {device or 'all devices'} unavailable: {e}")
+            return False
+        if not history.empty:
+            # Everything since started_at arrives live, so only keep the older rows
+            history = history[history["aud_insert_ts"] < self.started_at].reset_index(drop=True)
+        self._history[device] = history
+        return True
+
+
+def get_live_stream(broker, port, topic_filter):
+    """Returns the process-wide live stream for this broker/topic, starting it on first use."""
+    key = (broker, port, topic_filter)
+    stream = _streams.get(key)
+    if stream is None:
+        with _singleton_lock:
+            stream = _streams.get(key)
+            if stream is None:
+                stream = _streams[key] = LiveStream(broker, port, topic_filter).start()
+    return stream
@@ -0,0 +1,42 @@
+import logging
+import time
+
+from twin_lab.config import config
+# --- SETTINGS ---
+# Industry Standard: Levelled logging. LOG_LEVEL=DEBUG shows every message (great in class,
+# one write per reading); INFO (default) shows startup, problems and periodic summaries only.
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(message)s"
+DEFAULT_SAMPLE_EVERY = 1000  # Log one summary line per this many messages...
+DEFAULT_SAMPLE_SECONDS = 5.0  # ...or when this many seconds have passed since the last one
+
+
+def get_logger(name):
+    """Returns a logger, configuring the root handler from LOG_LEVEL on first use."""
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(level=config.get("LOG_LEVEL", "INFO").upper(), format=LOG_FORMAT)
+    return logging.getLogger(name)
+
+
+class Sampler:
+    """
+    Decides which occurrences of a frequent event are worth a log line.
+
+    hit() is True for the 1st call, every `every`-th call, and whenever `interval`
+    seconds have passed since the last line. A flood of identical warnings becomes
+    a line every few seconds, while a quiet Wokwi board still shows regular signs of life.
+    """
+
+    def __init__(self, every=None, interval=None):
+        self.every = max(1, every or config.get_int("LOG_SAMPLE_EVERY", DEFAULT_SAMPLE_EVERY))
+        self.interval = interval if interval is not None else config.get_float("LOG_SAMPLE_SECONDS", DEFAULT_SAMPLE_SECONDS)
+        self.count = 0
+        self._last = float("-inf")
+
+    def hit(self):
+        self.count += 1
+        now = time.monotonic()
+        if self.count == 1 or self.count % self.every == 0 or now - self._last >= self.interval:
+            self._last = now
+            return True
+        return False
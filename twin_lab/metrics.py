@@ -0,0 +1,210 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- SETTINGS ---
+# Industry Standard: Observability. Expose numbers a monitoring system (Prometheus,
+# Grafana Agent, ...) can scrape, instead of printing a line for every message.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+MAX_LABEL_VALUES = 1000   # Beyond this many devices, new ones are counted under "other"
+OVERFLOW_LABEL = "other"
+
+
+class _Metric:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        if key not in self._values and len(self._values) >= MAX_LABEL_VALUES:
+            # Cardinality Guard: one time series per device is fine for a classroom, not for 100k twins
+            key = tuple(OVERFLOW_LABEL for _ in self.labels)
+        return key
+
+    def _label_text(self, key, extra=None):
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    # Text format: a device id taken from a topic may hold a backslash, a quote or a newline
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter(_Metric):
+    """A number that only goes up (messages received, rows stored, ...)."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            key = self._key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + self._label_text(key), value) for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Counts observations (e.g. seconds) into buckets, so percentiles can be computed later."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def totals(self):
+        """{labels: (count, sum)} for every series."""
+        with self._lock:
+            return {key: (series[2], series[1]) for key, series in self._values.items()}
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                running = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    running += bucket_count
+                    le = f'le="{bound}"'
+                    out.append((f"{self.name}_bucket{self._label_text(key, le)}", running))
+                out.append((f"{self.name}_sum{self._label_text(key)}", total))
+                out.append((f"{self.name}_count{self._label_text(key)}", count))
+        return out
+
+
+class Registry:
+    """Holds every metric of this process and renders the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._stats_sources = []
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def add_stats(self, prefix, collect):
+        """Exposes an existing stats dict (or a function returning one) as twin_<prefix>_<key> gauges."""
+        self._stats_sources.append((prefix, collect))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+        for prefix, collect in self._stats_sources:
+            try:
+                stats = collect() if callable(collect) else collect
+            except Exception:
+                continue  # e.g. the database pool can't be created right now: skip, don't fail the scrape
+            for key, value in stats.items():
+                if isinstance(value, (int, float)):  # bools count too: 1 = True
+                    lines.append(f"# TYPE twin_{prefix}_{key} gauge")
+                    lines.append(f"twin_{prefix}_{key} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# --- THE LAB'S STANDARD METRICS ---
+REGISTRY = Registry()
+MESSAGES_RECEIVED = REGISTRY.counter("twin_messages_received_total", "MQTT messages received.", ["device"])
+MESSAGES_STORED = REGISTRY.counter("twin_messages_stored_total", "Readings committed to PostgreSQL.", ["device"])
+MESSAGES_FAILED = REGISTRY.counter("twin_messages_failed_total", "Readings that were not stored.", ["device", "reason"])
+STAGE_SECONDS = REGISTRY.histogram("twin_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+
+
+def lap(stage, started):
+    """
+    Profiling Hook: records the time since `started` for one stage and returns now.
+
+    Chain it to time consecutive stages: t = lap("insert", t); t = lap("commit", t)
+    """
+    now = time.perf_counter()
+    STAGE_SECONDS.observe(now - started, stage=stage)
+    return now
+
+
+def count_by_device(counter, rows, **labels):
+    """Adds a batch of (device, ...) rows to a per-device counter with one increment per device."""
+    totals = {}
+    for row in rows:
+        totals[row[0]] = totals.get(row[0], 0) + 1
+    for device, count in totals.items():
+        counter.inc(count, device=device, **labels)
+
+
+def stage_profile():
+    """Where does the time go? Total seconds, calls, mean and share of time per stage."""
+    totals = {key[0]: value for key, value in STAGE_SECONDS.totals().items()}
+    grand_total = sum(seconds for _, seconds in totals.values()) or 1.0
+    return {
+        stage: {"calls": count, "seconds": round(seconds, 6),
+                "mean_ms": round(1000 * seconds / count, 4) if count else None,
+                "share_pct": round(100 * seconds / grand_total, 1)}
+        for stage, (count, seconds) in sorted(totals.items(), key=lambda item: -item[1][1])
+    }
+
+
+# --- THE HTTP ENDPOINT ---
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = self.registry.render(), "text/plain; version=0.0.4"
+        elif self.path == "/profile":
+            body, content_type = json.dumps(stage_profile(), indent=2), "application/json"
+        else:
+            self.send_error(404, "Try /metrics or /profile")
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would drown the terminal
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves /metrics (Prometheus) and /profile (stage timings) from a daemon thread. Returns the server or None."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        print(f"⚠️ Metrics endpoint disabled: port {port} unavailable ({e})")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{port}/metrics (stage profile: /profile)")
+    return server
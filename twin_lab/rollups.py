@@ -0,0 +1,188 @@
+import json
+
+# --- SETTINGS ---
+# Industry Standard: Pre-aggregate on the way in, so reports never rescan raw history.
+SCHEMA = "edu_iot_digital_twin_lab"
+GRAINS = {"minute": "smart_sensor_rollup_1m", "hour": "smart_sensor_rollup_1h"}
+MINUTE_GRAIN_MAX_HOURS = 48  # Windows up to 2 days read minute rollups; longer ones read hourly
+
+ROLLUP_DDL = """
+CREATE TABLE IF NOT EXISTS {schema}.{table} (
+    device_id   VARCHAR(50)      NOT NULL,
+    bucket      TIMESTAMPTZ      NOT NULL,
+    temp_count  BIGINT           NOT NULL,
+    temp_sum    DOUBLE PRECISION NOT NULL,
+    temp_min    DOUBLE PRECISION NOT NULL,
+    temp_max    DOUBLE PRECISION NOT NULL,
+    temp_sum_sq DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (device_id, bucket)
+);
+"""
+
+# Merge a batch into its bucket. date_trunc(now()) uses the transaction start time,
+# exactly like the aud_insert_ts default of the raw rows written in the same transaction.
+UPSERT_SQL = """
+INSERT INTO {schema}.{table} AS r
+    (device_id, bucket, temp_count, temp_sum, temp_min, temp_max, temp_sum_sq)
+SELECT v.device_id, date_trunc('{grain}', now()), v.n, v.s, v.lo, v.hi, v.sq
+FROM (VALUES %s) AS v(device_id, n, s, lo, hi, sq)
+ON CONFLICT (device_id, bucket) DO UPDATE SET
+    temp_count  = r.temp_count  + EXCLUDED.temp_count,
+    temp_sum    = r.temp_sum    + EXCLUDED.temp_sum,
+    temp_min    = LEAST(r.temp_min, EXCLUDED.temp_min),
+    temp_max    = GREATEST(r.temp_max, EXCLUDED.temp_max),
+    temp_sum_sq = r.temp_sum_sq + EXCLUDED.temp_sum_sq;
+"""
+
+UPSERT_TEMPLATE = "(%s, %s::bigint, %s::float8, %s::float8, %s::float8, %s::float8)"
+
+# Historical readings (backfill): the bucket comes from each reading's own time, not now().
+# Rows arrive pre-aggregated per device and minute; grouping again here gives the hour buckets.
+UPSERT_AT_SQL = """
+INSERT INTO {schema}.{table} AS r
+    (device_id, bucket, temp_count, temp_sum, temp_min, temp_max, temp_sum_sq)
+SELECT v.device_id, date_trunc('{grain}', to_timestamp(v.minute)), SUM(v.n), SUM(v.s), MIN(v.lo), MAX(v.hi), SUM(v.sq)
+FROM (VALUES %s) AS v(device_id, minute, n, s, lo, hi, sq)
+GROUP BY 1, 2
+ON CONFLICT (device_id, bucket) DO UPDATE SET
+    temp_count  = r.temp_count  + EXCLUDED.temp_count,
+    temp_sum    = r.temp_sum    + EXCLUDED.temp_sum,
+    temp_min    = LEAST(r.temp_min, EXCLUDED.temp_min),
+    temp_max    = GREATEST(r.temp_max, EXCLUDED.temp_max),
+    temp_sum_sq = r.temp_sum_sq + EXCLUDED.temp_sum_sq;
+"""
+
+UPSERT_AT_TEMPLATE = "(%s, %s::float8, %s::bigint, %s::float8, %s::float8, %s::float8, %s::float8)"
+
+
+def ensure_rollup_tables(cur):
+    """Creates the rollup tables if they are missing (safe to call at every startup)."""
+    for table in GRAINS.values():
+        cur.execute(ROLLUP_DDL.format(schema=SCHEMA, table=table))
+
+
+def reading_temp(payload):
+    """Pulls a numeric 'temp' out of a JSON payload (str, bytes or dict), or None."""
+    try:
+        data = payload if isinstance(payload, dict) else json.loads(payload)
+        temp = data.get("temp")
+    except (ValueError, AttributeError):
+        return None
+    if isinstance(temp, bool) or not isinstance(temp, (int, float)):
+        return None
+    return float(temp)
+
+
+def aggregate(readings):
+    """Folds (device_id, temp) pairs into one row per device: count, sum, min, max, sum of squares."""
+    totals = {}
+    for device, temp in readings:
+        if temp is None:
+            continue
+        row = totals.get(device)
+        if row is None:
+            totals[device] = [1, temp, temp, temp, temp * temp]
+        else:
+            row[0] += 1
+            row[1] += temp
+            row[2] = min(row[2], temp)
+            row[3] = max(row[3], temp)
+            row[4] += temp * temp
+    return [(device, *row) for device, row in totals.items()]
+
+
+def apply_rollups(cur, readings):
+    """Adds a batch of (device_id, temp) readings to the minute and hour rollups."""
+    from psycopg2.extras import execute_values
+
+    rows = aggregate(readings)
+    if not rows:
+        return
+    for grain, table in GRAINS.items():
+        execute_values(cur, UPSERT_SQL.format(schema=SCHEMA, table=table, grain=grain), rows,
+                       template=UPSERT_TEMPLATE, page_size=len(rows))
+
+
+def apply_rollups_at(cur, readings):
+    """Adds (device_id, unix_time, temp) readings to the rollups in the buckets of their own timestamps."""
+    from psycopg2.extras import execute_values
+
+    # Every real time zone is a whole number of minutes from UTC, so minute buckets can be cut here
+    rows = [(device, minute * 60, *row)
+            for (device, minute), *row in aggregate(((device, int(ts // 60)), temp) for device, ts, temp in readings)]
+    if not rows:
+        return
+    for grain, table in GRAINS.items():
+        execute_values(cur, UPSERT_AT_SQL.format(schema=SCHEMA, table=table, grain=grain), rows,
+                       template=UPSERT_AT_TEMPLATE, page_size=len(rows))
+
+
+def rebuild_rollups(cur, hours=24):
+    """
+    Recomputes the rollups for the last `hours` from the raw table.
+
+    Use it once after creating the tables (to cover data stored before the bridge
+    maintained rollups). The still-open current minute/hour are left alone so we
+    never double count what the bridge is adding right now.
+    """
+    for grain, table in GRAINS.items():
+        bounds = f"bucket >= date_trunc('{grain}', now() - make_interval(hours => %s)) AND bucket < date_trunc('{grain}', now())"
+        cur.execute(f"DELETE FROM {SCHEMA}.{table} WHERE {bounds}", (hours,))
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.{table}
+                (device_id, bucket, temp_count, temp_sum, temp_min, temp_max, temp_sum_sq)
+            SELECT sensor_id, bucket, COUNT(t), SUM(t), MIN(t), MAX(t), SUM(t * t)
+            FROM (
+                SELECT sensor_id, date_trunc('{grain}', aud_insert_ts) AS bucket,
+                       (payload->>'temp')::float8 AS t
+                FROM {SCHEMA}.smart_sensor_data
+                WHERE aud_insert_ts >= date_trunc('{grain}', now() - make_interval(hours => %s))
+                  AND aud_insert_ts < date_trunc('{grain}', now())
+                  AND jsonb_typeof(payload->'temp') = 'number'
+            ) raw
+            GROUP BY sensor_id, bucket
+        """, (hours,))
+
+
+def window_stats_sql(hours, device=None):
+    """
+    SQL (SQLAlchemy text) for avg/max/min/count/stddev over the last `hours`.
+
+    A 24h report for one device reads ~1,440 minute rows instead of every raw
+    reading. Bucket edges make the window accurate to one bucket.
+    """
+    from sqlalchemy import text
+
+    table = GRAINS["minute" if hours <= MINUTE_GRAIN_MAX_HOURS else "hour"]
+    device_filter = "AND device_id = :device" if device else ""
+    return text(f"""
+        SELECT
+            ROUND((SUM(temp_sum) / NULLIF(SUM(temp_count), 0))::numeric, 2) AS avg_temp,
+            MAX(temp_max) AS max_temp,
+            MIN(temp_min) AS min_temp,
+            COALESCE(SUM(temp_count), 0) AS total_readings,
+            ROUND(SQRT(GREATEST(SUM(temp_sum_sq) / NULLIF(SUM(temp_count), 0)
+                       - POWER(SUM(temp_sum) / NULLIF(SUM(temp_count), 0), 2), 0))::numeric, 2) AS stddev_temp
+        FROM {SCHEMA}.{table}
+        WHERE bucket > NOW() - :hours * INTERVAL '1 hour' {device_filter}
+    """).bindparams(hours=hours, **({"device": device} if device else {}))
+
+
+def main():
+    """Maintenance: python -m twin_lab.rollups [hours]  -> create the tables and rebuild recent history"""
+    import sys
+
+    from twin_lab.config import config
+    from twin_lab.db import get_pool
+
+    config.load()
+    hours = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            ensure_rollup_tables(cur)
+            rebuild_rollups(cur, hours)
+    print(f"✅ Rollups rebuilt for the last {hours} hours.")
+
+
+if __name__ == "__main__":
+    main()
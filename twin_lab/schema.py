@@ -0,0 +1,374 @@
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
+from twin_lab.config import config
+from twin_lab.rollups import ensure_rollup_tables
+
+# --- SETTINGS ---
+# Industry Standard: Version your schema like code. Every change is a numbered
+# migration, applied exactly once and recorded in schema_migrations.
+SCHEMA = "edu_iot_digital_twin_lab"
+TABLE = "smart_sensor_data"
+PARTITION_PREFIX = TABLE + "_p"   # Daily partitions: smart_sensor_data_p20261017
+DEFAULT_PARTITION = TABLE + "_default"
+DAYS_AHEAD = 7                    # Keep a week of empty partitions ready
+DEFAULT_RETENTION_DAYS = 90       # Older partitions are dropped (0 = keep forever)
+MAINTENANCE_INTERVAL = 3600.0     # Seconds between partition/retention runs inside the bridge
+DEDUP_TABLE = "smart_sensor_dedup"
+DEFAULT_DEDUP_HOURS = 24          # How long a message fingerprint is remembered (reliable ingest)
+CHECKPOINT_TABLE = "backfill_checkpoints"
+SNAPSHOT_TABLE = "device_snapshots"
+STALE_TABLE = "device_snapshots_stale"
+DEAD_LETTER_TABLE = "smart_sensor_dead_letter"
+LOCK_ID = 20260601                # Advisory lock so parallel workers never migrate at the same time
+
+PARTITIONED_DDL = f"""
+CREATE TABLE {SCHEMA}.{TABLE} (
+    id            BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    sensor_id     VARCHAR(50) DEFAULT 'ESP32_DEV_01',
+    payload       JSONB,
+    aud_insert_ts TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    -- Typed, generated columns: computed once on INSERT instead of on every read
+    temp      DOUBLE PRECISION GENERATED ALWAYS AS (
+                  CASE WHEN jsonb_typeof(payload->'temp') = 'number' THEN (payload->>'temp')::double precision END) STORED,
+    hum       DOUBLE PRECISION GENERATED ALWAYS AS (
+                  CASE WHEN jsonb_typeof(payload->'hum') = 'number' THEN (payload->>'hum')::double precision END) STORED,
+    uptime    BIGINT GENERATED ALWAYS AS (
+                  CASE WHEN jsonb_typeof(payload->'uptime') = 'number' THEN (payload->>'uptime')::numeric::bigint END) STORED,
+    device_id VARCHAR(50) GENERATED ALWAYS AS (LEFT(COALESCE(payload->>'device_id', sensor_id), 50)) STORED,
+
+    PRIMARY KEY (id, aud_insert_ts)
+) PARTITION BY RANGE (aud_insert_ts);
+"""
+
+
+# --- 1. MIGRATIONS ---
+def _create_rollups(cur):
+    ensure_rollup_tables(cur)
+
+
+def _partition_smart_sensor_data(cur):
+    """Rebuilds smart_sensor_data as a daily-partitioned table, copying any existing rows."""
+    cur.execute("""
+        SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+    """, (SCHEMA, TABLE))
+    row = cur.fetchone()
+    if row and row[0] == "p":
+        return  # Already partitioned
+
+    legacy = f"{TABLE}_legacy"
+    if row:
+        # Move the Week 5 table aside (and its constraint/sequence names, which must stay unique)
+        cur.execute(f"ALTER TABLE {SCHEMA}.{TABLE} RENAME TO {legacy}")
+        cur.execute(f"ALTER TABLE {SCHEMA}.{legacy} RENAME CONSTRAINT {TABLE}_pkey TO {legacy}_pkey")
+        cur.execute(f"ALTER SEQUENCE IF EXISTS {SCHEMA}.{TABLE}_id_seq RENAME TO {legacy}_id_seq")
+
+    cur.execute(PARTITIONED_DDL)
+    # Safety net: rows outside every daily partition land here instead of failing the INSERT
+    cur.execute(f"CREATE TABLE {SCHEMA}.{DEFAULT_PARTITION} PARTITION OF {SCHEMA}.{TABLE} DEFAULT")
+
+    if row:
+        cur.execute(f"SELECT MIN(aud_insert_ts), MAX(aud_insert_ts) FROM {SCHEMA}.{legacy}")
+        first, last = cur.fetchone()
+        if first is not None:
+            day = first.astimezone(timezone.utc).date()
+            while day <= last.astimezone(timezone.utc).date():
+                create_daily_partition(cur, day)
+                day += timedelta(days=1)
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.{TABLE} (id, sensor_id, payload, aud_insert_ts)
+            SELECT id, COALESCE(sensor_id, 'ESP32_DEV_01'), payload, COALESCE(aud_insert_ts, NOW())
+            FROM {SCHEMA}.{legacy}
+        """)
+        cur.execute(f"""
+            SELECT setval(pg_get_serial_sequence('{SCHEMA}.{TABLE}', 'id'),
+                          COALESCE((SELECT MAX(id) FROM {SCHEMA}.{TABLE}), 0) + 1, false)
+        """)
+        cur.execute(f"DROP TABLE {SCHEMA}.{legacy}")
+
+
+def _create_indexes(cur):
+    # B-tree (not BRIN) on the timestamp: it serves "ORDER BY aud_insert_ts DESC LIMIT n" directly
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_ts_idx ON {SCHEMA}.{TABLE} (aud_insert_ts DESC)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_device_ts_idx ON {SCHEMA}.{TABLE} (device_id, aud_insert_ts DESC)")
+
+
+def _create_dedup_table(cur):
+    # A partitioned table can only enforce uniqueness per partition (per day), and a redelivered
+    # message gets a new aud_insert_ts, so the fingerprints live in their own small table
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.{DEDUP_TABLE} (
+            device_id VARCHAR(50) NOT NULL,
+            dedup_key BIGINT      NOT NULL,
+            seen_at   TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (device_id, dedup_key)
+        )
+    """)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {DEDUP_TABLE}_seen_idx ON {SCHEMA}.{DEDUP_TABLE} (seen_at)")
+
+
+def _create_checkpoint_table(cur):
+    # One row per loaded chunk of a backfill file, committed in the same transaction as its rows
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.{CHECKPOINT_TABLE} (
+            file_key    VARCHAR(120) NOT NULL,
+            chunk_start BIGINT       NOT NULL,
+            chunk_end   BIGINT       NOT NULL,
+            rows_loaded BIGINT       NOT NULL DEFAULT 0,
+            loaded_at   TIMESTAMPTZ  NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (file_key, chunk_start)
+        )
+    """)
+
+
+def _create_snapshot_tables(cur):
+    # One compressed row per snapshot holds the whole fleet; the PRIMARY KEY finds the nearest one
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.{SNAPSHOT_TABLE} (
+            taken_at TIMESTAMPTZ PRIMARY KEY,
+            devices  INTEGER NOT NULL,
+            state    BYTEA   NOT NULL
+        )
+    """)
+    # Late data (a backfill) leaves a marker here: snapshots after it are ignored until rebuilt
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.{STALE_TABLE} (
+            since    TIMESTAMPTZ NOT NULL,
+            noted_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _create_dead_letter_table(cur):
+    # Rows PostgreSQL rejected: kept as raw bytes (not JSONB) so they can be inspected and fixed by hand
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.{DEAD_LETTER_TABLE} (
+            id          BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+            device_id   VARCHAR(50),
+            payload     BYTEA,
+            error       TEXT        NOT NULL,
+            received_at TIMESTAMPTZ,
+            failed_at   TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+MIGRATIONS = [
+    (1, "rollup tables", _create_rollups),
+    (2, "daily-partitioned smart_sensor_data with typed generated columns", _partition_smart_sensor_data),
+    (3, "time and per-device indexes", _create_indexes),
+    (4, "message fingerprints for idempotent ingest", _create_dedup_table),
+    (5, "checkpoints for resumable bulk backfills", _create_checkpoint_table),
+    (6, "fleet state snapshots for point-in-time queries", _create_snapshot_tables),
+    (7, "dead-letter table for rows the database rejected", _create_dead_letter_table),
+]
+
+
+def migrate(cur):
+    """Applies every migration that has not run yet. Returns the list of applied versions."""
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_ID,))
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.schema_migrations (
+            version     INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at  TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute(f"SELECT version FROM {SCHEMA}.schema_migrations")
+    done = {version for (version,) in cur.fetchall()}
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version in done:
+            continue
+        print(f"🧱 Applying migration {version}: {description}...")
+        step(cur)
+        cur.execute(f"INSERT INTO {SCHEMA}.schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description))
+        applied.append(version)
+    return applied
+
+
+# --- 2. PARTITION MANAGEMENT ---
+def partition_name(day):
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def create_daily_partition(cur, day):
+    """Creates the partition for one UTC day (no-op if it exists)."""
+    name = partition_name(day)
+    cur.execute("SELECT to_regclass(%s)", (f"{SCHEMA}.{name}",))
+    if cur.fetchone()[0] is not None:
+        return False
+
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    end = start + timedelta(days=1)
+    # Rows that fell into the default partition for this day must move into the new one
+    cur.execute("DROP TABLE IF EXISTS _moving_rows")
+    cur.execute("""
+        CREATE TEMP TABLE _moving_rows (id BIGINT, sensor_id VARCHAR(50), payload JSONB, aud_insert_ts TIMESTAMPTZ)
+        ON COMMIT DROP
+    """)
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {SCHEMA}.{DEFAULT_PARTITION}
+            WHERE aud_insert_ts >= %s AND aud_insert_ts < %s
+            RETURNING id, sensor_id, payload, aud_insert_ts
+        )
+        INSERT INTO _moving_rows SELECT * FROM moved
+    """, (start, end))
+    cur.execute(f"CREATE TABLE {SCHEMA}.{name} PARTITION OF {SCHEMA}.{TABLE} FOR VALUES FROM (%s) TO (%s)",
+                (start, end))
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.{TABLE} (id, sensor_id, payload, aud_insert_ts)
+        SELECT id, sensor_id, payload, aud_insert_ts FROM _moving_rows
+    """)
+    return True
+
+
+def ensure_partitions(cur, days_ahead=DAYS_AHEAD):
+    """Makes sure yesterday, today and the next `days_ahead` days all have partitions."""
+    today = datetime.now(timezone.utc).date()
+    created = []
+    for offset in range(-1, days_ahead + 1):
+        day = today + timedelta(days=offset)
+        if create_daily_partition(cur, day):
+            created.append(partition_name(day))
+    return created
+
+
+def daily_partitions(cur):
+    """Returns [(partition name, day)] for every daily partition, oldest first."""
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = %s AND p.relname = %s
+    """, (SCHEMA, TABLE))
+    partitions = []
+    for (name,) in cur.fetchall():
+        match = re.fullmatch(re.escape(PARTITION_PREFIX) + r"(\d{8})", name)
+        if match:
+            partitions.append((name, datetime.strptime(match.group(1), "%Y%m%d").date()))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def drop_expired_partitions(cur, retention_days):
+    """
+    Retention: drops whole daily partitions older than `retention_days`.
+
+    DROP TABLE is instant and leaves no dead rows behind, unlike DELETE + VACUUM.
+    """
+    if not retention_days:
+        return []
+    cutoff = datetime.now(timezone.utc).date() - timedelta(days=retention_days)
+    dropped = []
+    for name, day in daily_partitions(cur):
+        if day < cutoff:
+            cur.execute(f"DROP TABLE {SCHEMA}.{name}")
+            dropped.append(name)
+    return dropped
+
+
+def run_maintenance(cur, retention_days=None):
+    """Creates upcoming partitions, snapshots the fleet, archives old days to Parquet (if enabled) and applies retention."""
+    from twin_lab.archive import archive_partitions
+    from twin_lab.snapshots import take_snapshots, thin_snapshots
+
+    if retention_days is None:
+        retention_days = config.get_int("RETENTION_DAYS", DEFAULT_RETENTION_DAYS)
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_ID,))
+    created = ensure_partitions(cur)
+    # Snapshots before archiving: the readings they are built from are still in PostgreSQL
+    snapshots = take_snapshots(cur)
+    thin_snapshots(cur)
+    # Cold Storage first: a partition that is archived is never lost to retention
+    archived = archive_partitions(cur)
+    dropped = drop_expired_partitions(cur, retention_days)
+    # Redeliveries arrive within seconds or minutes; older fingerprints are no longer needed
+    dedup_hours = config.get_int("DEDUP_HOURS", DEFAULT_DEDUP_HOURS)
+    cur.execute(f"DELETE FROM {SCHEMA}.{DEDUP_TABLE} WHERE seen_at < NOW() - %s * INTERVAL '1 hour'",
+                (dedup_hours,))
+    if created or dropped or archived:
+        print(f"🗂️ Partitions created: {created or 'none'} | archived: {archived or 'none'} | dropped: {dropped or 'none'}")
+    if snapshots:
+        print(f"📸 Fleet snapshots taken: {snapshots}")
+    return created, dropped
+
+
+# --- 3. ENTRY POINTS FOR THE LAB SCRIPTS ---
+def prepare_database(pool):
+    """Startup hook: migrate and run maintenance once. Returns True if this process manages the schema."""
+    if config.get("AUTO_MIGRATE", "1") == "0":
+        return False
+    try:
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                migrate(cur)
+                run_maintenance(cur)
+        return True
+    except Exception as e:
+        # Least Privilege: an INSERT/SELECT-only user can't migrate. Keep running on the existing schema.
+        print(f"⚠️ Schema preparation skipped: {e}")
+        return False
+
+
+class MaintenanceThread:
+    """Re-runs partition creation and retention every hour inside a long-running bridge."""
+
+    def __init__(self, pool, interval=MAINTENANCE_INTERVAL):
+        self.pool = pool
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="schema-maintenance", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.pool.connection() as conn:
+                    with conn.cursor() as cur:
+                        run_maintenance(cur)
+            except Exception as e:
+                print(f"❌ Partition maintenance failed: {e}")
+
+
+def main():
+    """Cron / manual use: python -m twin_lab.schema [migrate|maintain|status]"""
+    import sys
+
+    from twin_lab.db import get_pool
+
+    config.load()
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            if command == "migrate":
+                applied = migrate(cur)
+                run_maintenance(cur)
+                print(f"✅ Schema up to date (applied: {applied or 'nothing new'}).")
+            elif command == "maintain":
+                run_maintenance(cur)
+                print("✅ Partition maintenance complete.")
+            elif command == "status":
+                cur.execute(f"SELECT version, description, applied_at FROM {SCHEMA}.schema_migrations ORDER BY version")
+                for version, description, applied_at in cur.fetchall():
+                    print(f"  {version:>3}  {applied_at:%Y-%m-%d %H:%M}  {description}")
+            else:
+                print("Usage: python -m twin_lab.schema [migrate|maintain|status]")
+
+
+if __name__ == "__main__":
+    main()
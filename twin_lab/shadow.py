@@ -0,0 +1,188 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit, unquote
+
+from twin_lab.config import config
+# --- SETTINGS ---
+# Industry Standard: The "Device Shadow" (AWS IoT, Azure Device Twins). The bridge already
+# sees every reading, so it keeps each device's current state in memory; "what is it doing now?"
+# is answered from RAM instead of a PostgreSQL round trip.
+MAX_DEVICES = 100000          # Least recently seen devices are forgotten beyond this
+DEFAULT_SHADOW_URL = "http://127.0.0.1:9110"
+FIELDS = ("device", "temp", "hum", "uptime", "last_seen", "readings", "alarm", "alarm_reason",
+          "alarm_since", "last_command", "command_at")
+
+
+class DeviceShadow:
+    """
+    The latest known state of one device.
+
+    __slots__ keeps every shadow to a fixed set of attributes with no
+    per-object __dict__, so 100,000 devices stay in the tens of megabytes.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, device):
+        self.device = device
+        self.temp = self.hum = self.uptime = None
+        self.last_seen = None
+        self.readings = 0
+        self.alarm = False
+        self.alarm_reason = self.alarm_since = None
+        self.last_command = self.command_at = None
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in FIELDS}
+
+
+class ShadowStore:
+    """
+    Device shadows for up to `max_devices` devices, kept in last-seen order.
+
+    The bridge calls update() for every reading, the anomaly monitor
+    set_alarm()/clear_alarm(), and command messages record_command().
+    Reads return plain dicts (timestamps are Unix seconds).
+    """
+
+    def __init__(self, max_devices=MAX_DEVICES):
+        self.max_devices = max_devices
+        self._lock = threading.Lock()
+        self._shadows = OrderedDict()   # device -> DeviceShadow, least recently seen first
+        self.stats = {"devices": 0, "updates": 0, "evicted": 0}
+
+    def _shadow(self, device):
+        """The device's shadow, created if needed (call with the lock held)."""
+        shadow = self._shadows.get(device)
+        if shadow is None:
+            if len(self._shadows) >= self.max_devices:
+                self._shadows.popitem(last=False)  # Forget the device silent for the longest
+                self.stats["evicted"] += 1
+            shadow = self._shadows[device] = DeviceShadow(device)
+            self.stats["devices"] = len(self._shadows)
+        return shadow
+
+    # --- 1. WRITES (from the bridge) ---
+    def update(self, device, reading, seen_at=None):
+        """Applies one reading (anything with temp/hum/uptime, e.g. codec.Reading)."""
+        with self._lock:
+            shadow = self._shadow(device)
+            self._shadows.move_to_end(device)  # O(1): keeps the eviction order current
+            shadow.temp, shadow.hum, shadow.uptime = reading.temp, reading.hum, reading.uptime
+            shadow.last_seen = seen_at or time.time()
+            shadow.readings += 1
+        self.stats["updates"] += 1
+
+    def set_alarm(self, device, reason):
+        with self._lock:
+            shadow = self._shadow(device)
+            if not shadow.alarm:
+                shadow.alarm_since = time.time()
+            shadow.alarm, shadow.alarm_reason = True, reason
+
+    def clear_alarm(self, device):
+        with self._lock:
+            shadow = self._shadows.get(device)
+            if shadow is not None:
+                shadow.alarm, shadow.alarm_reason, shadow.alarm_since = False, None, None
+
+    def record_command(self, device, command):
+        with self._lock:
+            shadow = self._shadow(device)
+            shadow.last_command, shadow.command_at = command, time.time()
+
+    # --- 2. READS ---
+    def get(self, device):
+        """One device's shadow as a dict, or None if the device is unknown."""
+        with self._lock:
+            shadow = self._shadows.get(device)
+            return shadow.as_dict() if shadow is not None else None
+
+    def latest(self):
+        """The shadow of the device that reported most recently (None if nothing has arrived)."""
+        with self._lock:
+            if not self._shadows:
+                return None
+            return self._shadows[next(reversed(self._shadows))].as_dict()
+
+    def snapshot(self, devices=None, alarm_only=False):
+        """Shadows of `devices` (default: every device), most recently seen first."""
+        with self._lock:
+            if devices is None:
+                shadows = list(reversed(self._shadows.values()))
+            else:
+                shadows = [s for s in map(self._shadows.get, devices) if s is not None]
+            return [s.as_dict() for s in shadows if s.alarm or not alarm_only]
+
+
+# --- 3. THE LOCAL HTTP/JSON API ---
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive: a polling client reuses one connection...
+    disable_nagle_algorithm = True  # ...and small replies are not held back waiting for an ACK
+    store = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/shadow/latest":
+            body = self.store.latest()
+        elif url.path.startswith("/shadow/"):
+            body = self.store.get(unquote(url.path[len("/shadow/"):]))
+        elif url.path == "/shadows":
+            devices = query["devices"][0].split(",") if "devices" in query else None
+            body = self.store.snapshot(devices, alarm_only=query.get("alarm", ["0"])[0] == "1")
+        elif url.path == "/stats":
+            body = dict(self.store.stats)
+        else:
+            self.send_error(404, "Try /shadow/<device>, /shadow/latest, /shadows or /stats")
+            return
+        if body is None:
+            self.send_error(404, "Device not seen yet")
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Pulse checks poll often; keep the terminal quiet
+
+
+def start_shadow_server(store, port, host="127.0.0.1"):
+    """Serves the shadow store as JSON from a daemon thread. Returns the server or None."""
+    if not port:
+        return None
+    handler = type("ShadowHandler", (_Handler,), {"store": store})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        print(f"⚠️ Shadow API disabled: port {port} unavailable ({e})")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="shadow-http", daemon=True).start()
+    print(f"🪞 Device shadows on http://{host}:{port}/shadows (one device: /shadow/<device>)")
+    return server
+
+
+def fetch_shadow(device=None, url=None, timeout=0.5):
+    """
+    Client side: one device's shadow (or the most recent one) from a running bridge.
+
+    Returns None if the bridge's shadow API is not reachable or has not seen the
+    device, so callers can fall back to PostgreSQL.
+    """
+    import urllib.request
+    from urllib.error import URLError
+
+    base = url or config.get("SHADOW_URL", DEFAULT_SHADOW_URL)
+    path = f"/shadow/{quote(device, safe='')}" if device else "/shadow/latest"
+    try:
+        with urllib.request.urlopen(base.rstrip("/") + path, timeout=timeout) as response:
+            return json.load(response)
+    except (URLError, OSError, ValueError):
+        return None
@@ -0,0 +1,285 @@
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+
+from twin_lab.config import config
+from twin_lab.schema import LOCK_ID, SCHEMA, SNAPSHOT_TABLE, STALE_TABLE, TABLE
+
+# --- SETTINGS ---
+# Industry Standard: Event sourcing's "snapshot + replay". smart_sensor_data is the delta log;
+# every so often the state of the whole fleet is saved in one compact row, so "what did every
+# device look like at 14:03 yesterday?" loads one snapshot and replays only the readings since.
+DEFAULT_SNAPSHOT_MINUTES = 60    # One snapshot per hour (0 = snapshots off)
+DEFAULT_SNAPSHOT_LAG = 300       # Seconds to wait after a boundary, so late batches are in before it is saved
+DEFAULT_HOURLY_DAYS = 7          # Older snapshots are thinned to one per day (midnight UTC)
+MAX_SNAPSHOTS_PER_RUN = 200      # Catch-up limit per maintenance run (keeps the transaction short)
+STATE_FIELDS = ("temp", "hum", "uptime", "last_seen", "readings")
+
+TAIL_SQL = f"""
+    SELECT device_id, temp, hum, uptime, EXTRACT(EPOCH FROM aud_insert_ts)::float8, readings FROM (
+        SELECT DISTINCT ON (device_id) device_id, temp, hum, uptime, aud_insert_ts,
+               COUNT(*) OVER (PARTITION BY device_id) AS readings
+        FROM {SCHEMA}.{TABLE}
+        WHERE aud_insert_ts >= to_timestamp(%s) AND aud_insert_ts < to_timestamp(%s)
+          AND device_id IS NOT NULL {{device_filter}}
+        ORDER BY device_id, aud_insert_ts DESC, id DESC
+    ) latest
+"""
+# Snapshots taken after a pending late-data marker do not include those readings: skip them
+NEAREST_SQL = f"""
+    SELECT EXTRACT(EPOCH FROM taken_at)::float8, state FROM {SCHEMA}.{SNAPSHOT_TABLE}
+    WHERE taken_at <= to_timestamp(%s)
+      AND taken_at <= COALESCE((SELECT MIN(since) FROM {SCHEMA}.{STALE_TABLE}), 'infinity')
+    ORDER BY taken_at DESC LIMIT 1
+"""
+INSERT_SQL = (f"INSERT INTO {SCHEMA}.{SNAPSHOT_TABLE} (taken_at, devices, state) "
+              "VALUES (to_timestamp(%s), %s, %s) ON CONFLICT (taken_at) DO NOTHING")
+
+
+def snapshot_minutes():
+    return config.get_int("SNAPSHOT_MINUTES", DEFAULT_SNAPSHOT_MINUTES)
+
+
+def to_unix(at):
+    """A datetime (naive = UTC), Unix seconds or an ISO 8601 string -> Unix seconds."""
+    if isinstance(at, datetime):
+        return (at if at.tzinfo else at.replace(tzinfo=timezone.utc)).timestamp()
+    from twin_lab.backfill import parse_time
+
+    return parse_time(at)
+
+
+# --- 1. THE COMPACT STATE ---
+# A fleet state is {device: [temp, hum, uptime, last_seen, readings]}; it is stored column by
+# column (all temps together, all devices together...), which zlib compresses far better than rows
+def encode_state(state):
+    devices = sorted(state)
+    columns = {"device": devices}
+    for i, field in enumerate(STATE_FIELDS):
+        columns[field] = [state[device][i] for device in devices]
+    return zlib.compress(json.dumps(columns, separators=(",", ":")).encode())
+
+
+def decode_state(blob, devices=None):
+    """The stored state (only `devices`, a set, if given)."""
+    columns = json.loads(zlib.decompress(blob))
+    rows = zip(columns["device"], *(columns[field] for field in STATE_FIELDS))
+    return {row[0]: list(row[1:]) for row in rows if devices is None or row[0] in devices}
+
+
+def _apply(state, tail):
+    """Replays a tail {device: (temp, hum, uptime, last_seen, count)} onto a state: newest reading wins."""
+    for device, (temp, hum, uptime, seen, count) in tail.items():
+        old = state.get(device)
+        if old is None or seen >= old[3]:
+            state[device] = [temp, hum, uptime, seen, (old[4] if old else 0) + count]
+        else:
+            old[4] += count
+
+
+# --- 2. THE DELTA LOG (start <= aud_insert_ts < end) ---
+def _hot_tail(cur, start, end, devices):
+    device_filter = "AND device_id = ANY(%s)" if devices else ""
+    cur.execute(TAIL_SQL.format(device_filter=device_filter),
+                (start, end, sorted(devices)) if devices else (start, end))
+    return {device: (temp, hum, uptime, seen, count) for device, temp, hum, uptime, seen, count in cur.fetchall()}
+
+
+def _plain(value, kind=float):
+    """A pandas cell as a JSON-friendly number (missing values, NaN, become None)."""
+    return None if value is None or value != value else kind(value)
+
+
+def _cold_tail(start, end, devices):
+    """The same, from days already moved to Parquet (empty when nothing is archived)."""
+    from twin_lab.archive import has_cold_data, read_cold
+
+    if not has_cold_data():
+        return {}
+    one = next(iter(devices)) if devices and len(devices) == 1 else None
+    table = read_cold(datetime.fromtimestamp(start, timezone.utc), datetime.fromtimestamp(end, timezone.utc), one,
+                      ("device_id", "aud_insert_ts", "temp", "hum", "uptime"))
+    if table is None or not table.num_rows:
+        return {}
+    df = table.to_pandas()
+    if devices:
+        df = df[df["device"].isin(devices)]
+    df = df.sort_values("aud_insert_ts", kind="stable")
+    counts = df.groupby("device").size()
+    tail = {}
+    for row in df.groupby("device").tail(1).itertuples(index=False):
+        tail[row.device] = (_plain(row.temp), _plain(row.hum), _plain(row.uptime, int),
+                            row.aud_insert_ts.timestamp(), int(counts[row.device]))
+    return tail
+
+
+def replay_tail(cur, state, start, end, devices=None):
+    """Applies every reading in [start, end) to `state`, from PostgreSQL and the archive. Returns how many."""
+    replayed = 0
+    for tail in (_cold_tail(start, end, devices), _hot_tail(cur, start, end, devices)):
+        _apply(state, tail)
+        replayed += sum(entry[4] for entry in tail.values())
+    return replayed
+
+
+# --- 3. TAKING SNAPSHOTS (from run_maintenance) ---
+def _next_boundary(after, now, minutes, hourly_days):
+    """The first snapshot time after `after`: every `minutes` recently, midnight UTC further back."""
+    step = 86400 if after < now - hourly_days * 86400 else minutes * 60
+    return (after // step + 1) * step
+
+
+def _first_reading(cur):
+    """Unix time of the oldest reading in either tier (None if there are none)."""
+    from twin_lab.archive import archive_dir, has_cold_data
+
+    cur.execute(f"SELECT EXTRACT(EPOCH FROM MIN(aud_insert_ts))::float8 FROM {SCHEMA}.{TABLE}")
+    first = cur.fetchone()[0]
+    if has_cold_data():
+        days = sorted(name[len("date="):] for name in os.listdir(archive_dir()) if name.startswith("date="))
+        if days:
+            oldest = datetime.strptime(days[0], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+            first = oldest if first is None else min(first, oldest)
+    return first
+
+
+def take_snapshots(cur, minutes=None, now=None, limit=MAX_SNAPSHOTS_PER_RUN):
+    """
+    Writes every snapshot that is due, each built from the previous one plus the readings since.
+
+    Run under the maintenance lock. The first run starts from the oldest
+    reading (daily steps for old history); later runs rebuild whatever late
+    data made stale and add the newest boundaries. Returns the number written.
+    """
+    minutes = snapshot_minutes() if minutes is None else minutes
+    if not minutes:
+        return 0
+    now = now or time.time()
+    lag = config.get_float("SNAPSHOT_LAG", DEFAULT_SNAPSHOT_LAG)
+    hourly_days = config.get_int("SNAPSHOT_HOURLY_DAYS", DEFAULT_HOURLY_DAYS)
+
+    # Late data first: drop what it made stale. Markers committed after this DELETE stay for the next run
+    cur.execute(f"DELETE FROM {SCHEMA}.{STALE_TABLE} RETURNING EXTRACT(EPOCH FROM since)::float8")
+    stale = [since for (since,) in cur.fetchall()]
+    if stale:
+        cur.execute(f"DELETE FROM {SCHEMA}.{SNAPSHOT_TABLE} WHERE taken_at > to_timestamp(%s)", (min(stale),))
+
+    cur.execute(NEAREST_SQL, (now,))
+    row = cur.fetchone()
+    if row is not None:
+        taken_at, state = row[0], decode_state(row[1])
+    else:
+        taken_at, state = _first_reading(cur), {}
+        if taken_at is None:
+            return 0  # Nothing to remember yet
+
+    written = 0
+    boundary = _next_boundary(taken_at, now, minutes, hourly_days)
+    while boundary <= now - lag and written < limit:
+        replay_tail(cur, state, taken_at, boundary)
+        cur.execute(INSERT_SQL, (boundary, len(state), encode_state(state)))
+        taken_at, written = boundary, written + 1
+        boundary = _next_boundary(taken_at, now, minutes, hourly_days)
+    return written
+
+
+def thin_snapshots(cur, hourly_days=None):
+    """Keeps only the midnight snapshot of days older than `hourly_days`. Returns how many were deleted."""
+    if hourly_days is None:
+        hourly_days = config.get_int("SNAPSHOT_HOURLY_DAYS", DEFAULT_HOURLY_DAYS)
+    cur.execute(f"""
+        DELETE FROM {SCHEMA}.{SNAPSHOT_TABLE}
+        WHERE taken_at < NOW() - %s * INTERVAL '1 day' AND EXTRACT(EPOCH FROM taken_at)::bigint %% 86400 <> 0
+    """, (hourly_days,))
+    return cur.rowcount
+
+
+def invalidate_snapshots(cur, since):
+    """
+    Late data: marks every snapshot taken after `since` (Unix seconds) as stale.
+
+    Call it in the transaction that writes readings older than the newest
+    snapshot (e.g. a backfill). It is a plain INSERT, so parallel loaders never
+    wait on each other; readers skip the stale snapshots (replaying a longer
+    tail) until the next maintenance run rebuilds them.
+    """
+    cur.execute(f"INSERT INTO {SCHEMA}.{STALE_TABLE} (since) VALUES (to_timestamp(%s))", (since,))
+
+
+# --- 4. TIME TRAVEL ---
+def state_at(cur, at, devices=None):
+    """
+    The fleet as it was at `at` (a datetime, Unix seconds or ISO string).
+
+    Loads the newest snapshot taken at or before `at` and replays only the
+    readings between the two, so the cost depends on the snapshot interval and
+    the fleet size, never on how much history is stored. Returns a dict with
+    "at", "snapshot_at" (None before the first snapshot), "replayed" and
+    "devices": one dict per device (like ShadowStore.snapshot), most recently seen first.
+    """
+    at = to_unix(at)
+    wanted = set(devices) if devices else None
+    cur.execute(NEAREST_SQL, (at,))
+    row = cur.fetchone()
+    snapshot_at, state = (row[0], decode_state(row[1], wanted)) if row is not None else (None, {})
+    replayed = replay_tail(cur, state, snapshot_at or 0.0, at, wanted)
+    fleet = [dict(zip(("device",) + STATE_FIELDS, [device] + values)) for device, values in state.items()]
+    fleet.sort(key=lambda entry: -entry["last_seen"])
+    return {"at": at, "snapshot_at": snapshot_at, "replayed": replayed, "devices": fleet}
+
+
+def fleet_state_at(at, devices=None, pool=None):
+    """state_at() on a pooled connection: the entry point for analytics and the dashboards."""
+    from twin_lab.db import get_pool
+
+    with (pool or get_pool()).connection() as conn:
+        with conn.cursor() as cur:
+            return state_at(cur, at, devices)
+
+
+def main():
+    """Cron / manual use: python -m twin_lab.snapshots [take | at <time> [device ...] | status]"""
+    import sys
+
+    from twin_lab.db import get_pool
+
+    config.load()
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "at" and len(sys.argv) > 2:
+        started = time.perf_counter()
+        result = fleet_state_at(sys.argv[2], sys.argv[3:] or None)
+        base = (f"snapshot {datetime.fromtimestamp(result['snapshot_at'], timezone.utc):%Y-%m-%d %H:%M}"
+                if result["snapshot_at"] is not None else "no snapshot")
+        print(f"⏪ {len(result['devices'])} devices at {datetime.fromtimestamp(result['at'], timezone.utc)} "
+              f"({base} + {result['replayed']} readings, {1000 * (time.perf_counter() - started):.0f} ms)")
+        for entry in result["devices"]:
+            seen = datetime.fromtimestamp(entry["last_seen"], timezone.utc)
+            print(f"  {entry['device']:<20} {entry['temp']}°C  {entry['hum']}%  last seen {seen:%Y-%m-%d %H:%M:%S}")
+        return
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            if command == "take":
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_ID,))
+                written = take_snapshots(cur)
+                thinned = thin_snapshots(cur)
+                print(f"📸 Snapshots written: {written} | thinned: {thinned}")
+            elif command == "status":
+                cur.execute(f"""
+                    SELECT COUNT(*), MIN(taken_at), MAX(taken_at), COALESCE(SUM(octet_length(state)), 0),
+                           COALESCE(MAX(devices), 0)
+                    FROM {SCHEMA}.{SNAPSHOT_TABLE}
+                """)
+                count, first, last, size, devices = cur.fetchone()
+                if not count:
+                    print("📭 No snapshots yet (they are taken by schema maintenance, or: take)")
+                else:
+                    print(f"  {count} snapshots from {first:%Y-%m-%d %H:%M} to {last:%Y-%m-%d %H:%M} | "
+                          f"up to {devices} devices | {size / 1e6:.1f} MB")
+            else:
+                print("Usage: python -m twin_lab.snapshots [take | at <time> [device ...] | status]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from twin_lab.codec import PayloadError, decode_reading, jsonb_texts
+from twin_lab.dead_letter import isolate, move_aside
+from twin_lab.metrics import MESSAGES_STORED, count_by_device, lap
+from twin_lab.rollups import apply_rollups_at
+from twin_lab.snapshots import invalidate_snapshots
+
+# --- SETTINGS ---
+# Industry Standard: Write-Ahead Logging. Land every reading on local disk first,
+# then replay it into PostgreSQL whenever the database is reachable.
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024   # Roll over to a new segment file at 16 MB
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024     # Never use more than 1 GB of disk
+DEFAULT_FSYNC_INTERVAL = 1.0               # Force data to the physical disk at most once a second
+INSERT_SQL = "INSERT INTO edu_iot_digital_twin_lab.smart_sensor_data (sensor_id, payload, aud_insert_ts) VALUES %s"
+INSERT_TEMPLATE = "(%s, %s, to_timestamp(%s))"  # A reading keeps the time it was received, not the replay time
+
+# Every record on disk is: [body length][crc32 of receive time + body][device length][receive time, Unix float64]
+# followed by the body (device bytes + payload bytes)
+HEADER = struct.Struct("<IIHd")
+RECEIVED = struct.Struct("<d")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".wal"
+LEGACY_SUFFIX = ".log"  # Segments written before records carried their receive time
+OFFSET_FILE = "offset"
+
+
+class Spool:
+    """
+    An append-only, segmented log of (device id, raw MQTT payload, receive time) records on local disk.
+
+    Writers call append(). Readers call read_batch(offset) and, once the batch is
+    safely stored elsewhere, commit_offset(). Fully consumed segment files are
+    deleted, which keeps the disk usage bounded by `max_bytes`.
+    """
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES, max_bytes=DEFAULT_MAX_BYTES,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        if any(name.startswith(SEGMENT_PREFIX) and name.endswith(LEGACY_SUFFIX) for name in os.listdir(directory)):
+            print(f"⚠️ Spool: {directory} holds segments in the old format (no receive time). They are left "
+                  "untouched: drain them with the previous bridge version, or delete them.")
+
+        self._lock = threading.Lock()
+        self.stats = {"appended": 0, "rejected": 0, "corrupt_skipped": 0}
+
+        segments = self._segment_ids() or [1]
+        self._active_id = segments[-1]
+        # Crash Recovery: cut off a half-written record left by a crash
+        self._truncate_torn_tail(self._active_id)
+        self._file = open(self._path(self._active_id), "ab")
+        self._active_size = self._file.tell()
+        self._last_fsync = time.monotonic()
+        self._total_bytes = sum(os.path.getsize(self._path(s)) for s in self._segment_ids())
+
+    # --- 1. WRITING ---
+    def append(self, payload, device="", received_at=None):
+        """Durably appends one payload (bytes) and its receive time (default: now). Returns False if the spool is full."""
+        received_at = time.time() if received_at is None else received_at
+        device_bytes = device.encode()
+        body = device_bytes + payload
+        crc = zlib.crc32(body, zlib.crc32(RECEIVED.pack(received_at)))
+        record = HEADER.pack(len(body), crc, len(device_bytes), received_at) + body
+        with self._lock:
+            if self._total_bytes + len(record) > self.max_bytes:
+                self.stats["rejected"] += 1
+                return False
+            if self._active_size and self._active_size + len(record) > self.segment_bytes:
+                self._roll_segment()
+
+            self._file.write(record)
+            self._file.flush()  # Hand the bytes to the OS: survives a crash of this process
+            self._active_size += len(record)
+            self._total_bytes += len(record)
+            self.stats["appended"] += 1
+
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._file.fileno())  # Survives a crash of the whole machine
+                self._last_fsync = time.monotonic()
+        return True
+
+    def _roll_segment(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._active_id += 1
+        self._file = open(self._path(self._active_id), "ab")
+        self._active_size = 0
+
+    # --- 2. READING ---
+    def read_batch(self, offset, max_records):
+        """Returns ([(device, payload, received_at), ...], next_offset) starting at offset=(segment_id, position)."""
+        segment_id, position = offset
+        records = []
+        while len(records) < max_records:
+            with self._lock:
+                active_id, active_size = self._active_id, self._active_size
+            if segment_id > active_id:
+                break
+            if not os.path.exists(self._path(segment_id)):
+                # Segment already consumed and deleted: jump to the oldest one left
+                remaining = [s for s in self._segment_ids() if s > segment_id]
+                if not remaining:
+                    break
+                segment_id, position = remaining[0], 0
+                continue
+
+            # Only read what the writer has finished writing
+            limit = active_size if segment_id == active_id else os.path.getsize(self._path(segment_id))
+            position, complete = self._read_segment(segment_id, position, limit, max_records - len(records), records)
+            if segment_id == active_id or not complete:
+                break
+            segment_id, position = segment_id + 1, 0
+        return records, (segment_id, position)
+
+    def _read_segment(self, segment_id, position, limit, max_records, out):
+        """Memory-maps one segment and parses records. Returns (position, reached_end)."""
+        if limit <= position:
+            return position, True
+        with open(self._path(segment_id), "rb") as f:
+            with mmap.mmap(f.fileno(), limit, access=mmap.ACCESS_READ) as view:
+                count = 0
+                while count < max_records:
+                    if position + HEADER.size > limit:
+                        break
+                    length, crc, device_length, received_at = HEADER.unpack_from(view, position)
+                    end = position + HEADER.size + length
+                    if end > limit:
+                        break
+                    body = view[position + HEADER.size:end]
+                    if zlib.crc32(body, zlib.crc32(RECEIVED.pack(received_at))) != crc or device_length > length:
+                        # Corruption: skip the rest of this segment rather than replaying garbage
+                        self.stats["corrupt_skipped"] += 1
+                        print(f"⚠️ Spool: corrupt record in segment {segment_id}, skipping its remainder.")
+                        return limit, True
+                    out.append((body[:device_length].decode(), body[device_length:], received_at))
+                    position = end
+                    count += 1
+                return position, position >= limit
+
+    # --- 3. CRASH-SAFE OFFSETS ---
+    def load_offset(self):
+        try:
+            with open(os.path.join(self.directory, OFFSET_FILE)) as f:
+                segment_id, position = f.read().split()
+                return int(segment_id), int(position)
+        except (FileNotFoundError, ValueError):
+            segments = self._segment_ids()
+            return (segments[0] if segments else self._active_id), 0
+
+    def commit_offset(self, offset):
+        """Atomically records how far the replayer got, then deletes consumed segments."""
+        path = os.path.join(self.directory, OFFSET_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f"{offset[0]} {offset[1]}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)  # Atomic: readers see the old or the new offset, never half
+
+        for segment_id in self._segment_ids():
+            if segment_id >= offset[0]:
+                break
+            segment_path = self._path(segment_id)
+            size = os.path.getsize(segment_path)
+            os.remove(segment_path)
+            with self._lock:
+                self._total_bytes -= size
+
+    def pending_bytes(self):
+        with self._lock:
+            return self._total_bytes
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    # --- 4. HELPERS ---
+    def _path(self, segment_id):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment_id:08d}{SEGMENT_SUFFIX}")
+
+    def _segment_ids(self):
+        ids = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                ids.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(ids)
+
+    def _truncate_torn_tail(self, segment_id):
+        path = self._path(segment_id)
+        if not os.path.exists(path):
+            return
+        size = os.path.getsize(path)
+        good, _ = self._read_segment(segment_id, 0, size, float("inf"), [])
+        if good < size:
+            print(f"⚠️ Spool: discarding {size - good} bytes of a torn record in segment {segment_id}.")
+            with open(path, "r+b") as f:
+                f.truncate(good)
+
+
+class SpoolReplayer:
+    """
+    Background thread that drains the spool into smart_sensor_data in bulk.
+
+    The offset only advances after the database COMMIT, so a crash at any point
+    replays (never loses) readings. While Postgres is down it backs off and retries.
+    A record Postgres rejects is moved to the dead-letter table, so it cannot block the spool.
+    """
+
+    def __init__(self, spool, pool, batch_size=1000, idle_wait=0.2, max_backoff=30.0, insert_sql=INSERT_SQL,
+                 rollups=True):
+        self.spool = spool
+        self.pool = pool
+        self.batch_size = batch_size
+        self.idle_wait = idle_wait
+        self.max_backoff = max_backoff
+        self.insert_sql = insert_sql
+        self.rollups = rollups
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+        self.stats = {"replayed": 0, "batches": 0, "failures": 0, "dead_lettered": 0}
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=30.0):
+        """Makes one last attempt to drain the spool, then stops the thread."""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        offset = self.spool.load_offset()
+        backoff = 1.0
+        done = 0  # Records at the start of the current batch already committed or dead-lettered
+        while True:
+            records, next_offset = self.spool.read_batch(offset, self.batch_size)
+            if not records:
+                if next_offset != offset:
+                    self.spool.commit_offset(next_offset)
+                    offset = next_offset
+                if self._stop.is_set():
+                    return
+                self._stop.wait(self.idle_wait)
+                continue
+
+            progress = []
+
+            def write(batch):
+                self._write(batch)
+                progress.append(len(batch))
+
+            def reject(record, error):
+                self._reject(record, error)
+                progress.append(1)
+
+            try:
+                isolate(write, records[done:], reject)
+            except Exception as e:
+                done += sum(progress)  # The retry starts behind the records that already committed
+                self.stats["failures"] += 1
+                print(f"❌ Spool replay failed, retrying in {backoff:.0f}s: {e}")
+                if self._stop.is_set():
+                    return  # Leave the rest on disk for the next start
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = 1.0
+            done = 0
+            self.spool.commit_offset(next_offset)
+            offset = next_offset
+            self.stats["replayed"] += len(records)
+            self.stats["batches"] += 1
+
+    def _reject(self, record, error):
+        device, payload, received_at = record
+        move_aside(self.pool, device, payload, received_at, error)
+        self.stats["dead_lettered"] += 1
+
+    def _write(self, records):
+        from psycopg2.extras import execute_values
+
+        started = time.perf_counter()
+        # JSON passes through as-is; binary readings are decoded together in one NumPy call
+        texts = jsonb_texts([payload for _, payload, _ in records])
+        rows = [(device, text, received_at) for (device, _, received_at), text in zip(records, texts)]
+        t = lap("encode", started)
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(cur, self.insert_sql, rows, template=INSERT_TEMPLATE, page_size=len(rows))
+                t = lap("insert", t)
+                if self.rollups:
+                    # Buffered during an outage: each reading goes to the minute it was received in
+                    apply_rollups_at(cur, [(device, received_at, _temp(payload))
+                                           for device, payload, received_at in records])
+                    t = lap("rollup", t)
+                # Backdated rows: a fleet snapshot taken during the outage missed them, so maintenance rebuilds it
+                invalidate_snapshots(cur, min(received_at for _, _, received_at in records))
+        lap("commit", t)
+        count_by_device(MESSAGES_STORED, records)
+
+
+def _temp(payload):
+    # Payloads were validated before they were spooled; a failure here means an older, unchecked record
+    try:
+        return decode_reading(payload).temp
+    except PayloadError:
+        return None
@@ -0,0 +1,195 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# --- SETTINGS ---
+# Industry Standard: Scale out with processes, not threads. Each worker has its own
+# Python interpreter (and its own GIL), MQTT connection and database pool.
+STATS_INTERVAL = 10.0     # Seconds between merged stats reports
+RESTART_BACKOFF = 1.0     # First delay before restarting a crashed worker...
+MAX_RESTART_BACKOFF = 30.0  # ...doubling up to this limit if it keeps crashing
+STABLE_AFTER = 60.0       # A worker that ran this long resets its backoff
+
+WORKER_INDEX_ENV = "BRIDGE_WORKER_INDEX"
+WORKER_COUNT_ENV = "BRIDGE_WORKER_COUNT"
+STATS_DIR_ENV = "BRIDGE_STATS_DIR"
+
+
+def worker_identity():
+    """Returns (index, count) for a worker process, or None when running standalone."""
+    if WORKER_INDEX_ENV not in os.environ:
+        return None
+    return int(os.environ[WORKER_INDEX_ENV]), int(os.environ[WORKER_COUNT_ENV])
+
+
+class StatsReporter:
+    """Runs inside a worker: periodically writes its counters to a JSON file for the supervisor."""
+
+    def __init__(self, collect, interval=STATS_INTERVAL / 2):
+        index, _ = worker_identity()
+        self.path = os.path.join(os.environ[STATS_DIR_ENV], f"worker-{index}.json")
+        self.collect = collect
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stats-reporter", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+    def write(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.collect(), f)
+        os.replace(tmp_path, self.path)  # The supervisor never sees a half-written file
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                print(f"❌ Stats report failed: {e}")
+
+
+class Supervisor:
+    """
+    Starts N copies of a bridge script as worker processes and keeps them alive.
+
+    Each worker learns its slot from environment variables (see worker_identity()).
+    Crashed workers are restarted with exponential backoff, and the supervisor
+    prints the sum of every worker's counters.
+    """
+
+    def __init__(self, script, workers, stats_dir, stats_interval=STATS_INTERVAL):
+        self.script = os.path.abspath(script)
+        self.workers = workers
+        self.stats_dir = stats_dir
+        self.stats_interval = stats_interval
+        os.makedirs(stats_dir, exist_ok=True)
+        for name in os.listdir(stats_dir):
+            if name.startswith("worker-"):
+                os.remove(os.path.join(stats_dir, name))  # Forget the previous run's numbers
+
+        self._procs = {}      # index -> Popen
+        self._started = {}    # index -> monotonic start time
+        self._backoff = {}    # index -> seconds to wait before the next restart
+        self._restart_at = {} # index -> monotonic time when a crashed worker may restart
+        self.restarts = 0
+        self._stopping = False
+
+    # --- 1. LIFECYCLE ---
+    def run(self):
+        print(f"🧭 Supervisor starting {self.workers} bridge workers...")
+        for index in range(self.workers):
+            self._spawn(index)
+
+        # Forward a polite stop request (e.g. from systemd or Docker) to every worker
+        signal.signal(signal.SIGTERM, lambda *_: self._request_stop())
+
+        next_report = time.monotonic() + self.stats_interval
+        try:
+            while not self._stopping:
+                self._check_workers()
+                if time.monotonic() >= next_report:
+                    self._report()
+                    next_report += self.stats_interval
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            self._stopping = True
+        self._shutdown()
+
+    def _spawn(self, index):
+        env = dict(os.environ)
+        env[WORKER_INDEX_ENV] = str(index)
+        env[WORKER_COUNT_ENV] = str(self.workers)
+        env[STATS_DIR_ENV] = self.stats_dir
+        # Own session: a terminal Ctrl+C reaches only the supervisor, which then stops each worker exactly once
+        self._procs[index] = subprocess.Popen([sys.executable, self.script], env=env,
+                                              start_new_session=(os.name == "posix"))
+        self._started[index] = time.monotonic()
+        print(f"👷 Worker {index} started (pid {self._procs[index].pid})")
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for index, proc in list(self._procs.items()):
+            if proc is None:
+                if now >= self._restart_at[index]:
+                    self.restarts += 1
+                    self._spawn(index)
+                continue
+            code = proc.poll()
+            if code is None:
+                continue
+
+            # Crash Recovery: schedule a restart, backing off if the worker keeps dying
+            ran_for = now - self._started[index]
+            backoff = RESTART_BACKOFF if ran_for >= STABLE_AFTER else min(
+                self._backoff.get(index, RESTART_BACKOFF / 2) * 2, MAX_RESTART_BACKOFF)
+            self._backoff[index] = backoff
+            self._restart_at[index] = now + backoff
+            self._procs[index] = None
+            print(f"💥 Worker {index} exited with code {code}. Restarting in {backoff:.0f}s...")
+
+    def _request_stop(self):
+        self._stopping = True
+
+    def _shutdown(self):
+        print("\n🛑 Supervisor stopping workers (they will drain their buffers)...")
+        for proc in self._procs.values():
+            if proc is not None and proc.poll() is None:
+                if os.name == "posix":
+                    proc.send_signal(signal.SIGINT)  # Workers treat this like Ctrl+C
+                else:
+                    proc.terminate()
+        for proc in self._procs.values():
+            if proc is None:
+                continue
+            try:
+                proc.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self._report(final=True)
+
+    # --- 2. MERGED STATS ---
+    def merged_stats(self):
+        """Sums every numeric counter reported by the workers."""
+        merged = {"workers_reporting": 0, "restarts": self.restarts}
+        for name in os.listdir(self.stats_dir):
+            if not (name.startswith("worker-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.stats_dir, name)) as f:
+                    stats = json.load(f)
+            except (OSError, ValueError):
+                continue
+            merged["workers_reporting"] += 1
+            _sum_into(merged, stats)
+        return merged
+
+    def _report(self, final=False):
+        label = "Final fleet stats" if final else "Fleet stats"
+        print(f"📊 {label}: {self.merged_stats()}")
+
+
+def _sum_into(total, stats):
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            _sum_into(total.setdefault(key, {}), value)
+        elif not isinstance(value, (int, float)) or isinstance(value, bool) or key.startswith("avg") or key == "ratio":
+            continue  # Averages and ratios can't be added together; the totals they came from can
+        elif key.startswith("max") or key.endswith("_max"):
+            total[key] = max(total.get(key, value), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    if "ratio" in stats and "offered" in total and "kept" in total:
+        # Compression: readings per stored row across the whole fleet, from the summed counts
+        total["ratio"] = round(total["offered"] / total["kept"], 2) if total["kept"] else 1.0
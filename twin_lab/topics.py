@@ -0,0 +1,30 @@
+import zlib
+
+# --- TOPIC CONVENTIONS ---
+# Week 6 namespaces every device: edu/iot/temp/<device> and edu/iot/commands/<device>
+DATA_TOPIC_PREFIX = "edu/iot/temp"
+COMMAND_TOPIC_PREFIX = "edu/iot/commands"
+ACK_TOPIC_PREFIX = "edu/iot/acks"  # Devices may echo a command here once they have executed it
+DATA_TOPIC_FILTER = DATA_TOPIC_PREFIX + "/+"
+ACK_TOPIC_FILTER = ACK_TOPIC_PREFIX + "/+"
+SHARED_GROUP = "bridge"
+
+
+def device_id(topic):
+    """Extracts the device namespace, e.g. 'edu/iot/temp/student01' -> 'student01'."""
+    return topic.rsplit("/", 1)[-1]
+
+
+def shared_topic(topic_filter, group=SHARED_GROUP):
+    """Wraps a filter in an MQTT shared subscription, so the broker splits messages across workers."""
+    return f"$share/{group}/{topic_filter}"
+
+
+def partition_for(device, partitions):
+    """
+    Deterministically maps a device to a worker index.
+
+    We use CRC32 instead of Python's hash(), which is randomized per process and
+    would send the same device to different workers after a restart.
+    """
+    return zlib.crc32(device.encode()) % partitions
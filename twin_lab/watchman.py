@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+
+from twin_lab.codec import PayloadError, decode_reading, loads
+from twin_lab.topics import device_id
+from twin_lab.window_stats import DEFAULT_SLOT_SECONDS, SlidingWindowStats, Summary
+
+# --- SETTINGS ---
+# Industry Standard: Seed once, then stream. The database is read a single time at
+# startup; after that every reading updates the report in memory as it arrives.
+SCHEMA = "edu_iot_digital_twin_lab"
+SEED_FETCH_SIZE = 10000  # Rows per round trip while streaming the seed out of PostgreSQL
+DEVICE_ID_LENGTH = 50    # smart_sensor_data.device_id is VARCHAR(50)
+
+# Seed and live stream must agree on identity: the generated device_id column is the payload's
+# "device_id" if it has one, else the sensor_id the bridge wrote (the topic's last level)
+SEED_SQL = f"""
+    SELECT COALESCE(device_id, 'unknown'), EXTRACT(EPOCH FROM aud_insert_ts)::float8, (payload->>'temp')::float8
+    FROM {SCHEMA}.smart_sensor_data
+    WHERE aud_insert_ts > NOW() - make_interval(secs => %s)
+      AND jsonb_typeof(payload->'temp') = 'number'
+    ORDER BY aud_insert_ts
+"""
+
+
+def stored_device_id(topic, payload):
+    """The device_id PostgreSQL generates for this message: payload "device_id", else the topic's last level."""
+    device = device_id(topic)
+    if b'"device_id"' in payload:  # Cheap check first: most sketches never send one
+        value = loads(payload).get("device_id")
+        if value is not None:
+            device = value if isinstance(value, str) else json.dumps(value)  # Like payload->>'device_id'
+    return device[:DEVICE_ID_LENGTH]
+
+
+class Watchman:
+    """
+    Per-device sliding-window statistics fed by the MQTT stream.
+
+    report(device) returns the same numbers as the SQL report (count, avg, min,
+    max, stddev) plus p50/p95/p99, without touching the database. The fleet-wide
+    report merges every device's window, which is why each piece is mergeable.
+    """
+
+    def __init__(self, broker, port, topic_filter, window_hours=24, slot_seconds=DEFAULT_SLOT_SECONDS):
+        self.broker = broker
+        self.port = port
+        self.topic_filter = topic_filter
+        self.window_seconds = window_hours * 3600
+        self.slot_seconds = slot_seconds
+        self._windows = {}
+        self._lock = threading.Lock()
+        self.stats = {"seeded": 0, "received": 0, "malformed": 0, "connected": False}
+        self._client = None
+
+    def observe(self, device, ts, temp):
+        with self._lock:
+            window = self._windows.get(device)
+            if window is None:
+                window = self._windows[device] = SlidingWindowStats(self.window_seconds, self.slot_seconds)
+            window.add(ts, temp)
+
+    # --- 1. SEED FROM THE DATABASE (once) ---
+    def seed(self, pool):
+        """Loads the current window from PostgreSQL with a server-side cursor. Returns the row count."""
+        started = time.perf_counter()
+        with pool.connection() as conn:
+            with conn.cursor(name="watchman_seed") as cur:  # Named cursor: rows stream in, memory stays flat
+                cur.itersize = SEED_FETCH_SIZE
+                cur.execute(SEED_SQL, (self.window_seconds,))
+                for sensor, ts, temp in cur:
+                    self.observe(sensor, ts, temp)
+                    self.stats["seeded"] += 1
+        print(f"🌱 Seeded {self.stats['seeded']} readings from {len(self._windows)} devices "
+              f"in {time.perf_counter() - started:.1f}s")
+        return self.stats["seeded"]
+
+    # --- 2. FOLLOW THE LIVE STREAM ---
+    def start(self):
+        import paho.mqtt.client as mqtt
+        from paho.mqtt.enums import CallbackAPIVersion
+
+        self._client = mqtt.Client(CallbackAPIVersion.VERSION2)
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_message = self._on_message
+        self._client.connect_async(self.broker, self.port, 60)
+        self._client.loop_start()
+        return self
+
+    def stop(self):
+        if self._client is not None:
+            self._client.loop_stop()
+            self._client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        client.subscribe(self.topic_filter)  # Re-subscribe after every reconnect
+        self.stats["connected"] = True
+        print(f"📡 Watchman subscribed to {self.topic_filter}")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.stats["connected"] = False
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            reading = decode_reading(msg.payload)
+        except PayloadError:
+            self.stats["malformed"] += 1
+            return
+        self.stats["received"] += 1
+        if reading.temp is not None:
+            self.observe(stored_device_id(msg.topic, msg.payload), time.time(), float(reading.temp))
+
+    # --- 3. THE INSTANT REPORT ---
+    def devices(self):
+        with self._lock:
+            return sorted(self._windows)
+
+    def report(self, device=None):
+        """{count, avg, max, min, stddev, p50, p95, p99, latest} for one device, or the whole fleet."""
+        now = time.time()
+        with self._lock:
+            if device is not None:
+                window = self._windows.get(device)
+                return window.snapshot(now).report() if window else {"count": 0}
+            fleet = Summary()
+            for window in self._windows.values():
+                fleet.merge(window.snapshot(now))
+        return fleet.report()
@@ -0,0 +1,228 @@
+import math
+from collections import deque
+
+# --- SETTINGS ---
+# Industry Standard: Streaming analytics. Update the answer as each reading arrives
+# (O(1) work) instead of re-running the whole query every minute.
+DEFAULT_WINDOW_SECONDS = 24 * 3600
+DEFAULT_SLOT_SECONDS = 60          # Readings are grouped per minute; the window slides a minute at a time
+DEFAULT_RELATIVE_ACCURACY = 0.01   # Quantiles are within 1% of the true value
+_MIN_MAGNITUDE = 1e-9              # Values closer to zero than this are counted as 0
+
+
+class QuantileSketch:
+    """
+    A mergeable quantile sketch (the idea behind DDSketch).
+
+    Values are counted in logarithmic bins, so every quantile is accurate to
+    `relative_accuracy` no matter how many readings arrive. Two sketches merge
+    by adding their bin counts, and can be subtracted the same way, which is
+    what lets a window "forget" readings that slid out of it.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+
+    def add(self, value, n=1):
+        if value > _MIN_MAGNITUDE:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.positive[key] = self.positive.get(key, 0) + n
+        elif value < -_MIN_MAGNITUDE:
+            key = math.ceil(math.log(-value) / self._log_gamma)
+            self.negative[key] = self.negative.get(key, 0) + n
+        else:
+            self.zero += n
+        self.count += n
+
+    def merge(self, other, sign=1):
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, n in theirs.items():
+                total = mine.get(key, 0) + sign * n
+                if total:
+                    mine[key] = total
+                else:
+                    del mine[key]
+        self.zero += sign * other.zero
+        self.count += sign * other.count
+
+    def subtract(self, other):
+        self.merge(other, sign=-1)
+
+    def quantile(self, q):
+        """Returns the approximate q-quantile (0 <= q <= 1), or None if the sketch is empty."""
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):  # Most negative values first
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._bin_value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._bin_value(key)
+        return self._bin_value(max(self.positive)) if self.positive else 0.0
+
+    def _bin_value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+
+class Summary:
+    """count/mean/M2 (Welford), min, max and a quantile sketch. Summaries of different devices merge."""
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.last_value = None
+        self.last_ts = None
+
+    def add(self, value):
+        # Welford's online update: numerically stable mean and variance in one pass
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        """Chan's parallel formula: combine two (count, mean, M2) triples exactly."""
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+        if other.last_ts is not None and (self.last_ts is None or other.last_ts > self.last_ts):
+            self.last_value, self.last_ts = other.last_value, other.last_ts
+        return self
+
+    def unmerge(self, other):
+        """The inverse of merge() for count/mean/M2 (min/max are handled by the window's deques)."""
+        remaining = self.count - other.count
+        if remaining <= 0:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            self.sketch = QuantileSketch(self.sketch.relative_accuracy)
+            return
+        mean = (self.count * self.mean - other.count * other.mean) / remaining
+        delta = other.mean - mean
+        self.m2 = max(self.m2 - other.m2 - delta * delta * remaining * other.count / self.count, 0.0)
+        self.mean = mean
+        self.count = remaining
+        self.sketch.subtract(other.sketch)
+
+    def report(self):
+        """The numbers analytics.py prints: avg/max/min/count/stddev and p50/p95/p99."""
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "avg": round(self.mean, 2),
+            "max": self.max,
+            "min": self.min,
+            "stddev": round(math.sqrt(self.m2 / self.count), 2),
+            "p50": round(self.sketch.quantile(0.50), 2),
+            "p95": round(self.sketch.quantile(0.95), 2),
+            "p99": round(self.sketch.quantile(0.99), 2),
+            "latest": self.last_value,
+        }
+
+
+class _Slot(Summary):
+    def __init__(self, start, relative_accuracy):
+        super().__init__(relative_accuracy)
+        self.start = start
+
+
+class SlidingWindowStats:
+    """
+    Statistics over the last `window_seconds` of one device, updated in O(1) per reading.
+
+    Readings land in the current one-minute slot. When a slot closes it is merged
+    into the window totals, and when it falls out of the window it is subtracted
+    again. Min and max come from monotonic deques of slot extremes, so the oldest
+    extreme can be dropped without rescanning anything.
+    """
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS, slot_seconds=DEFAULT_SLOT_SECONDS,
+                 relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.window_seconds = window_seconds
+        self.slot_seconds = slot_seconds
+        self.relative_accuracy = relative_accuracy
+        self._slots = deque()          # Closed slots, oldest first
+        self._current = None
+        self._totals = Summary(relative_accuracy)
+        self._max_deque = deque()      # (slot start, max), values decreasing
+        self._min_deque = deque()      # (slot start, min), values increasing
+        self.last_value = None
+        self.last_ts = None
+
+    def add(self, ts, value):
+        start = ts - ts % self.slot_seconds
+        current = self._current
+        if current is None or start > current.start:
+            if current is not None:
+                self._close(current)
+            current = self._current = _Slot(start, self.relative_accuracy)
+        # A late (out-of-order) reading is counted in the current slot: at most one slot off
+        current.add(value)
+        if self.last_ts is None or ts >= self.last_ts:
+            self.last_value, self.last_ts = value, ts
+        self._expire(ts)
+
+    def snapshot(self, now):
+        """A Summary of the window ending at `now` (the live slot included)."""
+        if self._current is not None and self._current.start + self.slot_seconds <= now - self.window_seconds:
+            self._close(self._current)  # The device went quiet: let its last slot expire too
+            self._current = None
+        self._expire(now)
+
+        summary = Summary(self.relative_accuracy)
+        summary.merge(self._totals)
+        # The totals only ever widen min/max; the deque heads hold the true window extremes
+        summary.min = self._min_deque[0][1] if self._min_deque else math.inf
+        summary.max = self._max_deque[0][1] if self._max_deque else -math.inf
+        if self._current is not None:
+            summary.merge(self._current)
+        if summary.count:
+            summary.last_value, summary.last_ts = self.last_value, self.last_ts
+        return summary
+
+    def _close(self, slot):
+        self._slots.append(slot)
+        self._totals.merge(slot)
+        while self._max_deque and self._max_deque[-1][1] <= slot.max:
+            self._max_deque.pop()
+        self._max_deque.append((slot.start, slot.max))
+        while self._min_deque and self._min_deque[-1][1] >= slot.min:
+            self._min_deque.pop()
+        self._min_deque.append((slot.start, slot.min))
+
+    def _expire(self, now):
+        horizon = now - self.window_seconds
+        while self._slots and self._slots[0].start + self.slot_seconds <= horizon:
+            slot = self._slots.popleft()
+            self._totals.unmerge(slot)
+            if self._max_deque and self._max_deque[0][0] <= slot.start:
+                self._max_deque.popleft()
+            if self._min_deque and self._min_deque[0][0] <= slot.start:
+                self._min_deque.popleft()